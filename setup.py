@@ -16,7 +16,7 @@ setuptools.setup(
     },
     package_data={'visualization.ui_files': ['gui_stylesheet.css',]},
     packages=["visualization", "visualization.signal_loading", "visualization.edf_saving",
-        "visualization.filtering", "visualization.image_saving", "visualization.models", 
+        "visualization.annotations", "visualization.filtering", "visualization.image_saving", "visualization.models", 
         "visualization.predictions", "visualization.preprocessing", "visualization.signal_stats",
         "visualization.spectrogram_window","visualization.ui_files",],
     entry_points={
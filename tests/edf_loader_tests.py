@@ -1,16 +1,30 @@
 """ Module for testing the edf loader """
 import sys
+import shutil
+import tempfile
 import numpy as np
 sys.path.append('visualization')
 import unittest
+from visualization.preprocessing import edf_loader
 from visualization.preprocessing.edf_loader import EdfLoader, _check_label
 from visualization.preprocessing.eeg_info import EegInfo
+from visualization.preprocessing.edf_decoder import EdfDecoder
+from visualization.preprocessing.edf_cache import open_cached
+from visualization.preprocessing.annotation_store import AnnotationStore, to_annotation_store
 import pyedflib
 
+def _wait_for_caches():
+    # Wait for the caches being filled in the background
+    with edf_loader._fill_lock:
+        threads = list(edf_loader._fill_threads.values())
+    for thread in threads:
+        thread.join()
+
 class TestEdfLoader(unittest.TestCase):
     def setUp(self):
         # Setup
         self.TEST_FN = "test_files/chb.edf"
+        self.DEMO_FN = "test_files/demo_edf.edf"
         self.edf_loader = EdfLoader()
 
     def test_setup(self):
@@ -95,6 +109,124 @@ class TestEdfLoader(unittest.TestCase):
             for y, yy in zip(x, xx):
                 self.assertEqual(y, yy)
 
+    def test_read_window(self):
+        # Test that windows match the whole signal and are zero padded
+        self.edf_info = self.edf_loader.load_metadata(self.DEMO_FN)
+        chns = [0, 3, 22]
+        f = pyedflib.EdfReader(self.DEMO_FN)
+        bufs_corr = [f.readSignal(chn) for chn in chns]
+        f.close()
+        buf = self.edf_loader.read_window(self.edf_info, chns, 1000, 400)
+        self.assertEqual(buf.shape, (3, 400))
+        for x, xx in zip(buf, bufs_corr):
+            np.testing.assert_array_equal(x, xx[1000:1400])
+        nsamples = self.edf_info.nsamples[0]
+        buf = self.edf_loader.read_window(self.edf_info, chns, nsamples - 100, 400)
+        self.assertEqual(buf.shape, (3, 400))
+        np.testing.assert_array_equal(buf[0, :100], bufs_corr[0][nsamples - 100:])
+        np.testing.assert_array_equal(buf[:, 100:], 0)
+        # repeated channels are only read once but returned for each row
+        buf = self.edf_loader.read_window(self.edf_info, [3, 0, 3], 0, 200)
+        np.testing.assert_array_equal(buf[0], bufs_corr[1][:200])
+        np.testing.assert_array_equal(buf[2], bufs_corr[1][:200])
+        buf = self.edf_loader.read_window(self.edf_info, chns, 0, 200, dtype=np.float32)
+        self.assertEqual(buf.dtype, np.float32)
+        np.testing.assert_array_equal(buf[2], bufs_corr[2][:200].astype(np.float32))
+
+    def test_load_buffers_parallel(self):
+        # Test that reading with several threads matches reading with one
+        self.edf_info = self.edf_loader.load_metadata(self.DEMO_FN)
+        bufs_corr = self.edf_loader.load_buffers(self.edf_info)
+        progress = []
+        bufs = self.edf_loader.load_buffers(self.edf_info, nworkers=4,
+                        progress=lambda nread, ntotal: progress.append((nread, ntotal)))
+        for x, xx in zip(bufs, bufs_corr):
+            np.testing.assert_array_equal(x, xx)
+        self.assertEqual(progress[-1], (self.edf_info.nchns, self.edf_info.nchns))
+        buf = self.edf_loader.read_window(self.edf_info, [3, 0, 3], 100, 200, nworkers=2)
+        np.testing.assert_array_equal(buf[0], bufs_corr[3][100:300])
+        np.testing.assert_array_equal(buf[1], bufs_corr[0][100:300])
+        np.testing.assert_array_equal(buf[2], bufs_corr[3][100:300])
+
+    def test_cache(self):
+        # Test that cached signals match the edf file and are memory-mapped
+        cache_dir = tempfile.mkdtemp()
+        try:
+            self.edf_info = self.edf_loader.load_metadata(self.DEMO_FN)
+            bufs_corr = self.edf_loader.load_buffers(self.edf_info)
+            self.assertIsNone(open_cached(cache_dir, self.DEMO_FN))
+            loader = EdfLoader(cache_dir=cache_dir)
+            self.edf_info = loader.load_metadata(self.DEMO_FN)
+            # the file is read directly while the cache is filled
+            bufs = loader.load_buffers(self.edf_info)
+            for x, xx in zip(bufs, bufs_corr):
+                np.testing.assert_array_equal(x, xx)
+            _wait_for_caches()
+            reader = open_cached(cache_dir, self.DEMO_FN)
+            self.assertIsInstance(reader.sigs[0], np.memmap)
+            np.testing.assert_array_equal(reader.read(2, 100, 50), bufs_corr[2][100:150])
+            reader.close()
+            buf = loader.read_window(self.edf_info, [1], 10, 20)
+            np.testing.assert_array_equal(buf[0], bufs_corr[1][10:30])
+            # the cache is kept in the dtype signals are held as
+            self.assertIsNone(open_cached(cache_dir, self.DEMO_FN, np.float32))
+            loader = EdfLoader(cache_dir=cache_dir, cache_dtype=np.float32)
+            self.edf_info = loader.load_metadata(self.DEMO_FN)
+            loader.read_window(self.edf_info, [1], 10, 20, dtype=np.float32)
+            _wait_for_caches()
+            reader = open_cached(cache_dir, self.DEMO_FN, np.float32)
+            self.assertEqual(reader.sigs[0].dtype, np.float32)
+            reader.close()
+            buf = loader.read_window(self.edf_info, [1], 10, 20, dtype=np.float32)
+            np.testing.assert_array_equal(buf[0], bufs_corr[1][10:30].astype(np.float32))
+        finally:
+            shutil.rmtree(cache_dir)
+
+    def test_edf_decoder(self):
+        # Test that the decoder matches pyedflib
+        f = pyedflib.EdfReader(self.DEMO_FN)
+        labels_corr = f.getSignalLabels()
+        nsamples_corr = f.getNSamples()
+        bufs_corr = [f.readSignal(i) for i in range(f.signals_in_file)]
+        f.close()
+        decoder = EdfDecoder(self.DEMO_FN)
+        self.assertEqual(decoder.signal_labels, labels_corr)
+        np.testing.assert_array_equal(decoder.nsamples, nsamples_corr)
+        for chn, x in enumerate(bufs_corr):
+            np.testing.assert_array_equal(decoder.read(chn, 0, len(x)), x)
+            np.testing.assert_array_equal(decoder.read(chn, 150, 333), x[150:483])
+        # channels are views into the memory-map
+        self.assertTrue(np.shares_memory(decoder.get_chn(1), decoder.records))
+        self.assertEqual(len(decoder.read(0, nsamples_corr[0] - 10, 100)), 10)
+        decoder.close()
+
+    def test_annotation_store(self):
+        # Test that annotations are kept sorted through edits
+        ann = to_annotation_store(np.array([[9, 2, 3], [-1, 1, -1],
+                                            ["spike", "spike", "eye blink"]]))
+        self.assertEqual(len(ann), 3)
+        np.testing.assert_array_equal(ann.onsets, [2, 3, 9])
+        self.assertEqual(ann.texts(), ["spike", "eye blink", "spike"])
+        self.assertEqual(ann.labels, ["spike", "eye blink"])
+        self.assertEqual(ann.get(0), (2.0, 1.0, "spike"))
+        self.assertEqual(ann.search(3, 9), (1, 2))
+        self.assertEqual(ann.search(10, 20), (3, 3))
+        self.assertEqual(ann.insert(3, -1, "spike"), 2)
+        self.assertEqual(ann.texts(), ["spike", "eye blink", "spike", "spike"])
+        self.assertEqual(ann.update(0, 20, 5, "seizure"), 3)
+        np.testing.assert_array_equal(ann.onsets, [3, 3, 9, 20])
+        ann.remove(1)
+        self.assertEqual(ann.texts(), ["eye blink", "spike", "seizure"])
+        for i in range(40):
+            ann.insert(i / 2, -1, "spike")
+        self.assertEqual(len(ann), 43)
+        self.assertTrue((np.diff(ann.onsets) >= 0).all())
+        self.assertEqual(len(ann.labels), 3)
+        self.assertFalse(ann.is_filtered())
+        self.assertEqual(len(to_annotation_store([])), 0)
+        self.assertIs(to_annotation_store(ann), ann)
+        self.assertTrue(AnnotationStore([0], [-1], ["filtered"]).is_filtered())
+
     def tearDown(self):
         pass
 
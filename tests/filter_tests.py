@@ -2,11 +2,15 @@
 import sys
 sys.path.append('visualization')
 import unittest
+import numpy as np
 from PyQt5.QtWidgets import QApplication
 from PyQt5.QtTest import QTest
 from PyQt5.QtCore import Qt
 from filtering.filter_options import FilterOptions
 from filtering.filter_info import FilterInfo
+from filtering.filter_cache import FilterCache
+from signal_loading.channel_info import ChannelInfo, _build_montage
+from plot_utils import filter_data, filter_window
 from plot import MainPage
 from plot import check_args, get_args
 from unittest.mock import patch
@@ -196,6 +200,60 @@ class TestFilter(unittest.TestCase):
         self.assertEqual(self.filter_info.lp, 30)
         self.assertEqual(self.filter_info.notch, 60)
 
+    def test_filter_cache(self):
+        # Test that windows are sliced from the filtered recording
+        ci = ChannelInfo()
+        ci.montage = _build_montage([{0: 1}, {1: 1}, {2: 1}])
+        ci.data_to_plot = np.random.randn(3, 5000)
+        ci.nsamples = 5000
+        cache = FilterCache()
+        self.assertIsNone(cache.get_window(ci, 256, self.filter_info, 0, 256))
+        cache.start(ci, 256, self.filter_info)
+        cache.wait()
+        filtered = filter_data(ci.data_to_plot, 256, self.filter_info, 0)
+        window = cache.get_window(ci, 256, self.filter_info, 4900, 256)
+        self.assertEqual(window.shape, (3, 256))
+        np.testing.assert_array_equal(window[:, :100], filtered[:, 4900:])
+        np.testing.assert_array_equal(window[:, 100:], 0)
+        # the filtered recording is kept on disk rather than in memory
+        self.assertIsInstance(cache.get_data(ci, 256, self.filter_info), np.memmap)
+        # changing the filter or the montage needs a new filtered recording
+        self.filter_info.lp = 20
+        self.assertIsNone(cache.get_window(ci, 256, self.filter_info, 0, 256))
+        self.filter_info.lp = 30
+        self.assertIsNotNone(cache.get_window(ci, 256, self.filter_info, 0, 256))
+        ci.reorder_chns([2, 1, 0])
+        self.assertIsNone(cache.get_window(ci, 256, self.filter_info, 0, 256))
+        # filtering in blocks with a margin matches filtering all at once
+        cache = FilterCache(block_size=1000)
+        cache.start(ci, 256, self.filter_info)
+        cache.wait()
+        np.testing.assert_allclose(cache.get_data(ci, 256, self.filter_info),
+                                   filtered[[2, 1, 0]], atol=1e-3)
+
+    def test_filter_data_parallel(self):
+        # Test that filtering groups of channels in parallel gives the same result
+        data = np.random.randn(7, 2560)
+        filtered = filter_data(data, 256, self.filter_info, 0, nworkers=1)
+        np.testing.assert_array_equal(filter_data(data, 256, self.filter_info, 0, nworkers=3),
+                                      filtered)
+        self.assertEqual(filter_data(data.astype(np.float32), 256, self.filter_info, 0,
+                                     nworkers=3).dtype, np.float32)
+
+    def test_filter_window(self):
+        # Test that windows filtered with a margin match the whole signal
+        ci = ChannelInfo()
+        ci.montage = _build_montage([{0: 1}, {1: 1}])
+        ci.data_to_plot = np.random.randn(2, 20 * 256)
+        ci.nsamples = 20 * 256
+        filtered = filter_data(ci.data_to_plot, 256, self.filter_info, 0)
+        for start in [0, 5 * 256, 18 * 256]:
+            window = filter_window(ci, start, 5 * 256, 256, self.filter_info, 0)
+            self.assertEqual(window.shape, (2, 5 * 256))
+            np.testing.assert_allclose(window[:, :20 * 256 - start],
+                                       filtered[:, start:start + 5 * 256], atol=1e-3)
+        np.testing.assert_array_equal(window[:, 2 * 256:], 0)
+
     def tearDown(self):
         pass
 
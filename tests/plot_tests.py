@@ -13,6 +13,7 @@ from predictions.prediction_options import PredictionOptions
 from plot import MainPage
 from plot import check_args, get_args
 from preprocessing.edf_loader import EdfLoader
+from preprocessing.annotation_store import AnnotationStore
 from plot_utils import filter_data
 
 from PyQt5.QtWidgets import QCheckBox
@@ -123,16 +124,10 @@ class TestPlot(unittest.TestCase):
         self.plot_window.load_data(name=self.TEST_FN)
 
         self.plot_window.edf_info = self.plot_window.edf_info_temp
-        self.plot_window.edf_info.annotations = np.insert(self.plot_window.edf_info.annotations,
-                                                            0, [0.0, -1.0, "filtered"], axis=1)
-        self.plot_window.edf_info.annotations = np.insert(self.plot_window.edf_info.annotations,
-                                                            1, [0.0, -1.0, "LP: 29Hz"], axis=1)
-        self.plot_window.edf_info.annotations = np.insert(self.plot_window.edf_info.annotations,
-                                                            2, [0.0, -1.0, "HP: 3Hz"], axis=1)
-        self.plot_window.edf_info.annotations = np.insert(self.plot_window.edf_info.annotations,
-                                                            3, [0.0, -1.0, "N: 5Hz"], axis=1)
-        self.plot_window.edf_info.annotations = np.insert(self.plot_window.edf_info.annotations,
-                                                            4, [0.0, -1.0, "BP: 0-0Hz"], axis=1)
+        ann = self.plot_window.edf_info.annotations
+        self.plot_window.edf_info.annotations = AnnotationStore(
+            [0.0] * 5 + list(ann.onsets), [-1.0] * 5 + list(ann.durations),
+            ["filtered", "LP: 29Hz", "HP: 3Hz", "N: 5Hz", "BP: 0-0Hz"] + ann.texts())
         self.plot_window.init_graph()
         
         self.assertEqual(self.plot_window.fi.lp, 29)
@@ -154,16 +149,10 @@ class TestPlot(unittest.TestCase):
         self.plot_window.load_data(name=self.TEST_FN)
 
         self.plot_window.edf_info = self.plot_window.edf_info_temp
-        self.plot_window.edf_info.annotations = np.insert(self.plot_window.edf_info.annotations,
-                                                            0, [0.0, -1.0, "filtered"], axis=1)
-        self.plot_window.edf_info.annotations = np.insert(self.plot_window.edf_info.annotations,
-                                                            1, [0.0, -1.0, "LP: 0Hz"], axis=1)
-        self.plot_window.edf_info.annotations = np.insert(self.plot_window.edf_info.annotations,
-                                                            2, [0.0, -1.0, "HP: 0Hz"], axis=1)
-        self.plot_window.edf_info.annotations = np.insert(self.plot_window.edf_info.annotations,
-                                                            3, [0.0, -1.0, "N: 0Hz"], axis=1)
-        self.plot_window.edf_info.annotations = np.insert(self.plot_window.edf_info.annotations,
-                                                            4, [0.0, -1.0, "BP: 3-5Hz"], axis=1)
+        ann = self.plot_window.edf_info.annotations
+        self.plot_window.edf_info.annotations = AnnotationStore(
+            [0.0] * 5 + list(ann.onsets), [-1.0] * 5 + list(ann.durations),
+            ["filtered", "LP: 0Hz", "HP: 0Hz", "N: 0Hz", "BP: 3-5Hz"] + ann.texts())
         self.plot_window.init_graph()
         
         self.assertEqual(self.plot_window.fi.lp, 30)
@@ -327,9 +316,10 @@ class TestPlot(unittest.TestCase):
         # Make sure that the correct things are in the ann scroll
         ann = self.plot_window.edf_info.annotations
         ann_scroll = []
-        for i in range(self.plot_window.ann_qlist.count()):
-            ann_scroll.append(self.plot_window.ann_qlist.item(i).text())
-        self.assertEqual(ann_scroll.sort(), ann[2,:].sort())
+        ann_model = self.plot_window.ann_model
+        for i in range(ann_model.rowCount()):
+            ann_scroll.append(ann_model.data(ann_model.index(i)))
+        self.assertEqual(ann_scroll, ann.texts())
 
         # Let's open the ann editor!
         self.plot_window.open_ann_editor()
@@ -349,7 +339,7 @@ class TestPlot(unittest.TestCase):
                             self.plot_window.count)
         self.assertFalse(self.plot_window.btn_ann_edit.isEnabled())
         self.assertFalse(self.plot_window.btn_ann_del.isEnabled())
-        self.assertEqual(len(self.plot_window.ann_qlist.selectedItems()), 0)
+        self.assertEqual(len(self.plot_window.ann_qlist.selectedIndexes()), 0)
 
     def test_click_ann_editor(self):
         # Test editing annotations
@@ -357,23 +347,23 @@ class TestPlot(unittest.TestCase):
 
         # Let's click on an annotation and make sure everthing happens properly
         item_num = 1
-        ann = self.plot_window.edf_info.annotations[:, item_num]
-        self.plot_window.ann_qlist.setCurrentRow(item_num)
+        ann = self.plot_window.edf_info.annotations.get(item_num)
+        self.plot_window.ann_qlist.setCurrentIndex(self.plot_window.ann_model.index(item_num))
 
         self.plot_window.ann_clicked()
-        self.assertEqual(self.plot_window.count, int(float(ann[0])))
+        self.assertEqual(self.plot_window.count, int(ann[0]))
 
         # Let's open the ann editor and do it again
         self.plot_window.open_ann_editor()
         self.plot_window.right_plot_10s()
 
-        self.plot_window.ann_qlist.setCurrentRow(item_num)
+        self.plot_window.ann_qlist.setCurrentIndex(self.plot_window.ann_model.index(item_num))
         self.plot_window.ann_clicked()
-        self.assertEqual(self.plot_window.count, int(float(ann[0])))
+        self.assertEqual(self.plot_window.count, int(ann[0]))
         self.assertEqual(self.plot_window.ann_txt_edit.text(), ann[2])
         self.assertEqual(self.plot_window.ann_time_edit_count.value(),
-                            int(float(ann[0])))
-        self.assertEqual(self.plot_window.ann_duration.value(), int(float(ann[1])))
+                            int(ann[0]))
+        self.assertEqual(self.plot_window.ann_duration.value(), int(ann[1]))
         self.assertTrue(self.plot_window.btn_ann_edit.isEnabled())
         self.assertTrue(self.plot_window.btn_ann_del.isEnabled())
 
@@ -401,7 +391,7 @@ class TestPlot(unittest.TestCase):
                             self.plot_window.count)
         self.assertFalse(self.plot_window.btn_ann_edit.isEnabled())
         self.assertFalse(self.plot_window.btn_ann_del.isEnabled())
-        self.assertEqual(len(self.plot_window.ann_qlist.selectedItems()), 0)
+        self.assertEqual(len(self.plot_window.ann_qlist.selectedIndexes()), 0)
 
     def test_edit_ann(self):
         # Test editing annotations
@@ -413,11 +403,8 @@ class TestPlot(unittest.TestCase):
         # Let's click on an annotation and edit it
         self.plot_window.open_ann_editor()
         item_num = 1
-        ann = []
-        for x in self.plot_window.edf_info.annotations[:, item_num]:
-            ann.append(x)
-        self.plot_window.ann_qlist.setCurrentRow(item_num)
-        self.plot_window.ann_qlist.item(item_num).setSelected(1)
+        ann = self.plot_window.edf_info.annotations.get(item_num)
+        self.plot_window.ann_qlist.setCurrentIndex(self.plot_window.ann_model.index(item_num))
         self.plot_window.ann_clicked()
 
         # Edit the annotation and update it
@@ -425,42 +412,42 @@ class TestPlot(unittest.TestCase):
         self.plot_window.ann_time_edit_count.setValue(2)
         self.plot_window.ann_duration.setValue(3)
         x = False
-        for i in range(self.plot_window.edf_info.annotations.shape[1]):
-            if (ann == self.plot_window.edf_info.annotations[:, i]).all():
+        for i in range(len(self.plot_window.edf_info.annotations)):
+            if ann == self.plot_window.edf_info.annotations.get(i):
                 x = True
         self.assertTrue(x)
         
         self.plot_window.ann_editor_update()
-        self.assertTrue((self.plot_window.edf_info.annotations[:, item_num]
-                            == [2, 3, "look at this!"]).all())
-        self.assertEqual(self.plot_window.ann_qlist.item(item_num).text(), "look at this!")
+        item_num = self.plot_window.edf_info.annotations.search(2, 3)[0]
+        self.assertEqual(self.plot_window.edf_info.annotations.get(item_num),
+                            (2, 3, "look at this!"))
+        self.assertEqual(self.plot_window.ann_model.data(
+                            self.plot_window.ann_model.index(item_num)), "look at this!")
+        self.assertEqual(self.plot_window.ann_qlist.currentIndex().row(), item_num)
         self.assertEqual(self.plot_window.ann_txt_edit.text(), "")
 
         x = False
         y = False
-        for i in range(self.plot_window.edf_info.annotations.shape[1]):
-            if (ann == self.plot_window.edf_info.annotations[:, i]).all():
+        for i in range(len(self.plot_window.edf_info.annotations)):
+            if ann == self.plot_window.edf_info.annotations.get(i):
                 x = True
-            if ([2, 3, "look at this!"] == self.plot_window.edf_info.annotations[:, i]).all():
+            if (2, 3, "look at this!") == self.plot_window.edf_info.annotations.get(i):
                 y = True
         self.assertFalse(x)
         self.assertTrue(y)
 
         # Click on an annotation and delete it
         item_num = 1
-        ann = []
-        len_ann = self.plot_window.edf_info.annotations.shape[1]
-        for x in self.plot_window.edf_info.annotations[:, item_num]:
-            ann.append(x)
-        self.plot_window.ann_qlist.setCurrentRow(item_num)
-        self.plot_window.ann_qlist.item(item_num).setSelected(1)
+        len_ann = len(self.plot_window.edf_info.annotations)
+        ann = self.plot_window.edf_info.annotations.get(item_num)
+        self.plot_window.ann_qlist.setCurrentIndex(self.plot_window.ann_model.index(item_num))
         self.plot_window.ann_clicked()
 
         self.plot_window.ann_editor_del()
-        self.assertEqual(self.plot_window.edf_info.annotations.shape[1], len_ann - 1)
+        self.assertEqual(len(self.plot_window.edf_info.annotations), len_ann - 1)
         x = False
-        for i in range(self.plot_window.edf_info.annotations.shape[1]):
-            if (ann == self.plot_window.edf_info.annotations[:, i]).all():
+        for i in range(len(self.plot_window.edf_info.annotations)):
+            if ann == self.plot_window.edf_info.annotations.get(i):
                 x = True
         self.assertFalse(x)
         self.assertFalse(self.plot_window.btn_ann_edit.isEnabled())
@@ -468,20 +455,18 @@ class TestPlot(unittest.TestCase):
         self.assertEqual(self.plot_window.ann_txt_edit.text(), "")
 
         # Create an annotation
-        ann = []
-        len_ann = self.plot_window.edf_info.annotations.shape[1]
-        for x in self.plot_window.edf_info.annotations[:, item_num]:
-            ann.append(x)
+        len_ann = len(self.plot_window.edf_info.annotations)
+        ann = self.plot_window.edf_info.annotations.get(item_num)
 
         self.plot_window.ann_txt_edit.setText("look here!")
         self.plot_window.ann_time_edit_count.setValue(4)
         self.plot_window.ann_duration.setValue(-1)
         self.plot_window.ann_editor_create()
-        self.assertEqual(self.plot_window.edf_info.annotations.shape[1], len_ann + 1)
+        self.assertEqual(len(self.plot_window.edf_info.annotations), len_ann + 1)
         x = False
         loc = -1
-        for i in range(self.plot_window.edf_info.annotations.shape[1]):
-            if ([4, -1, "look here!"] == self.plot_window.edf_info.annotations[:, i]).all():
+        for i in range(len(self.plot_window.edf_info.annotations)):
+            if (4, -1, "look here!") == self.plot_window.edf_info.annotations.get(i):
                 x = True
                 loc = i
         self.assertTrue(x)
@@ -546,7 +531,7 @@ class TestPlot(unittest.TestCase):
         self.assertEqual(file_duration, self.plot_window.max_time)
         annotations = f.readAnnotations()
         for i in range(3):
-            for x, y in zip(self.plot_window.edf_info.annotations[i], annotations[i]):
+            for x, y in zip(self.plot_window.edf_info.annotations.to_array()[i], annotations[i]):
                 if i != 2:
                     self.assertEqual(float(x), float(y))
         sig0 = f.readSignal(0)
@@ -597,7 +582,7 @@ class TestPlot(unittest.TestCase):
                 if j < 5:
                     ann0 = ann_filt[i][j]
                 else:
-                    ann0 = self.plot_window.edf_info.annotations[i][j - 5]
+                    ann0 = self.plot_window.edf_info.annotations.get(j - 5)[i]
                 if i != 2:
                     self.assertEqual(float(annotations[i][j]), float(ann0))
                 else:
@@ -9,6 +9,9 @@ from filtering.filter_info import FilterInfo
 import pyedflib
 import numpy as np
 import preprocessing.dsp as dsp
+from preprocessing.annotation_store import AnnotationStore
+from preprocessing.min_max_pyramid import (build_min_max_pyramid, build_min_max_pyramid_blocks,
+                                           get_pyramid_window)
 
 app = QApplication([])
 class TestPlotUtils(unittest.TestCase):
@@ -26,9 +29,9 @@ class TestPlotUtils(unittest.TestCase):
         self.assertEqual(len(ret), 3)
         self.assertEqual(len(idx_w_ann), 10)
         for x, y in zip(ret[0], self.EDF_INFO.annotations[:,0]):
-            self.assertEqual(x, y)
+            self.assertEqual(x, type(x)(y))
         for x, y in zip(ret[1], self.EDF_INFO.annotations[:,1]):
-            self.assertEqual(x, y)
+            self.assertEqual(x, type(x)(y))
         ret, idx_w_ann = check_annotations(532, 10, self.EDF_INFO)
         self.assertEqual(len(ret), 0)
         self.assertEqual(len(idx_w_ann), 10)
@@ -48,6 +51,25 @@ class TestPlotUtils(unittest.TestCase):
             else:
                 self.assertEqual(idx_w_ann[i], 1)
 
+    def test_get_annotation_labels(self):
+        # Test that annotations in the same second share a raised label
+        test_edf = self.EDF_INFO
+        test_edf.annotations = AnnotationStore(
+            [2, 3.5, 3, 9, 12], [-1] * 5, ["a", "b", "c", "d", "e"])
+        cache = {}
+        secs, texts, raised = get_annotation_labels(0, 10, test_edf, cache)
+        np.testing.assert_array_equal(secs, [2, 3, 9])
+        self.assertEqual(texts, ["a", "c\nb", "d"])
+        np.testing.assert_array_equal(raised, [False, True, False])
+        self.assertIs(get_annotation_labels(0, 10, test_edf, cache), cache["labels"])
+        test_edf.annotations.insert(8, -1, "f")
+        secs, texts, raised = get_annotation_labels(0, 10, test_edf, cache)
+        np.testing.assert_array_equal(secs, [2, 3, 8, 9])
+        np.testing.assert_array_equal(raised, [False, True, False, True])
+        secs, texts, raised = get_annotation_labels(3, 10, test_edf)
+        np.testing.assert_array_equal(secs, [0, 5, 6, 9])
+        self.assertEqual(texts, ["c\nb", "f", "d", "e"])
+
     # 1. Filter data
     def test_filter_data(self):
         # Test filtering with different parameters
@@ -80,6 +102,121 @@ class TestPlotUtils(unittest.TestCase):
         for x, y in zip(ret[0, :], filt_bufs[0, :]):
             self.assertTrue(abs(x - y) < thresh)
 
+        # Test that the filters are only designed once
+        bank = dsp.get_filter_bank(self.EDF_INFO.fs, 20, 0, 0, 10, 30)
+        self.assertIs(bank, dsp.get_filter_bank(self.EDF_INFO.fs, 20, 0, 0, 10, 30))
+        self.assertEqual(len(bank.stages), 2)
+        np.testing.assert_allclose(bank.apply(test_data), filt_bufs, atol=thresh)
+
+        # Test that float32 data stays float32
+        ret = filter_data(test_data.astype(np.float32), self.EDF_INFO.fs, self.filter_info)
+        self.assertEqual(ret.dtype, np.float32)
+        np.testing.assert_allclose(ret[0], filt_bufs[0], atol=1e-3)
+
+    # 1b. Decimate for drawing
+    def test_decimate_min_max(self):
+        # Test that peaks are kept when decimating
+        data = np.zeros((2, 10000))
+        data[0, 1234] = 5
+        data[1, 9999] = -3
+        x, y = decimate_min_max(data, 100)
+        self.assertEqual(y.shape, (2, 100))
+        self.assertEqual(len(x), 100)
+        self.assertEqual(np.max(y[0]), 5)
+        self.assertEqual(np.min(y[1]), -3)
+        self.assertTrue(abs(x[np.argmax(y[0])] - 1234) <= 100)
+        # short signals are not changed
+        x, y = decimate_min_max(data[:, :50], 100)
+        np.testing.assert_array_equal(y, data[:, :50])
+        np.testing.assert_array_equal(x, np.arange(50))
+
+    # 1a. Prepare data to plot
+    def test_prep_plot_data(self):
+        # Test that signals are clipped to nstd standard deviations
+        data = np.random.randn(4, 1000).astype(np.float32)
+        data[1, 10] = 100
+        lim = 3 * np.std(data)
+        out = prep_plot_data(data, 3)
+        self.assertEqual(out.dtype, np.float32)
+        np.testing.assert_array_equal(out, np.clip(data, -lim, lim))
+        self.assertEqual(data[1, 10], 100)
+        # Test that the output buffer is reused
+        self.assertIs(prep_plot_data(data * 2, 3, out), out)
+        np.testing.assert_allclose(out, 2 * np.clip(data, -lim, lim), rtol=1e-6)
+        # Test scaling each signal
+        scale = np.array([1, 0, 2, 1])
+        out = prep_plot_data(data, 100, scale=scale)
+        np.testing.assert_allclose(out, data * scale[:, np.newaxis])
+
+    # 1c. Min/max pyramid
+    def test_min_max_pyramid(self):
+        # Test each level against the min/max of the groups of samples
+        data = np.random.randn(3, 1001)
+        pyramid = build_min_max_pyramid(data)
+        self.assertEqual(len(pyramid), 10)
+        for k, (mins, maxs) in enumerate(pyramid):
+            group_size = 2 ** (k + 1)
+            self.assertEqual(mins.shape, (3, int(np.ceil(1001 / group_size))))
+            np.testing.assert_array_equal(mins[:, 0], np.min(
+                data[:, :group_size], axis=1))
+            np.testing.assert_array_equal(maxs[:, -1], np.max(
+                data[:, (mins.shape[1] - 1) * group_size:], axis=1))
+        np.testing.assert_array_equal(pyramid[-1][0][:, 0], np.min(data, axis=1))
+        # Test that building block by block gives the same levels
+        for block_size in [2, 16, 256, 2048]:
+            blocks = build_min_max_pyramid_blocks(lambda start, n: data[:, start:start + n],
+                                                  1001, 2, block_size)
+            self.assertEqual(len(blocks), len(pyramid))
+            for (mins, maxs), (block_mins, block_maxs) in zip(pyramid, blocks):
+                np.testing.assert_array_equal(mins, block_mins)
+                np.testing.assert_array_equal(maxs, block_maxs)
+        # Test starting at larger groups
+        coarse = build_min_max_pyramid(data, 64)
+        self.assertEqual(len(coarse), 5)
+        for k, (mins, maxs) in enumerate(coarse):
+            np.testing.assert_array_equal(mins, pyramid[k + 5][0])
+            np.testing.assert_array_equal(maxs, pyramid[k + 5][1])
+        for block_size in [64, 256, 2048]:
+            blocks = build_min_max_pyramid_blocks(lambda start, n: data[:, start:start + n],
+                                                  1001, 64, block_size)
+            self.assertEqual(len(blocks), len(coarse))
+            for (mins, maxs), (block_mins, block_maxs) in zip(coarse, blocks):
+                np.testing.assert_array_equal(mins, block_mins)
+                np.testing.assert_array_equal(maxs, block_maxs)
+        self.assertIsNone(build_min_max_pyramid_blocks(lambda start, n: data[:, start:start + n],
+                                                       1001, 2, 16, stop=lambda: True))
+        # Test that a window drawn from the pyramid keeps the peaks
+        data = np.zeros((2, 100000))
+        data[0, 51234] = 5
+        data[1, 99999] = -3
+        x, y = get_pyramid_window(build_min_max_pyramid(data), 50000, 50000, 100)
+        self.assertEqual(y.shape[1], len(x))
+        self.assertTrue(50 <= y.shape[1] // 2 < 100)
+        self.assertEqual(np.max(y[0]), 5)
+        self.assertEqual(np.min(y[1]), -3)
+        self.assertTrue(abs(x[np.argmax(y[0])] - 1234) <= 1000)
+        x, y = get_pyramid_window(build_min_max_pyramid(data, 64), 50000, 50000, 100, 64)
+        self.assertTrue(50 <= y.shape[1] // 2 < 100)
+        self.assertEqual(np.max(y[0]), 5)
+        self.assertTrue(abs(x[np.argmax(y[0])] - 1234) <= 1000)
+        # short windows are not drawn from the pyramid
+        self.assertIsNone(get_pyramid_window(build_min_max_pyramid(data), 0, 50, 100))
+
+    # 1d. Window sizes
+    def test_window_size_text(self):
+        for ws in [1, 10, 45, 60, 300, 3600, 7200]:
+            self.assertEqual(get_window_size(get_window_size_text(ws)), ws)
+        self.assertEqual(get_window_size_text(10), "10s")
+        self.assertEqual(get_window_size_text(300), "5min")
+        self.assertEqual(get_window_size_text(3600), "1h")
+
+    # 1e. Data record duration
+    def test_record_duration(self):
+        # Test that each signal has a whole number of samples in a record
+        self.assertEqual(get_record_duration([256, 1]), 1)
+        self.assertEqual(get_record_duration([256, 256 / 3]), 3)
+        self.assertEqual(get_record_duration([200, 0.5, 256 / 3]), 6)
+
     # 2. Convert from count
     def test_convert_from_count(self):
         # Test convert from count
@@ -7,9 +7,11 @@ from PyQt5.QtTest import QTest
 from PyQt5.QtCore import Qt
 from visualization.predictions.prediction_options import PredictionOptions
 from visualization.predictions.prediction_info import PredictionInfo
+from visualization.predictions.prediction_overlay import PredictionOverlay
 from visualization.plot import MainPage
 from visualization.plot import check_args, get_args
 
+import pyqtgraph as pg
 import torch
 import numpy as np
 import datetime
@@ -466,6 +468,85 @@ class TestPrediction(unittest.TestCase):
         self.assertEqual(chns, [])
         self.assertEqual(class_vals, [0, 0, 0, 0, 0])
 
+    def test_pred_index(self):
+        # Test that the prediction index is only computed once per threshold
+        preds_info = PredictionInfo()
+        preds_info.preds_to_plot = np.array([0.1, 0.9, 0.8, 0.2, 0.7, 0.6])
+        preds_info.pred_width = 256
+        starts, ends, _, _ = preds_info.compute_starts_ends_chns(0.5, 1, 3, 256, 18)
+        index = preds_info._pred_index
+        self.assertEqual(starts, [256, 512])
+        self.assertEqual(ends, [512, 768])
+        # the window starts and ends in the middle of predictions
+        starts, ends, _, _ = preds_info.compute_starts_ends_chns(0.5, 1.5, 3, 256, 18)
+        self.assertIs(preds_info._pred_index, index)
+        self.assertEqual(starts, [384, 512, 1024])
+        self.assertEqual(ends, [512, 768, 1152])
+        starts, ends, _, _ = preds_info.compute_starts_ends_chns(0.65, 0, 6, 256, 18)
+        self.assertIsNot(preds_info._pred_index, index)
+        self.assertEqual(starts, [256, 512, 1024])
+
+    def test_pred_segments(self):
+        # Test that consecutive predictions are merged once per threshold
+        preds_info = PredictionInfo()
+        preds_info.preds_to_plot = np.array([0.1, 0.9, 0.8, 0.2, 0.7, 0.6])
+        preds_info.pred_width = 256
+        starts, ends, _ = preds_info.get_segments(0.5, 18)
+        np.testing.assert_array_equal(starts, [256, 1024])
+        np.testing.assert_array_equal(ends, [768, 1536])
+        self.assertIs(preds_info.get_segments(0.5, 18)[0], starts)
+        starts, ends, _, _ = preds_info.get_segments_in_window(0.5, 1.5, 3, 256, 18)
+        self.assertEqual(starts, [384, 1024])
+        self.assertEqual(ends, [768, 1152])
+        self.assertEqual(preds_info.get_next_segment(0.5, 18, 512), 1024)
+        self.assertEqual(preds_info.get_next_segment(0.5, 18, 1025), -1)
+        np.testing.assert_array_equal(preds_info.get_segments(0.65, 18)[0], [256, 1024])
+        np.testing.assert_array_equal(preds_info.get_segments(0.65, 18)[1], [768, 1280])
+        # Test that segments by channel are split where the channels change
+        preds_info.pred_by_chn = 1
+        preds_info.preds_to_plot = np.array([[0.9, 0.1], [0.9, 0.1], [0.9, 0.9], [0.1, 0.1]])
+        starts, ends, vals = preds_info.get_segments(0.5, 2)
+        np.testing.assert_array_equal(starts, [0, 512])
+        np.testing.assert_array_equal(ends, [512, 768])
+        np.testing.assert_array_equal(vals, [[False, True], [True, True]])
+        # Test that multi-class segments keep the class
+        preds_info.pred_by_chn = 0
+        preds_info.multi_class = 1
+        preds_info.preds_to_plot = np.array([[0.9, 0.1], [0.8, 0.2], [0.1, 0.9], [0.9, 0.1]])
+        starts, ends, vals = preds_info.get_segments(0.5, 2)
+        np.testing.assert_array_equal(starts, [0, 512, 768])
+        np.testing.assert_array_equal(vals, [0, 1, 0])
+        self.assertEqual(preds_info.get_next_segment(0.5, 2, 0), 512)
+
+    def test_prediction_overlay(self):
+        # Test that each channel gets one item however many predictions there are
+        plot = pg.PlotItem()
+        overlay = PredictionOverlay(plot)
+        x = np.arange(2560)
+        y = np.zeros((3, 2560))
+        starts = np.arange(0, 2560, 256)
+        vals = np.full((10, 3), -1)
+        vals[::2, 0] = 0
+        vals[1:4, 2] = 0
+        overlay.set_preds(starts, starts + 256, vals, {0: (38, 233, 254, 50)},
+                          x, y, 100, ["r", "g", "b"])
+        self.assertEqual(len(overlay.boxes), 2)
+        self.assertEqual(len(overlay.lines), 3)
+        n_items = len(plot.items)
+        self.assertEqual(overlay.boxes[(0, (38, 233, 254, 50))].path().elementCount(), 5 * 5)
+        line_x, line_y = overlay.lines[2].getData()
+        np.testing.assert_array_equal(np.isfinite(line_y), (x >= 256) & (x < 1024))
+        np.testing.assert_array_equal(line_y[256:1024], 300)
+        self.assertEqual(overlay.lines[1].getData()[0], None)
+        # Items are updated in place for the next window
+        vals[:, 1] = 0
+        overlay.set_preds(starts, starts + 256, vals, {0: (38, 233, 254, 50)},
+                          x, y, 100, ["r", "g", "b"])
+        self.assertEqual(len(plot.items), n_items + 1)
+        overlay.set_preds([], [], [], {}, x, y, 100, ["r", "g", "b"])
+        self.assertTrue(overlay.boxes[(0, (38, 233, 254, 50))].path().isEmpty())
+        self.assertEqual(len(plot.items), n_items + 1)
+
     def test_invalid_preds_file(self):
         self.assertRaises(Exception, self.preds_info.set_preds, "test.pt", 1, 256, 18)
 
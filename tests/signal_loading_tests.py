@@ -1,15 +1,22 @@
 """ Module for testing the filter options window """
 import sys
 sys.path.append('visualization')
+import os
+import shutil
+import tempfile
 import unittest
+import numpy as np
+import pyedflib
 from PyQt5.QtWidgets import QApplication
 from PyQt5.QtTest import QTest
 from PyQt5.QtCore import Qt
 from visualization.signal_loading.channel_options import ChannelOptions
 from visualization.signal_loading.channel_info import ChannelInfo, _check_label, convert_txt_chn_names
+from visualization.signal_loading.window_prefetcher import WindowPrefetcher
 from visualization.plot import MainPage
 from visualization.plot import check_args, get_args
 from preprocessing.edf_loader import EdfLoader
+from preprocessing.min_max_pyramid import build_min_max_pyramid
 
 from PyQt5.QtWidgets import QCheckBox
 
@@ -371,6 +378,129 @@ class TestChannelLoading(unittest.TestCase):
         for c, l in zip(self.channel_info.colors, self.channel_info.labels_to_plot[1:]):
             self.assertEqual(c, self.channel_info._get_color(l))
 
+    def test_prepare_to_plot_montage(self):
+        # Test that the montage matrix gives the plotted signals
+        labelsBIP1020 = ["CZ-PZ","FZ-CZ","P4-O2","C4-P4","F4-C4","FP2-F4",
+                              "P3-O1","C3-P3","F3-C3","FP1-F3","P8-O2","T8-P8",
+                              "F8-T8","FP2-F8","P7-O1","T7-P7","F7-T7","FP1-F7"]
+        labelsAR1020 = ["O2","O1","PZ","CZ","FZ","P8","P7","T8","T7","F8",
+                             "F7","P4","P3","C4","C3","F4","F3","FP2","FP1"]
+        self.channel_info.converted_chn_names = [k for k in labelsAR1020]
+        self.channel_info.prepare_to_plot(list(range(0,len(labelsAR1020))), self.parent, 1,
+                            plot_bip_from_ar = 1, txt_file_name = "")
+        montage = self.channel_info.montage.toarray()
+        self.assertEqual(montage.shape, (len(labelsBIP1020), len(labelsAR1020)))
+        for k, l in enumerate(labelsBIP1020):
+            self.assertEqual(montage[k, labelsAR1020.index(l.split("-")[0])], 1)
+            self.assertEqual(montage[k, labelsAR1020.index(l.split("-")[1])], -1)
+            self.assertEqual(np.count_nonzero(montage[k]), 2)
+
+        # Common average reference
+        self.channel_info.prepare_to_plot([0, 2, 5, 8], self.parent, 0,
+                            plot_bip_from_ar = 0, txt_file_name = "", common_avg = 1)
+        montage = self.channel_info.montage.toarray()
+        self.assertEqual(self.channel_info.labels_to_plot, ["Notes"] + ["O2", "PZ", "P8", "T7"])
+        np.testing.assert_allclose(montage[:, [0, 2, 5, 8]], np.eye(4) - 0.25)
+        np.testing.assert_allclose(np.sum(montage, axis=1), 0, atol=1e-12)
+
+        # Only referential electrodes are averaged
+        self.channel_info.converted_chn_names = labelsAR1020 + ["FP1-F7", "EKG"]
+        self.channel_info.prepare_to_plot([0, 2, 19, 20], self.parent, 5,
+                            plot_bip_from_ar = 0, txt_file_name = "", common_avg = 1)
+        montage = self.channel_info.montage.toarray()
+        rows = [self.channel_info.labels_to_plot[1:].index(l) for l in ["O2", "PZ"]]
+        np.testing.assert_allclose(montage[np.ix_(rows, [0, 2])], np.eye(2) - 0.5)
+        for l, chn in [("FP1-F7", 19), ("EKG", 20)]:
+            row = montage[self.channel_info.labels_to_plot[1:].index(l)]
+            self.assertEqual(row[chn], 1)
+            self.assertEqual(np.count_nonzero(row), 1)
+        self.channel_info.converted_chn_names = [k for k in labelsAR1020]
+        self.channel_info.prepare_to_plot([0, 2, 5, 8], self.parent, 0,
+                            plot_bip_from_ar = 0, txt_file_name = "", common_avg = 1)
+
+        # Reordering the channels reorders the montage
+        self.channel_info.reorder_chns([3, 2, 1, 0])
+        np.testing.assert_allclose(self.channel_info.montage.toarray()[:, [0, 2, 5, 8]],
+                                   np.eye(4)[::-1] - 0.25)
+
+    def test_multi_rate_signals(self):
+        # Test that signals are kept at their own rate and resampled to plot
+        fn = os.path.join(tempfile.mkdtemp(), "multi_rate.edf")
+        sigs = [np.sin(np.arange(2560) / 10.0) * 50, np.arange(2560) / 100.0,
+                np.arange(10) * 1.0]
+        f = pyedflib.EdfWriter(fn, 3)
+        for i, (label, fs) in enumerate(zip(["FP1", "F7", "SPO2"], [256, 256, 1])):
+            f.setLabel(i, label)
+            f.setSamplefrequency(i, fs)
+            f.setPhysicalMaximum(i, 100)
+            f.setPhysicalMinimum(i, -100)
+        f.writeSamples(sigs)
+        f.close()
+        edf_info = EdfLoader().load_metadata(fn)
+        self.assertEqual(edf_info.chn_fs, [256, 256, 1])
+        self.parent.edf_info_temp = edf_info
+        edf_info.fs = 256
+        self.channel_info.edf_info = edf_info
+        self.channel_info.dtype = np.float64
+        self.channel_info.converted_chn_names = ["FP1", "F7", "SPO2"]
+        self.channel_info.prepare_to_plot([0, 1, 2], self.parent, 5)
+        self.assertEqual(self.channel_info.nsamples, 2560)
+        window = self.channel_info.get_window(256, 512)
+        self.channel_info.data_to_plot = None
+        self.assertFalse(self.channel_info.is_loaded())
+        progress = []
+        self.channel_info.load(2, lambda nread, ntotal: progress.append((nread, ntotal)))
+        self.assertEqual(progress[-1], (3, 3))
+        data = self.channel_info.data_to_plot
+        rows = {l: i for i, l in enumerate(self.channel_info.labels_to_plot[1:])}
+        self.assertEqual(self.channel_info.row_fs[rows["SPO2"]], 1)
+        self.assertEqual(self.channel_info.row_fs[rows["FP1"]], 256)
+        self.assertEqual(len(self.channel_info._data_to_plot[rows["SPO2"]]), 10)
+        self.assertEqual(data.shape, (3, 2560))
+        self.assertIs(self.channel_info.data_to_plot, data) # only resampled once
+        np.testing.assert_array_equal(self.channel_info.get_window(256, 512), window)
+        np.testing.assert_allclose(data[rows["SPO2"]], np.repeat(sigs[2], 256), atol=0.01)
+        np.testing.assert_allclose(data[rows["F7"]], sigs[1], atol=0.01)
+        # The pyramid is not built for short windows
+        self.assertIsNone(self.channel_info.get_pyramid_window(0, 512, 100))
+        self.assertIsNone(self.channel_info.pyramid)
+        # The pyramid is built from windows of the plotted signals
+        self.channel_info.build_pyramid()
+        pyramid = build_min_max_pyramid(data, self.channel_info.pyramid_group)
+        for (mins, maxs), (data_mins, data_maxs) in zip(self.channel_info.pyramid, pyramid):
+            np.testing.assert_array_equal(mins, data_mins)
+            np.testing.assert_array_equal(maxs, data_maxs)
+        self.assertEqual(len(self.channel_info.pyramid), len(pyramid))
+        shutil.rmtree(os.path.dirname(fn))
+
+    def test_window_prefetcher(self):
+        # Test that windows are computed in the background and kept
+        prefetcher = WindowPrefetcher(nwindows=1, size=3)
+        computed = []
+        def compute(key):
+            computed.append(key)
+            return np.full((2, 10), key[0], dtype=np.float32)
+        self.assertIsNone(prefetcher.get_window(self.channel_info, (0, 10, None)))
+        prefetcher.prefetch(self.channel_info, [(k, 10, None) for k in range(4)], compute)
+        prefetcher.executor.submit(lambda: None).result() # wait for the thread
+        self.assertEqual(computed, [(k, 10, None) for k in range(4)])
+        # only the 3 most recently used windows are kept
+        self.assertIsNone(prefetcher.get_window(self.channel_info, (0, 10, None)))
+        np.testing.assert_array_equal(
+            prefetcher.get_window(self.channel_info, (3, 10, None)), 3)
+        prefetcher.prefetch(self.channel_info, [(3, 10, None)], compute)
+        prefetcher.executor.submit(lambda: None).result()
+        self.assertEqual(len(computed), 4)
+        # windows that do not fit in max_bytes are not prefetched
+        prefetcher.max_bytes = 2 * 80
+        prefetcher.prefetch(self.channel_info, [(4, 10, None), (5, 10, None)],
+                            compute, 80)
+        prefetcher.executor.submit(lambda: None).result()
+        self.assertEqual(len(computed), 4)
+        # windows are dropped when the montage changes
+        self.channel_info.reorder_chns([])
+        self.assertIsNone(prefetcher.get_window(self.channel_info, (3, 10, None)))
+
     def test_loading_file_with_predictions(self):
         # Test that loading predictions in a file works
         loader = EdfLoader()
@@ -2,11 +2,14 @@
 import sys
 sys.path.append('visualization')
 import unittest
+import numpy as np
+from scipy import signal
 from PyQt5.QtWidgets import QApplication
 from PyQt5.QtTest import QTest
 from PyQt5.QtCore import Qt
 from visualization.signal_stats.signalStats_options import SignalStatsOptions
 from visualization.signal_stats.signalStats_info import SignalStatsInfo
+from visualization.signal_stats.signalStats_index import SignalStatsIndex
 from visualization.plot import MainPage
 from visualization.plot import check_args, get_args
 
@@ -55,73 +58,76 @@ class TestSignalStats(unittest.TestCase):
         self.assertEqual(list(fs_band_lbls.keys()).sort(), new_keys.sort())
 
     def test_get_power_band_from_sig(self):
-        # Test that power bands are computed correctly
-        diff_thresh = 0.0000001 # the tolerance for error
-        data = self.parent.ci.data_to_plot[0,:]
-        lp = 0
-        hp = 0
-        no_filter_dict = {'delta': 5750580.188063894,
-                          'theta': 1623394.1100579707,
-                          'alpha': 779765.3023329942,
-                          'beta': 69927.60270696628,
-                          'gamma': 30319.31786894721,
-                          'test0': 3272411.217772229}
-        fs_band_dict = self.signalstats_info.get_power(data, 0, 512, hp, lp, self.parent.edf_info.fs)
-        for k in no_filter_dict.keys():
-            self.assertTrue(abs(no_filter_dict[k] - fs_band_dict[k]) < diff_thresh)
-        
+        # Test that a sine of amplitude A has a band power of A^2 / 2 in
+        # the band of its frequency and none in the others
+        fs = 256
+        t = np.arange(20 * fs) / fs
+        data = 10 * np.sin(2 * np.pi * 10 * t) + 4 * np.sin(2 * np.pi * 20 * t)
+        n = len(data)
+
+        # no filter
+        fs_band_dict = self.signalstats_info.get_power(data, 0, n, 0, 0, fs)
+        self.assertAlmostEqual(fs_band_dict['alpha'], 10 ** 2 / 2, places=3)
+        self.assertAlmostEqual(fs_band_dict['beta'], 4 ** 2 / 2, places=3)
+        for k in ['delta', 'theta', 'gamma', 'test0']:
+            self.assertAlmostEqual(fs_band_dict[k], 0, places=3)
+
         # lp filter on
-        lp_filter_dict = {'delta': 5750580.188063894,
-                          'theta': 1623394.1100579707,
-                          'alpha': 779765.3023329942,
-                          'beta': 69927.60270696628,
-                          'gamma': 15338.107466774643,
-                          'test0': 3272411.217772229}
-        lp = 31
-        hp = 0
-        fs_band_dict = self.signalstats_info.get_power(data, 0, 512, hp, lp, self.parent.edf_info.fs)
-        for k in no_filter_dict.keys():
-            self.assertTrue(abs(lp_filter_dict[k] - fs_band_dict[k]) < diff_thresh)
-
-        # lp filter on part2
-        lp_filter_dict = {'delta': 5750580.188063894,
-                          'theta': 1623394.1100579707,
-                          'alpha': 779765.3023329942,
-                          'beta': 69927.60270696628,
-                          'gamma': 0,
-                          'test0': 3272411.217772229}
-        lp = 30
-        hp = 0
-        fs_band_dict = self.signalstats_info.get_power(data, 0, 512, hp, lp, self.parent.edf_info.fs)
-        for k in no_filter_dict.keys():
-            self.assertTrue(abs(lp_filter_dict[k] - fs_band_dict[k]) < diff_thresh)
-        
+        fs_band_dict = self.signalstats_info.get_power(data, 0, n, 0, 16, fs)
+        self.assertAlmostEqual(fs_band_dict['alpha'], 10 ** 2 / 2, places=3)
+        self.assertAlmostEqual(fs_band_dict['beta'], 0, places=3)
+        self.assertEqual(fs_band_dict['gamma'], 0)
+
         # hp filter on
-        hp_filter_dict = {'delta': 0,
-                          'theta': 1256103.6541762687,
-                          'alpha': 779765.3023329942,
-                          'beta': 69927.60270696628,
-                          'gamma': 30319.31786894721,
-                          'test0': 0}
-        lp = 0
-        hp = 6
-        fs_band_dict = self.signalstats_info.get_power(data, 0, 512, hp, lp, self.parent.edf_info.fs)
-        for k in no_filter_dict.keys():
-            self.assertTrue(abs(hp_filter_dict[k] - fs_band_dict[k]) < diff_thresh)
-        
+        fs_band_dict = self.signalstats_info.get_power(data, 0, n, 12, 0, fs)
+        self.assertEqual(fs_band_dict['delta'], 0)
+        self.assertEqual(fs_band_dict['test0'], 0)
+        self.assertAlmostEqual(fs_band_dict['alpha'], 0, places=3)
+        self.assertAlmostEqual(fs_band_dict['beta'], 4 ** 2 / 2, places=3)
 
         # bp filter on
-        bp_filter_dict = {'delta': 0,
-                          'theta': 1623394.1100579707,
-                          'alpha': 480015.56167355896,
-                          'beta': 0,
-                          'gamma': 0,
-                          'test0': 615836.7259411447}
-        lp = 10
-        hp = 4
-        fs_band_dict = self.signalstats_info.get_power(data, 0, 512, hp, lp, self.parent.edf_info.fs)
-        for k in no_filter_dict.keys():
-            self.assertTrue(abs(bp_filter_dict[k] - fs_band_dict[k]) < diff_thresh)
+        fs_band_dict = self.signalstats_info.get_power(data, 0, n, 4, 12, fs)
+        for k in ['delta', 'beta', 'gamma']:
+            self.assertEqual(fs_band_dict[k], 0)
+        self.assertAlmostEqual(fs_band_dict['alpha'], 10 ** 2 / 2, places=3)
+
+    def test_get_psd(self):
+        # Test that the psd of long selections is computed in chunks
+        fs = self.parent.edf_info.fs
+        data = self.parent.ci.data_to_plot[0,:]
+        self.signalstats_info.chunk_segs = 3
+        freqs, psd = self.signalstats_info.get_psd(data, 100, 100 + 60 * fs, fs)
+        nperseg = self.signalstats_info.seg_len * fs
+        freqs_corr, psd_corr = signal.welch(data[100:100 + 60 * fs].astype(np.float64),
+                                            fs, nperseg=nperseg)
+        np.testing.assert_allclose(freqs, freqs_corr)
+        np.testing.assert_allclose(psd, psd_corr)
+        freqs, psd = self.signalstats_info.get_psd(data, 10, 10, fs)
+        self.assertEqual(len(psd), 0)
+
+    def test_stats_index(self):
+        # Test that interval stats from the prefix sums match the signal
+        data = self.parent.ci.data_to_plot
+        stats_index = SignalStatsIndex(block_size=64)
+        key = (self.parent.ci.montage,)
+        reads = []
+        def read_window(chn):
+            def read(a, b):
+                reads.append(b - a)
+                return data[chn, a:b]
+            return read
+        for chn, s, f in [(0, 0, data.shape[1]), (1, 100, 5000), (1, 10, 50), (2, 511, 513)]:
+            sig = data[chn, s:f].astype(np.float64)
+            mean, var, line_len = stats_index.get_stats(chn, key, s, f, read_window(chn),
+                                                        lambda: data[chn])
+            self.assertAlmostEqual(mean, sig.mean(), places=6)
+            self.assertAlmostEqual(var / sig.var(), 1, places=6)
+            self.assertAlmostEqual(line_len, np.sqrt(np.sum(np.diff(sig) ** 2 + 1)), places=4)
+        # only the partial blocks at the ends are read
+        self.assertTrue(max(reads) <= 2 * 64 + 1)
+        self.assertEqual(sorted(stats_index.chns.keys()), [0, 1, 2])
+        stats_index.get_stats(0, (object(),), 0, 10, read_window(0), lambda: data[0])
+        self.assertEqual(list(stats_index.chns.keys()), [0])
 
     def _load_signals(self):
         # for loading in the test file
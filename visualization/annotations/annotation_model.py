@@ -0,0 +1,75 @@
+""" Module for showing annotations in a list view """
+from PyQt5.QtCore import QAbstractListModel, QModelIndex, Qt
+from preprocessing.annotation_store import AnnotationStore
+
+class AnnotationListModel(QAbstractListModel):
+    """ List model over an AnnotationStore.
+
+        Views only ask for the rows they show, and edits made through the
+        model signal just the rows that changed, so the annotation dock
+        is not rebuilt after each edit.
+    """
+
+    def __init__(self, ann=None, parent=None):
+        """ Constructor for the annotation list model.
+
+            Args:
+                ann - the AnnotationStore to show
+                parent - the parent QObject
+        """
+        super().__init__(parent)
+        if ann is None:
+            ann = AnnotationStore()
+        self.ann = ann
+
+    def set_annotations(self, ann):
+        """ Shows a different AnnotationStore.
+        """
+        self.beginResetModel()
+        self.ann = ann
+        self.endResetModel()
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self.ann)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or index.row() >= len(self.ann):
+            return None
+        if role in (Qt.DisplayRole, Qt.ToolTipRole):
+            return self.ann.text(index.row())
+        return None
+
+    def insert(self, onset, duration, txt):
+        """ Inserts an annotation.
+
+            Returns:
+                the row of the new annotation
+        """
+        row = self.ann.find_insert(onset)
+        self.beginInsertRows(QModelIndex(), row, row)
+        self.ann.insert(onset, duration, txt)
+        self.endInsertRows()
+        return row
+
+    def remove(self, row):
+        """ Removes the annotation in row.
+        """
+        self.beginRemoveRows(QModelIndex(), row, row)
+        self.ann.remove(row)
+        self.endRemoveRows()
+
+    def update(self, row, onset, duration, txt):
+        """ Changes the annotation in row, moving it if its onset changed.
+
+            Returns:
+                the new row of the annotation
+        """
+        if onset == self.ann.onsets[row]:
+            self.ann.update(row, onset, duration, txt)
+            index = self.index(row)
+            self.dataChanged.emit(index, index)
+            return row
+        self.remove(row)
+        return self.insert(onset, duration, txt)
@@ -0,0 +1,133 @@
+""" Module for filtering the whole recording in the background """
+import tempfile
+import threading
+import numpy as np
+from plot_utils import get_filter_bank
+
+class FilterCache():
+    """ Holds the plotted signals filtered over the whole recording.
+
+        The signals are filtered once for each filter setting by a
+        background thread, windows are then sliced from the result.
+        Filtering the whole recording also means windows do not have
+        transients at their edges. The recording is filtered a block at a
+        time, each with a margin of the signal around it, and the result
+        is kept in a memory-mapped temporary file, so only about one block
+        is in memory.
+    """
+
+    def __init__(self, cache_dir=None, block_size=2 ** 18):
+        """ Constructor for the filter cache.
+
+            Args:
+                cache_dir - the directory of the memory-mapped file the
+                    filtered signals are kept in, defaults to the system
+                    temporary directory
+                block_size - the number of samples filtered at a time
+        """
+        self.cache_dir = cache_dir
+        self.block_size = block_size
+        self.key = None # (montage, bank) the filtered signals are for
+        self.data = None # the filtered signals, None until done
+        self.thread = None
+        self.lock = threading.Lock()
+
+    def _get_key(self, ci, fs, fi):
+        """ Gets what the filtered signals depend on.
+        """
+        return (ci.montage, get_filter_bank(fs, fi))
+
+    def _is_key(self, key):
+        """ Whether key is the key of the cache.
+        """
+        return (self.key is not None and key[0] is self.key[0]
+                and key[1] is self.key[1])
+
+    def start(self, ci, fs, fi):
+        """ Starts filtering the whole recording in the background, unless
+            it is already filtered or being filtered with these settings.
+
+            Args:
+                ci - the ChannelInfo of the plotted signals
+                fs - the fs
+                fi - a FilterInfo object
+        """
+        key = self._get_key(ci, fs, fi)
+        with self.lock:
+            if self._is_key(key):
+                return
+            self.key = key
+            self.data = None
+        self.thread = threading.Thread(target=self._filter, args=(ci, key), daemon=True)
+        self.thread.start()
+
+    def _filter(self, ci, key):
+        """ Filters the whole recording, run by the background thread.
+        """
+        bank = key[1]
+        n = ci.nsamples
+        filtered = None
+        for start in range(0, n, self.block_size):
+            if not self._is_key(key):
+                return # the settings changed while filtering
+            m = min(self.block_size, n - start)
+            pad_start = max(0, start - bank.margin)
+            pad_end = min(n, start + m + bank.margin)
+            window = ci.get_window(pad_start, pad_end - pad_start)
+            if filtered is None:
+                filtered = np.memmap(tempfile.TemporaryFile(dir=self.cache_dir),
+                                     dtype=window.dtype, mode="w+",
+                                     shape=(window.shape[0], n))
+            block = bank.apply(window)
+            filtered[:, start:start + m] = block[:, start - pad_start:start - pad_start + m]
+        if filtered is None:
+            filtered = np.zeros((ci.montage.shape[0], 0), dtype=ci.dtype)
+        with self.lock:
+            if self._is_key(key):
+                self.data = filtered
+
+    def get_data(self, ci, fs, fi):
+        """ Gets the whole filtered recording.
+
+            Args:
+                ci - the ChannelInfo of the plotted signals
+                fs - the fs
+                fi - a FilterInfo object
+            Returns:
+                array of size (nchns_to_plot, nsamples), or None if the
+                recording has not been filtered with these settings yet
+        """
+        key = self._get_key(ci, fs, fi)
+        with self.lock:
+            if not self._is_key(key):
+                return None
+            return self.data
+
+    def get_window(self, ci, fs, fi, start, n):
+        """ Gets a window of the filtered signals.
+
+            Args:
+                ci - the ChannelInfo of the plotted signals
+                fs - the fs
+                fi - a FilterInfo object
+                start - the first sample of the window
+                n - the number of samples in the window
+            Returns:
+                array of size (nchns_to_plot, n), or None if the recording
+                has not been filtered with these settings yet
+        """
+        key = self._get_key(ci, fs, fi)
+        with self.lock:
+            if not self._is_key(key) or self.data is None:
+                return None
+            data = self.data
+        window = np.zeros((data.shape[0], n), dtype=data.dtype)
+        sliced = data[:, start:start + n]
+        window[:, :sliced.shape[1]] = sliced
+        return window
+
+    def wait(self):
+        """ Waits for the background filtering to finish.
+        """
+        if self.thread is not None:
+            self.thread.join()
@@ -6,7 +6,7 @@ import numpy as np
 from matplotlib.backends.backend_qt5agg import FigureCanvas
 from matplotlib.figure import Figure
 
-from plot_utils import check_annotations
+from plot_utils import get_annotation_labels
 from ui_files.saveImg import Ui_Form
 
 class SaveImgOptions(QWidget):
@@ -269,38 +269,16 @@ class SaveImgOptions(QWidget):
         self.ax.set_title(self.data.title, fontsize=self.data.font_size)
 
         if self.data.plot_ann:
-            ann, idx_w_ann = check_annotations(
+            secs, texts, raised = get_annotation_labels(
                 self.count, self.window_size, self.parent.edf_info)
             font_size = self.data.font_size - 4
             # Add in annotations
-            if len(ann) != 0:
-                ann = np.array(ann).T
-                txt = ""
-                int_prev = int(float(ann[0, 0]))
-                for i in range(ann.shape[1]):
-                    int_i = int(float(ann[0, i]))
-                    if int_prev == int_i:
-                        txt = txt + "\n" + ann[2, i]
-                    else:
-                        if idx_w_ann[int_prev - self.count] and int_prev % 2 == 1:
-                            self.ann_list.append(self.ax.annotate(txt, xy=(
-                                (int_prev - self.count)*self.fs, -self.y_lim / 2 + self.y_lim),
-                                color='black', size=font_size))
-                        else:
-                            self.ann_list.append(self.ax.annotate(txt, xy=(
-                                (int_prev - self.count)*self.fs, -self.y_lim / 2),
-                                color='black', size=font_size))
-                        txt = ann[2, i]
-                    int_prev = int_i
-                if txt != "":
-                    if idx_w_ann[int_i - self.count] and int_i % 2 == 1:
-                        self.ann_list.append(self.ax.annotate(txt, xy=(
-                            (int_i - self.count)*self.fs, -self.y_lim / 2 + self.y_lim),
-                            color='black', size=font_size))
-                    else:
-                        self.ann_list.append(self.ax.annotate(
-                            txt, xy=((int_i - self.count)*self.fs, -self.y_lim / 2),
-                            color='black', size=font_size))
+            for sec, txt, is_raised in zip(secs, texts, raised):
+                y = -self.y_lim / 2
+                if is_raised:
+                    y += self.y_lim
+                self.ann_list.append(self.ax.annotate(
+                    txt, xy=(sec*self.fs, y), color='black', size=font_size))
 
         self.m.draw()
 
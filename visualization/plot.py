@@ -1,5 +1,6 @@
 """ Module for main plotting window """
 import argparse as ap
+import copy
 from os import path
 import sys
 import os
@@ -8,8 +9,12 @@ from signal_loading.channel_info import ChannelInfo
 from signal_loading.channel_options import ChannelOptions
 from filtering.filter_options import FilterOptions
 from filtering.filter_info import FilterInfo
+from filtering.filter_cache import FilterCache
+from signal_loading.window_prefetcher import WindowPrefetcher
 from predictions.prediction_options import PredictionOptions
 from predictions.prediction_info import PredictionInfo
+from predictions.prediction_overlay import PredictionOverlay
+from annotations.annotation_model import AnnotationListModel
 from spectrogram_window.spec_options import SpecOptions
 from spectrogram_window.spec_info import SpecInfo
 from image_saving.saveImg_info import SaveImgInfo
@@ -17,11 +22,14 @@ from image_saving.saveImg_options import SaveImgOptions
 from image_saving.saveTopoplot_options import SaveTopoplotOptions
 from edf_saving.saveEdf_info import SaveEdfInfo
 from edf_saving.saveEdf_options import SaveEdfOptions
-from signal_stats.signalStats_info import SignalStatsInfo
+from signal_stats.signalStats_info import SignalStatsInfo, POWER_TOOLTIP
 from signal_stats.signalStats_options import SignalStatsOptions
+from signal_stats.signalStats_index import SignalStatsIndex
 
 import pyedflib
-from plot_utils import check_annotations, filter_data, convert_from_count, get_time
+from plot_utils import (get_annotation_labels, filter_data, filter_window, get_filter_bank,
+                        prep_plot_data, decimate_min_max, convert_from_count, get_time,
+                        get_window_size, get_window_size_text, get_record_duration)
 import numpy as np
 from matplotlib.figure import Figure
 from matplotlib.backends.backend_qt5agg import (
@@ -36,13 +44,15 @@ from PyQt5.QtWidgets import (QApplication, QMainWindow, QFileDialog,
                              QMessageBox, QWidget,
                              QPushButton, QCheckBox, QLabel, QInputDialog,
                              QSlider, QGridLayout, QDockWidget, QListWidget,
-                             QListWidgetItem, QLineEdit, QSpinBox,
+                             QListWidgetItem, QListView, QLineEdit, QSpinBox, QProgressDialog,
                              QTimeEdit, QComboBox, QFrame, QStyle, QDesktopWidget)
 from PyQt5.QtGui import QBrush, QColor, QPen, QFont, QDesktopServices
 import pyqtgraph as pg
 from pyqtgraph.dockarea import *
 
 from preprocessing.edf_loader import *
+from preprocessing.annotation_store import (FILTERED_TXT, NFILTER_ANN,
+                                            to_annotation_store)
 from scipy import signal
 
 from pkg_resources import resource_filename
@@ -144,6 +154,11 @@ class MainPage(QMainWindow):
                                 " if muli-channel predictions are plotted.")
         self.btn_topo.setEnabled(0)
         grid_lt.addWidget(self.btn_topo, ud, 1, 1, 1)
+
+        self.btn_next_pred = QPushButton("Next detection", self)
+        self.btn_next_pred.setToolTip("Click to move to the next prediction" +
+                                " above the threshold.")
+        grid_lt.addWidget(self.btn_next_pred, ud, 0, 1, 1)
         ud += 1
 
         test = QLabel("", self)
@@ -188,7 +203,8 @@ class MainPage(QMainWindow):
         grid_lt.addWidget(label_ws, ud, 0)
 
         self.ws_combobox = QComboBox()
-        self.ws_combobox.addItems(["1s","5s","10s","15s","20s","25s","30s","45s"])
+        self.ws_combobox.addItems(["1s","5s","10s","15s","20s","25s","30s","45s",
+                                   "1min","2min","5min","10min","30min","1h","2h"])
         self.ws_combobox.setCurrentIndex(2)
         grid_lt.addWidget(self.ws_combobox, ud, 1)
         ud += 1
@@ -238,6 +254,7 @@ class MainPage(QMainWindow):
         #---- Right side of the screen ----#
         self.plot_layout = pg.GraphicsLayoutWidget()
         self.main_plot = self.plot_layout.addPlot(row=0, col=0)
+        self.main_pred_overlay = PredictionOverlay(self.main_plot) # channel-wise predictions
         self.main_plot.setMouseEnabled(x=False, y=False)
         self.plot_layout.setBackground('w')
         self.plot_area = DockArea()
@@ -295,7 +312,10 @@ class MainPage(QMainWindow):
         self.btn_open_edit_ann = QPushButton("Open annotation editor", self)
         self.btn_open_edit_ann.setToolTip("Click to open annotation editor")
         self.scroll.setTitleBarWidget(self.btn_open_edit_ann)
-        self.ann_qlist = QListWidget()
+        self.ann_model = AnnotationListModel()
+        self.ann_qlist = QListView()
+        self.ann_qlist.setModel(self.ann_model)
+        self.ann_qlist.setUniformItemSizes(True)
         self.scroll.setWidget(self.ann_qlist)
         self.scroll.setFloating(False)
         self.scroll.setFixedWidth(self.dock_width)
@@ -389,12 +409,15 @@ class MainPage(QMainWindow):
         for i, fs_band in enumerate(fs_band_names):
             lbl = QtWidgets.QLabel(self)
             lbl.setText(fs_band + ":")
+            lbl.setToolTip(POWER_TOOLTIP)
             self.grid_layout.addWidget(lbl, ud + i, 1, 1, 1)
             self.fs_band_lbls[fs_band] = QtWidgets.QLabel(self)
             self.fs_band_lbls[fs_band].setText("")
+            self.fs_band_lbls[fs_band].setToolTip(POWER_TOOLTIP)
             self.grid_layout.addWidget(self.fs_band_lbls[fs_band], ud + i, 2, 1, 1)
             self.fs_band_sel_lbls[fs_band] = QtWidgets.QLabel(self)
             self.fs_band_sel_lbls[fs_band].setText("")
+            self.fs_band_sel_lbls[fs_band].setToolTip(POWER_TOOLTIP)
             self.grid_layout.addWidget(self.fs_band_sel_lbls[fs_band], ud + i, 3, 1, 1)
         ud += 5
         self.qscroll = QtWidgets.QScrollArea(self)
@@ -460,6 +483,7 @@ class MainPage(QMainWindow):
         self.button_predict.clicked.connect(self.change_predictions)
         self.thresh_slider.sliderReleased.connect(self.change_thresh_slider)
         self.btn_topo.clicked.connect(self.minimize_topo)
+        self.btn_next_pred.clicked.connect(self.next_prediction)
         self.btn_zoom.clicked.connect(self.open_zoom_plot)
         self.button_chg_spec.clicked.connect(self.load_spec)
         self.button_amp_inc.clicked.connect(self.inc_amp)
@@ -481,7 +505,7 @@ class MainPage(QMainWindow):
 
         # ---- right side dock ---- #
         self.btn_open_edit_ann.clicked.connect(self.open_ann_editor)
-        self.ann_qlist.itemClicked.connect(self.ann_clicked)
+        self.ann_qlist.clicked.connect(self.ann_clicked)
         self.ann_time_edit_time.timeChanged.connect(self.update_count_time)
         self.ann_time_edit_count.valueChanged.connect(self.update_normal_time)
         self.btn_ann_edit.clicked.connect(self.ann_editor_update)
@@ -561,18 +585,25 @@ class MainPage(QMainWindow):
         """
         # self.init = 1 # set in load_data to prevent issues with slider
         self.fi = FilterInfo()  # holds data needed to filter
+        self.filter_cache = FilterCache(self.argv.cache_dir) # whole recording, filtered
+        self.stats_index = SignalStatsIndex() # prefix sums for the signal stats
+        self.save_block_secs = 60 # seconds of signal saved to .edf at a time
+        self.prefetcher = WindowPrefetcher() # windows next to the plotted one
+        self.page_step = 10 # seconds moved by the last page
+        self.plot_data = None # the signals of the window to draw
+        self.plot_data_key = None # (montage, window key) of plot_data
         self.filter_checked = 0  # whether or not filter checkbox is checked
         self.cbox_filter.setChecked(False)
 
         # check if this file is already filtered
         ann = self.edf_info.annotations
-        if len(ann[0]) > 0 and ann[2][0] == "filtered":
+        if ann.is_filtered():
             self.filter_checked = 1  # whether or not filter checkbox is checked
-            str_lp = ann[2][1].split("Hz")[0][4:]
-            str_hp = ann[2][2].split("Hz")[0][4:]
-            str_n = ann[2][3].split("Hz")[0][3:]
-            str_bp1 = ann[2][4].split("-")[0][4:]
-            str_bp2 = ann[2][4].split("-")[1].split("Hz")[0]
+            str_lp = ann.text(1).split("Hz")[0][4:]
+            str_hp = ann.text(2).split("Hz")[0][4:]
+            str_n = ann.text(3).split("Hz")[0][3:]
+            str_bp1 = ann.text(4).split("-")[0][4:]
+            str_bp2 = ann.text(4).split("-")[1].split("Hz")[0]
             if float(str_lp) > 0:
                 self.fi.lp = float(str_lp)
             else:
@@ -622,11 +653,12 @@ class MainPage(QMainWindow):
         self.ylim = [150, 100]  # [150,3] # reset scale of axis
         self.window_size = self.argv.window_width # number of seconds displayed at once
         self.ws_combobox.setCurrentIndex(2)
-        ind = self.ws_combobox.findText(str(self.window_size) + "s")
+        ind = self.ws_combobox.findText(get_window_size_text(self.window_size))
         if ind != -1: # -1 for not found
             self.ws_combobox.setCurrentIndex(ind)
         # self.count = 0  # current location in time
         self.ann_list = []  # list of annotations
+        self.ann_label_cache = {} # labels of the last window drawn
         self.rect_list = [] # list of prediction rectangles
         self.aspan_list = []  # list of lines on the axis from preds
         self.pred_label.setText("")  # reset text of predictions
@@ -652,13 +684,14 @@ class MainPage(QMainWindow):
             return
         else:
             self.edf_file_name_temp = name
-            loader = EdfLoader()
+            loader = EdfLoader(cache_dir=self.argv.cache_dir,
+                               cache_dtype=np.dtype(self.argv.signal_dtype))
             try:
                 self.edf_info_temp = loader.load_metadata(name)
             except:
                 self.throw_alert("The .edf file is invalid.")
                 return
-            self.edf_info_temp.annotations = np.array(
+            self.edf_info_temp.annotations = to_annotation_store(
                 self.edf_info_temp.annotations)
 
             try:
@@ -672,12 +705,14 @@ class MainPage(QMainWindow):
             # setting temporary variables that will be overwritten if
             # the user selects signals to plot
             self.max_time_temp = int(
-                self.edf_info_temp.nsamples[0] / self.edf_info_temp.fs)
+                np.max(self.edf_info_temp.nsamples) / self.edf_info_temp.fs)
             self.ci_temp = ChannelInfo()  # holds channel information
             self.ci_temp.chns2labels = self.edf_info_temp.chns2labels
             self.ci_temp.labels2chns = self.edf_info_temp.labels2chns
             self.ci_temp.fs = self.edf_info_temp.fs
             self.ci_temp.edf_fn = name
+            self.ci_temp.edf_info = self.edf_info_temp
+            self.ci_temp.dtype = np.dtype(self.argv.signal_dtype)
             self.fn_full_temp = name
             if len(name.split('/')[-1]) < 40:
                 self.fn_temp = name.split('/')[-1]
@@ -696,10 +731,9 @@ class MainPage(QMainWindow):
         """
         self.init_graph()
 
-        self.slider.setMaximum(self.max_time - self.window_size)
+        self.slider.setMaximum(max(self.max_time - self.window_size, 0))
         self.thresh_slider.setValue(int(self.argv.prediction_thresh * 100))
 
-        self.ann_qlist.clear()  # Clear annotations
         self.populate_ann_dock()  # Add annotations if they exist
         self.show_ann_stats_dock()
 
@@ -708,14 +742,13 @@ class MainPage(QMainWindow):
         if not self.init and self.argv.location < self.max_time - self.window_size:
             self.count = self.argv.location
 
-        ann = self.edf_info.annotations
         topo_chns_correct = self.check_topo_chns()
         if (self.pi.pred_by_chn and self.predicted and topo_chns_correct
             and not self.pi.multi_class):
             self.add_topoplot()
             self.btn_topo.setText("Hide topoplots")
             self.btn_topo.setEnabled(1)
-        if self.filter_checked == 1 or (len(ann[0]) > 0 and ann[2][0] == "filtered"):
+        if self.filter_checked == 1 or self.edf_info.annotations.is_filtered():
             self.move_plot(0, 0, self.ylim[1], 0)
         else:
             # profile.runctx('self.move_plot(0, 0, self.ylim[0], 0)', globals(), locals())
@@ -727,14 +760,15 @@ class MainPage(QMainWindow):
 
         self.init = 1
 
-        ann = self.edf_info.annotations
-        if len(ann[0]) > 0 and ann[2][0] == "filtered" or self.filter_checked == 1:
+        if self.edf_info.annotations.is_filtered() or self.filter_checked == 1:
             self.cbox_filter.setChecked(True)  # must be set after init = 1
 
     def ann_clicked(self):
         """ Moves the plot when annotations in the dock are clicked.
         """
-        loc = int(float(self.edf_info.annotations[0][self.ann_qlist.currentRow()]))
+        onset, dur, ann_txt = self.edf_info.annotations.get(
+            self.ann_qlist.currentIndex().row())
+        loc = int(onset)
         if loc < self.max_time - self.window_size:
             self.count = loc
         else:
@@ -743,11 +777,9 @@ class MainPage(QMainWindow):
 
         # Update annotation dock if it is open
         if self.btn_open_edit_ann.text() == "Close annotation editor":
-            self.ann_txt_edit.setText(self.edf_info.annotations[2][self.ann_qlist.currentRow()])
-            self.ann_time_edit_count.setValue(int(
-                float(self.edf_info.annotations[0][self.ann_qlist.currentRow()])))
-            self.ann_duration.setValue(int(
-                float(self.edf_info.annotations[1][self.ann_qlist.currentRow()])))
+            self.ann_txt_edit.setText(ann_txt)
+            self.ann_time_edit_count.setValue(loc)
+            self.ann_duration.setValue(int(dur))
             self.btn_ann_edit.setEnabled(True)
             self.btn_ann_del.setEnabled(True)
 
@@ -765,15 +797,13 @@ class MainPage(QMainWindow):
             self.ann_time_edit_count.setValue(self.count)
             self.btn_ann_edit.setEnabled(False)
             self.btn_ann_del.setEnabled(False)
-            selected_list_items = self.ann_qlist.selectedItems()
-            if len(selected_list_items) > 0:
-                selected_list_items[0].setSelected(False)
+            self.ann_qlist.clearSelection()
             self.btn_open_edit_ann.setText("Close annotation editor")
             self.ann_edit_dock.show()
         else:
             self.btn_open_edit_ann.setText("Open annotation editor")
             self.ann_edit_dock.hide()
-            if len(self.edf_info.annotations[0]) == 0:
+            if len(self.edf_info.annotations) == 0:
                 self.populate_ann_dock()
                 self.show_ann_stats_dock()
 
@@ -790,17 +820,12 @@ class MainPage(QMainWindow):
     def populate_ann_dock(self):
         """ Fills the annotation dock with annotations if they exist.
         """
-        self.ann_qlist.clear()
-        ann = self.edf_info.annotations
-        if len(ann[0]) > 0:
-            for i in range(len(ann[0])):
-                self.ann_qlist.addItem(ann[2][i])
+        self.ann_model.set_annotations(self.edf_info.annotations)
 
     def show_ann_stats_dock(self):
         """ Properly show the stats and annotation dock.
         """
-        ann = self.edf_info.annotations
-        if len(ann[0]) == 0:
+        if len(self.edf_info.annotations) == 0:
             self.ann_edit_dock.hide()
             if self.btn_open_stats.text() == "Open signal stats":
                 self.scroll.hide()
@@ -821,23 +846,20 @@ class MainPage(QMainWindow):
         ann_txt = self.ann_txt_edit.text()
         loc = self.ann_time_edit_count.value()
         dur = self.ann_duration.value()
-        self.edf_info.annotations[0][self.ann_qlist.currentRow()] = loc
-        self.edf_info.annotations[1][self.ann_qlist.currentRow()] = dur
-        self.edf_info.annotations[2][self.ann_qlist.currentRow()] = ann_txt
+        row = self.ann_model.update(self.ann_qlist.currentIndex().row(), loc, dur, ann_txt)
+        self.ann_qlist.setCurrentIndex(self.ann_model.index(row))
         self.ann_txt_edit.clear()
-        self.populate_ann_dock()
-        self.call_move_plot(0,0)
+        self.redraw_annotations()
 
     def ann_editor_del(self):
         """ Called when the delete selected annotation button is pressed.
         """
-        self.edf_info.annotations = np.delete(
-            self.edf_info.annotations,self.ann_qlist.currentRow(),axis = 1)
+        self.ann_model.remove(self.ann_qlist.currentIndex().row())
+        self.ann_qlist.clearSelection()
         self.btn_ann_edit.setEnabled(False)
         self.btn_ann_del.setEnabled(False)
         self.ann_txt_edit.clear()
-        self.populate_ann_dock()
-        self.call_move_plot(0,0)
+        self.redraw_annotations()
 
     def ann_editor_create(self):
         """ Called when the create new annotation button is pressed.
@@ -847,22 +869,9 @@ class MainPage(QMainWindow):
             self.ann_txt_edit.setText("")
             loc = self.ann_time_edit_count.value()
             dur = self.ann_duration.value()
-            i = 0
-            while i < len(self.edf_info.annotations[0]):
-                if int(float(self.edf_info.annotations[0][i])) > loc:
-                    break
-                i += 1
-            if len(self.edf_info.annotations[0]) == 0:
-                self.edf_info.annotations = np.append(
-                    self.edf_info.annotations,
-                    np.array([[loc], [dur], [ann_txt]]), axis = 1)
-            else:
-                self.edf_info.annotations = np.insert(
-                    self.edf_info.annotations, i,
-                    [loc, dur, ann_txt], axis = 1)
+            self.ann_model.insert(loc, dur, ann_txt)
             self.ann_txt_edit.clear()
-            self.populate_ann_dock()
-            self.call_move_plot(0,0)
+            self.redraw_annotations()
 
     def update_normal_time(self):
         """ Updates self.ann_time_edit_time when self.ann_time_edit_count is changed.
@@ -904,6 +913,7 @@ class MainPage(QMainWindow):
                     self.btn_zoom.setText("Close zoom")
                     self.zoom_plot_lines = []
                     self.zoom_rect_list = []
+                    self.zoom_pred_overlay = PredictionOverlay(self.zoom_plot)
                     self.zoom_roi_pos = self.zoom_roi.pos()
                     self.zoom_roi_size = self.zoom_roi.size()
                     self.update_zoom_plot()
@@ -921,25 +931,16 @@ class MainPage(QMainWindow):
         fs = self.edf_info.fs
         nchns = self.ci.nchns_to_plot
 
-        plot_data = np.zeros((self.ci.nchns_to_plot,self.window_size * fs))
+        plot_data = self.get_plot_data()
         if self.filter_checked == 1:
             y_lim = self.ylim[1]
-            self.prep_filter_ws()
-            # plot_data = np.zeros(self.filtered_data.shape)
-            plot_data += self.filtered_data
-            stddev = np.std(
-                plot_data)
-            plot_data[plot_data > 3 * stddev] = 3 * stddev
-            plot_data[plot_data < -3 * stddev] = -3 * stddev
         else:
-            # plot_data = np.zeros(self.ci.data_to_plot.shape)
-            plot_data += self.ci.data_to_plot[:,
-                    self.count * fs:(self.count + self.window_size) * fs]
             y_lim = self.ylim[0]
 
         if not (len(self.zoom_plot_lines) > 0 and len(self.zoom_plot_lines) == nchns):
             # self.plotWidget.clear()
             self.zoom_plot.clear()
+            self.zoom_pred_overlay.reset()
             self.zoom_plot_lines = []
             for i in range(nchns):
                 pen = pg.mkPen(color=self.ci.colors[i], width=2, style=QtCore.Qt.SolidLine)
@@ -951,88 +952,34 @@ class MainPage(QMainWindow):
                             + (i + 1) * y_lim)
 
         # add predictions
-        if len(self.rect_list) > 0:
-            for a in self.rect_list:
+        if len(self.zoom_rect_list) > 0:
+            for a in self.zoom_rect_list:
                 self.zoom_plot.removeItem(a)
-            self.rect_list[:] = []
+            self.zoom_rect_list[:] = []
 
         if self.predicted == 1:
             blue_brush = QBrush(QColor(38,233,254,50))
-            starts, ends, chns, class_vals = self.pi.compute_starts_ends_chns(self.thresh,
+            starts, ends, chns, class_vals = self.pi.get_segments_in_window(self.thresh,
                                         self.count, self.window_size, fs, nchns)
-            for k in range(len(starts)):
-                if self.pi.pred_by_chn and not self.pi.multi_class:
-                    for i in range(nchns):
-                        if chns[k][i]:
-                            if i == plot_data.shape[0] - 1:
-                                r1 = pg.QtGui.QGraphicsRectItem(starts[k] - self.count *
-                                        fs, y_lim *(i+0.5),
-                                        ends[k] - starts[k], y_lim) # (x, y, w, h)
-                                r1.setPen(pg.mkPen(None))
-                                r1.setBrush(pg.mkBrush(color = (38,233,254,50))) # (r,g,b,alpha)
-                                self.zoom_plot.addItem(r1)
-                                self.rect_list.append(r1)
-                            else:
-                                r1 = pg.QtGui.QGraphicsRectItem(starts[k] - self.count *
-                                        fs, y_lim *(i + 0.5),
-                                        ends[k] - starts[k], y_lim) # (x, y, w, h)
-                                r1.setPen(pg.mkPen(None))
-                                r1.setBrush(blue_brush) # (r,g,b,alpha)
-                                self.zoom_plot.addItem(r1)
-                                self.rect_list.append(r1)
-                            x_vals = range(
-                                int(starts[k]) - self.count * fs, int(ends[k]) - self.count * fs)
-                            pen = pg.mkPen(color=self.ci.colors[i], width=3,
-                                            style=QtCore.Qt.SolidLine)
-                            self.plot_lines.append(self.zoom_plot.plot(x_vals,
-                                                plot_data[i, int(starts[k])
-                                                - self.count * fs:int(ends[k]) -
-                                                self.count * fs] + i*y_lim + y_lim,
-                                                clickable=False, pen=pen))
-                elif not self.pi.pred_by_chn and not self.pi.multi_class:
-                    r1 = pg.LinearRegionItem(values=(starts[k] - self.count * fs, ends[k]
-                                    - self.count * fs),
-                                    brush=blue_brush, movable=False,
-                                    orientation=pg.LinearRegionItem.Vertical)
-                    self.zoom_plot.addItem(r1)
-                    self.rect_list.append(r1)
-                elif not self.pi.pred_by_chn and self.pi.multi_class:
-                    r, g, b, a = self.pi.get_color(class_vals[k])
-                    brush = QBrush(QColor(r, g, b, a))
-                    r1 = pg.LinearRegionItem(values=(starts[k] - self.count * fs, ends[k]
-                                    - self.count * fs),
+            if self.pi.pred_by_chn:
+                self.draw_chn_preds(self.zoom_pred_overlay, starts, ends, chns,
+                                    np.arange(plot_data.shape[1]), plot_data, y_lim)
+            else:
+                self.zoom_pred_overlay.clear()
+                for k in range(len(starts)):
+                    if not self.pi.multi_class:
+                        brush = blue_brush
+                    else:
+                        r, g, b, a = self.pi.get_color(class_vals[k])
+                        brush = QBrush(QColor(r, g, b, a))
+                    r1 = pg.LinearRegionItem(values=(starts[k] - self.count * fs,
+                                    ends[k] - self.count * fs),
                                     brush=brush, movable=False,
                                     orientation=pg.LinearRegionItem.Vertical)
                     self.zoom_plot.addItem(r1)
-                    self.rect_list.append(r1)
-                else:
-                    for i in range(nchns):
-                        r, g, b, a = self.pi.get_color(chns[k][i])
-                        brush = QBrush(QColor(r, g, b, a))
-                        if i == plot_data.shape[0] - 1:
-                            r1 = pg.QtGui.QGraphicsRectItem(starts[k] - self.count * fs,
-                                    y_lim *(i+0.5),
-                                    ends[k] - starts[k], y_lim) # (x, y, w, h)
-                            r1.setPen(pg.mkPen(None))
-                            r1.setBrush(brush) # (r,g,b,alpha)
-                            self.zoom_plot.addItem(r1)
-                            self.rect_list.append(r1)
-                        else:
-                            r1 = pg.QtGui.QGraphicsRectItem(starts[k] - self.count * fs,
-                                    y_lim *(i + 0.5),
-                                    ends[k] - starts[k], y_lim) # (x, y, w, h)
-                            r1.setPen(pg.mkPen(None))
-                            r1.setBrush(brush) # (r,g,b,alpha)
-                            self.zoom_plot.addItem(r1)
-                            self.rect_list.append(r1)
-                        x_vals = range(
-                            int(starts[k]) - self.count * fs, int(ends[k]) - self.count * fs)
-                        pen = pg.mkPen(color=self.ci.colors[i], width=3, style=QtCore.Qt.SolidLine)
-                        self.plot_lines.append(self.zoom_plot.plot(x_vals,
-                                        plot_data[i, int(starts[k]) -
-                                        self.count * fs:int(ends[k]) - self.count * fs] +
-                                        i*y_lim + y_lim, clickable=False, pen=pen))
-
+                    self.zoom_rect_list.append(r1)
+        else:
+            self.zoom_pred_overlay.clear()
 
         x_ticks = []
         for i in range(self.window_size):
@@ -1087,6 +1034,18 @@ class MainPage(QMainWindow):
         if self.predicted == 1:
             self.call_move_plot(0, 0)
 
+    def next_prediction(self):
+        """
+        Moves the plot to the start of the next prediction above the threshold.
+        """
+        if self.init == 1 and self.predicted == 1:
+            fs = self.edf_info.fs
+            start = self.pi.get_next_segment(self.thresh, self.ci.nchns_to_plot,
+                                             (self.count + 1) * fs)
+            if start >= 0:
+                self.count = min(int(start // fs), max(self.max_time - self.window_size, 0))
+                self.call_move_plot(0, 0)
+
     def chg_sig(self):
         """
         Funtion to open channel_options so users can change the signals being
@@ -1109,21 +1068,33 @@ class MainPage(QMainWindow):
         """ Function to save current data to .edf file, called by anonymization windows
         """
         if self.init == 1:
-            if self.filter_checked == 1:
-                show = 1
-                if self.argv.save_edf_fn is not None:
-                    show = 0
-                data_to_save = filter_data(
-                    self.ci.data_to_plot, self.edf_info.fs, self.fi, show)
-                if self.fi.filter_canceled == 1:
-                    self.fi.filter_canceled = 0
-                    return
-            else:
-                data_to_save = self.ci.data_to_plot
+            show = 1
+            if self.argv.save_edf_fn is not None:
+                show = 0
+            # The signals are read and filtered a block at a time, once to
+            # find their physical max and min and again to write them, so
+            # that only one block is in memory at a time. Each block is a
+            # whole number of data records of every signal, the last one is
+            # padded with zeros.
+            fs = self.edf_info.fs
+            save_preds = self.predicted == 1 and not self.pi.multi_class
+            freqs = [fs]
+            if save_preds:
+                freqs.append(fs / self.pi.pred_width)
+            record_duration = get_record_duration(freqs)
+            sig_per_record = int(round(fs * record_duration))
+            nrecords = int(np.ceil(self.ci.nsamples / sig_per_record))
+            block_records = max(1, int(self.save_block_secs * fs) // sig_per_record)
+            blocks = [(record * sig_per_record,
+                       min(block_records, nrecords - record) * sig_per_record)
+                      for record in range(0, nrecords, block_records)]
+            phys_max, phys_min = self._get_save_bounds(blocks, show)
+            if phys_max is None:
+                return
 
             # write annotations
             ann = self.edf_info.annotations
-            if len(ann[0]) > 0 and ann[2][0] == "filtered":
+            if ann.is_filtered():
                 self.throw_alert("If filter values have since been changed, " +
                                 "filter history will not be saved.\n"  +
                                 "If you would like to append some record of " +
@@ -1153,17 +1124,13 @@ class MainPage(QMainWindow):
             self.sei.convert_to_header()
             saved_edf.setHeader(self.sei.pyedf_header)
             # Set fs and physical min/max
-            fs = self.edf_info.fs
             for i in range(nchns):
-                saved_edf.setPhysicalMaximum(i, np.max(data_to_save[i]))
-                saved_edf.setPhysicalMinimum(i, np.min(data_to_save[i]))
+                saved_edf.setPhysicalMaximum(i, phys_max[i])
+                saved_edf.setPhysicalMinimum(i, phys_min[i])
                 saved_edf.setSamplefrequency(i, fs)
                 saved_edf.setLabel(i, labels[i + 1])
             # if predictions, save them as well
-            if self.predicted == 1 and not self.pi.multi_class:
-                temp = []
-                for i in range(nchns):
-                    temp.append(data_to_save[i])
+            if save_preds:
                 if self.pi.pred_by_chn:
                     for i in range(nchns):
                         saved_edf.setPhysicalMaximum(nchns + i, 1)
@@ -1171,41 +1138,50 @@ class MainPage(QMainWindow):
                         saved_edf.setSamplefrequency(
                             nchns + i, fs / self.pi.pred_width)
                         saved_edf.setLabel(nchns + i, "PREDICTIONS_" + str(i))
-                    for i in range(nchns):
-                        temp.append(self.pi.preds_to_plot[:, i])
                 else:
                     saved_edf.setPhysicalMaximum(nchns, 1)
                     saved_edf.setPhysicalMinimum(nchns, 0)
                     saved_edf.setSamplefrequency(nchns, fs / self.pi.pred_width)
                     saved_edf.setLabel(nchns, "PREDICTIONS")
-                    temp.append(self.pi.preds_to_plot)
-                data_to_save = temp
-            saved_edf.writeSamples(data_to_save)
+            if show:
+                progress = QProgressDialog("Saving...", None, 0, len(blocks))
+                progress.setWindowModality(Qt.WindowModal)
+            for k, (start, n) in enumerate(blocks):
+                data_to_save = list(self._get_save_block(start, n))
+                if save_preds:
+                    # predictions for the samples in this block
+                    pred_per_record = int(round(fs / self.pi.pred_width * record_duration))
+                    pred_start = start // sig_per_record * pred_per_record
+                    npreds = n // sig_per_record * pred_per_record
+                    preds = np.zeros((npreds,) + self.pi.preds_to_plot.shape[1:])
+                    block_preds = self.pi.preds_to_plot[pred_start:pred_start + npreds]
+                    preds[:len(block_preds)] = block_preds
+                    if self.pi.pred_by_chn:
+                        for i in range(nchns):
+                            data_to_save.append(preds[:, i])
+                    else:
+                        data_to_save.append(preds)
+                saved_edf.writeSamples(data_to_save)
+                if show:
+                    progress.setValue(k + 1)
 
             # write annotations
-            if len(ann[0]) > 0 and ann[2][0] == "filtered":
-                for aa in range(5): # remove any old annotations
-                    ann = np.delete(ann, 0, axis=1)
+            first = 0
+            if ann.is_filtered():
+                first = NFILTER_ANN # do not write the old filter settings
             if self.filter_checked == 1:
-                if len(ann[0]) == 0:
-                    ann = np.array([0.0, -1.0, "filtered"])
-                    ann = ann[..., np.newaxis]
-                else:
-                    ann = np.insert(ann, 0, [0.0, -1.0, "filtered"], axis=1)
-                str_filt = ""
-                str_filt += "LP: " + str(self.fi.do_lp * self.fi.lp) + "Hz"
-                ann = np.insert(ann, 1, [0.0, -1.0, str_filt], axis=1)
-                str_filt = "" + "HP: " + str(self.fi.do_hp * self.fi.hp) + "Hz"
-                ann = np.insert(ann, 2, [0.0, -1.0, str_filt], axis=1)
-                str_filt = "" + "N: " + str(self.fi.do_notch * self.fi.notch) + "Hz"
-                ann = np.insert(ann, 3, [0.0, -1.0, str_filt], axis=1)
-                str_filt = ("" + "BP: " + str(self.fi.do_bp * self.fi.bp1) + "-" +
-                                str(self.fi.do_bp * self.fi.bp2) + "Hz")
-                ann = np.insert(ann, 4, [0.0, -1.0, str_filt], axis=1)
-                # ann = np.insert(ann, 1, [0.0, -1.0, str_filt], axis=1)
-            for i in range(len(ann[0])):
+                saved_edf.writeAnnotation(0.0, -1.0, FILTERED_TXT)
+                saved_edf.writeAnnotation(
+                    0.0, -1.0, "LP: " + str(self.fi.do_lp * self.fi.lp) + "Hz")
                 saved_edf.writeAnnotation(
-                    float(ann[0][i]), float((ann[1][i])), ann[2][i])
+                    0.0, -1.0, "HP: " + str(self.fi.do_hp * self.fi.hp) + "Hz")
+                saved_edf.writeAnnotation(
+                    0.0, -1.0, "N: " + str(self.fi.do_notch * self.fi.notch) + "Hz")
+                saved_edf.writeAnnotation(
+                    0.0, -1.0, "BP: " + str(self.fi.do_bp * self.fi.bp1) + "-" +
+                    str(self.fi.do_bp * self.fi.bp2) + "Hz")
+            for i in range(first, len(ann)):
+                saved_edf.writeAnnotation(*ann.get(i))
 
             # Close file
             saved_edf.close()
@@ -1216,6 +1192,51 @@ class MainPage(QMainWindow):
                 if self.argv.show == 0:
                     sys.exit()
 
+    def _get_save_block(self, start, n):
+        """ Gets a block of the signals to save to .edf file, filtered if
+            the filter is on.
+
+            Args:
+                start - the first sample of the block
+                n - the number of samples in the block
+            Returns:
+                array of size (nchns_to_plot, n)
+        """
+        if self.filter_checked == 1:
+            return filter_window(self.ci, start, n, self.edf_info.fs, self.fi, 0)
+        return self.ci.get_window(start, n)
+
+    def _get_save_bounds(self, blocks, show):
+        """ Finds the physical max and min of each signal to save, reading
+            the blocks that are saved one at a time.
+
+            Args:
+                blocks - list of (first sample, number of samples) of each
+                    block
+                show - whether to show the progress bar
+            Returns:
+                phys_max, phys_min - arrays of the max and min of each
+                signal, widened if they are equal, both None if canceled
+        """
+        if show:
+            progress = QProgressDialog("Preparing to save...", "Cancel", 0, len(blocks))
+            progress.setWindowModality(Qt.WindowModal)
+        phys_max = np.full(self.ci.nchns_to_plot, -np.inf)
+        phys_min = np.full(self.ci.nchns_to_plot, np.inf)
+        for k, (start, n) in enumerate(blocks):
+            block = self._get_save_block(start, n)
+            phys_max = np.maximum(phys_max, np.max(block, axis=1))
+            phys_min = np.minimum(phys_min, np.min(block, axis=1))
+            if show:
+                progress.setValue(k + 1)
+                if progress.wasCanceled():
+                    return None, None
+        # pyedflib needs the max to be above the min, ie for flat signals
+        flat = phys_max <= phys_min
+        phys_max[flat] += 1
+        phys_min[flat] -= 1
+        return phys_max, phys_min
+
     def right_plot_1s(self):
         """ Move plot right 1s """
         self.call_move_plot(1, 1)
@@ -1252,11 +1273,11 @@ class MainPage(QMainWindow):
         """ Change window size """
         if self.init == 1:
             new_ws = self.ws_combobox.currentText()
-            new_ws = int(new_ws.split("s")[0])
+            new_ws = get_window_size(new_ws)
             self.window_size = new_ws
-            self.slider.setMaximum(self.max_time - self.window_size)
+            self.slider.setMaximum(max(self.max_time - self.window_size, 0))
             if self.count > self.max_time - self.window_size:
-                self.count = self.max_time - self.window_size
+                self.count = max(self.max_time - self.window_size, 0)
             self.call_move_plot(0, 0)
         else:
             self.ws_combobox.setCurrentIndex(2)
@@ -1281,6 +1302,37 @@ class MainPage(QMainWindow):
             self.saveimg_ops = SaveImgOptions(self.sii, self)
             self.saveimg_ops.show()
 
+    def draw_annotations(self, y_lim):
+        """ Draws the annotations of the current window on the main plot.
+
+            Args:
+                y_lim - the space between signals
+        """
+        fs = self.edf_info.fs
+        if len(self.ann_list) > 0:
+            for a in self.ann_list:
+                self.main_plot.removeItem(a)
+            self.ann_list[:] = []
+        secs, texts, raised = get_annotation_labels(
+            self.count, self.window_size, self.edf_info, self.ann_label_cache)
+        for sec, txt, is_raised in zip(secs, texts, raised):
+            txt_item = pg.TextItem(text=txt, color='k', anchor=(0,1))
+            self.main_plot.addItem(txt_item)
+            if is_raised:
+                txt_item.setPos(sec*fs, -(3/2)*y_lim)
+            else:
+                txt_item.setPos(sec*fs, -y_lim)
+            self.ann_list.append(txt_item)
+
+    def redraw_annotations(self):
+        """ Redraws only the annotations after they are edited.
+        """
+        if self.init == 1:
+            if self.filter_checked == 1:
+                self.draw_annotations(self.ylim[1])
+            else:
+                self.draw_annotations(self.ylim[0])
+
     def call_move_plot(self, right, num_move, print_graph=0):
         """ Helper function to call move_plot for various buttons.
         """
@@ -1290,6 +1342,37 @@ class MainPage(QMainWindow):
             else:
                 self.move_plot(right, num_move, self.ylim[0], print_graph)
 
+    def draw_chn_preds(self, overlay, starts, ends, chns, x, y, y_lim):
+        """ Draws channel-wise predictions in the current window.
+
+            Args:
+                overlay - the PredictionOverlay of the plot
+                starts, ends, chns - from PredictionInfo.get_segments_in_window
+                x - the sample of each point of the plotted signals
+                y - the plotted signals
+                y_lim - the space between signals
+        """
+        fs = self.edf_info.fs
+        chns = np.array(chns)
+        if self.pi.multi_class:
+            # the class of each channel
+            vals = chns
+            colors = {c: self.pi.get_color(c) for c in np.unique(vals)}
+        else:
+            vals = np.where(chns, 0, -1)
+            colors = {0: (38, 233, 254, 50)}
+        overlay.set_preds(np.array(starts) - self.count * fs, np.array(ends) - self.count * fs,
+                          vals, colors, x, y, y_lim, self.ci.colors)
+
+    def get_plot_npoints(self):
+        """ Gets how many points to draw for each signal in the main plot,
+            twice the width of the plot in pixels.
+        """
+        width = int(self.main_plot.getViewBox().width())
+        if width <= 0: # not shown yet
+            width = 1000
+        return 2 * width
+
     def move_plot(self, right, num_move, y_lim, print_graph):
         """
         Function to shift the graph left and right
@@ -1311,26 +1394,25 @@ class MainPage(QMainWindow):
         if right == 0 and self.count - num_move >= 0:
             self.count = self.count - num_move
         elif (right == 1 and (self.count + num_move +
-                self.window_size <= self.ci.data_to_plot.shape[1] / fs)):
+                self.window_size <= self.ci.nsamples / fs)):
             self.count = self.count + num_move
+        if num_move > 0:
+            self.page_step = num_move
         self.slider.setValue(self.count)
         t = get_time(self.count)
         self.time_lbl.setText(t)
 
-        plot_data = np.zeros((self.ci.nchns_to_plot,self.window_size * fs))
-        if self.filter_checked == 1:
-            self.prep_filter_ws()
-            # plot_data = np.zeros(self.filtered_data.shape)
-            plot_data += self.filtered_data
-            stddev = np.std(plot_data)
-            plot_data[plot_data > 3 * stddev] = 3 * stddev  # float('nan') # clip amplitude
-            plot_data[plot_data < -3 * stddev] = -3 * stddev
-        else:
-            plot_data += self.ci.data_to_plot[:,
-                    self.count * fs:(self.count + self.window_size) * fs]
-            stddev = np.std(plot_data)
-            plot_data[plot_data > 5 * stddev] = 5 * stddev  # float('nan') # clip amplitude
-            plot_data[plot_data < -5 * stddev] = -5 * stddev
+        npoints = self.get_plot_npoints()
+        pyramid_vals = None
+        if self.filter_checked == 0:
+            # long windows are drawn from the min/max pyramid
+            pyramid_vals = self.ci.get_pyramid_window(self.count * fs,
+                                                      self.window_size * fs, npoints)
+        save_graph = print_graph == 1 or (not self.argv.export_png_file is None
+                                          and self.init == 0)
+        plot_data = None # every sample is only needed to draw or save the window
+        if pyramid_vals is None or save_graph:
+            plot_data = self.get_plot_data()
 
         nchns = self.ci.nchns_to_plot
         if self.predicted == 1:
@@ -1338,17 +1420,24 @@ class MainPage(QMainWindow):
         else:
             self.pred_label.setText("")
 
+        if pyramid_vals is None:
+            # only draw about 2 points per pixel, keeping the peaks
+            x_vals, y_vals = decimate_min_max(plot_data, npoints)
+        else:
+            x_vals, y_vals = pyramid_vals
+            y_vals = prep_plot_data(y_vals, 5, y_vals)
         if not (len(self.plot_lines) > 0 and len(self.plot_lines) == nchns):
             # self.plotWidget.clear()
             self.main_plot.clear()
+            self.main_pred_overlay.reset()
             self.plot_lines = []
             for i in range(nchns):
                 pen = pg.mkPen(color=self.ci.colors[i], width=2, style=QtCore.Qt.SolidLine)
-                self.plot_lines.append(self.main_plot.plot(plot_data[i, :]
+                self.plot_lines.append(self.main_plot.plot(x_vals, y_vals[i, :]
                              + (i + 1) * y_lim, clickable=False, pen=pen))
         else:
             for i in range(nchns):
-                self.plot_lines[i].setData(plot_data[i, :]
+                self.plot_lines[i].setData(x_vals, y_vals[i, :]
                             + (i + 1) * y_lim)
 
         # add predictions
@@ -1357,93 +1446,44 @@ class MainPage(QMainWindow):
                 self.main_plot.removeItem(a)
             self.rect_list[:] = []
 
-        width = 1 / (nchns + 2)
         if self.predicted == 1:
             blue_brush = QBrush(QColor(38,233,254,50))
-            starts, ends, chns, class_vals = self.pi.compute_starts_ends_chns(self.thresh,
+            starts, ends, chns, class_vals = self.pi.get_segments_in_window(self.thresh,
                                         self.count, self.window_size, fs, nchns)
-            for k in range(len(starts)):
-                if self.pi.pred_by_chn and not self.pi.multi_class:
-                    for i in range(nchns):
-                        if chns[k][i]:
-                            if i == plot_data.shape[0] - 1:
-                                r1 = pg.QtGui.QGraphicsRectItem(starts[k] - self.count *
-                                        fs, y_lim *(i+0.5),
-                                        ends[k] - starts[k], y_lim) # (x, y, w, h)
-                                r1.setPen(pg.mkPen(None))
-                                r1.setBrush(pg.mkBrush(color = (38,233,254,50))) # (r,g,b,alpha)
-                                self.main_plot.addItem(r1)
-                                self.rect_list.append(r1)
-                            else:
-                                r1 = pg.QtGui.QGraphicsRectItem(starts[k] - self.count *
-                                        fs, y_lim *(i + 0.5),
-                                        ends[k] - starts[k], y_lim) # (x, y, w, h)
-                                r1.setPen(pg.mkPen(None))
-                                r1.setBrush(blue_brush) # (r,g,b,alpha)
-                                self.main_plot.addItem(r1)
-                                self.rect_list.append(r1)
-                            x_vals = range(
-                                int(starts[k]) - self.count * fs, int(ends[k]) - self.count * fs)
-                            pen = pg.mkPen(color=self.ci.colors[i], width=3,
-                                            style=QtCore.Qt.SolidLine)
-                            self.plot_lines.append(self.main_plot.plot(x_vals, plot_data[i,
-                                                int(starts[k]) - self.count * fs:int(ends[k]) -
-                                                self.count * fs] + i*y_lim + y_lim,
-                                                clickable=False, pen=pen))
-                elif not self.pi.pred_by_chn and not self.pi.multi_class:
-                    r1 = pg.LinearRegionItem(values=(starts[k] - self.count * fs,
-                                    ends[k] - self.count * fs),
-                                    brush=blue_brush, movable=False,
-                                    orientation=pg.LinearRegionItem.Vertical)
-                    self.main_plot.addItem(r1)
-                    self.rect_list.append(r1)
-                elif not self.pi.pred_by_chn and self.pi.multi_class:
-                    r, g, b, a = self.pi.get_color(class_vals[k])
-                    brush = QBrush(QColor(r, g, b, a))
+            if self.pi.pred_by_chn:
+                self.draw_chn_preds(self.main_pred_overlay, starts, ends, chns,
+                                    x_vals, y_vals, y_lim)
+            else:
+                self.main_pred_overlay.clear()
+                for k in range(len(starts)):
+                    if not self.pi.multi_class:
+                        brush = blue_brush
+                    else:
+                        r, g, b, a = self.pi.get_color(class_vals[k])
+                        brush = QBrush(QColor(r, g, b, a))
                     r1 = pg.LinearRegionItem(values=(starts[k] - self.count * fs,
                                     ends[k] - self.count * fs),
                                     brush=brush, movable=False,
                                     orientation=pg.LinearRegionItem.Vertical)
                     self.main_plot.addItem(r1)
                     self.rect_list.append(r1)
-                else:
-                    for i in range(nchns):
-                        r, g, b, a = self.pi.get_color(chns[k][i])
-                        brush = QBrush(QColor(r, g, b, a))
-                        if i == plot_data.shape[0] - 1:
-                            r1 = pg.QtGui.QGraphicsRectItem(starts[k] - self.count * fs,
-                                    y_lim *(i+0.5),
-                                    ends[k] - starts[k], y_lim) # (x, y, w, h)
-                            r1.setPen(pg.mkPen(None))
-                            r1.setBrush(brush) # (r,g,b,alpha)
-                            self.main_plot.addItem(r1)
-                            self.rect_list.append(r1)
-                        else:
-                            r1 = pg.QtGui.QGraphicsRectItem(starts[k] - self.count * fs,
-                                    y_lim *(i + 0.5),
-                                    ends[k] - starts[k], y_lim) # (x, y, w, h)
-                            r1.setPen(pg.mkPen(None))
-                            r1.setBrush(brush) # (r,g,b,alpha)
-                            self.main_plot.addItem(r1)
-                            self.rect_list.append(r1)
-                        x_vals = range(int(starts[k]) - self.count * fs,
-                                       int(ends[k]) - self.count * fs)
-                        pen = pg.mkPen(color=self.ci.colors[i], width=3,
-                                    style=QtCore.Qt.SolidLine)
-                        self.plot_lines.append(self.main_plot.plot(x_vals,
-                                        plot_data[i, int(starts[k]) -
-                                        self.count * fs:int(ends[k]) - self.count * fs]
-                                        + i * y_lim + y_lim, clickable=False, pen=pen))
-
+        else:
+            self.main_pred_overlay.clear()
 
         step_size = fs  # Updating the x labels with scaling
         step_width = 1
         if self.window_size >= 15 and self.window_size <= 25:
             step_size = step_size * 2
             step_width = step_width * 2
-        elif self.window_size > 25:
+        elif self.window_size > 25 and self.window_size <= 45:
             step_size = step_size * 3
             step_width = step_width * 3
+        elif self.window_size > 45:
+            # no more than 15 ticks for windows of minutes or hours
+            for step_width in [5, 10, 15, 30, 60, 120, 300, 600, 900, 1800, 3600]:
+                if self.window_size / step_width <= 15:
+                    break
+            step_size = step_size * step_width
         x_ticks = []
         spec_x_ticks = []
         for i in range(int(self.window_size / step_width) + 1):
@@ -1475,47 +1515,10 @@ class MainPage(QMainWindow):
         self.main_plot.getAxis('top').setWidth(200)
 
         # add annotations
-        if len(self.ann_list) > 0:
-            for a in self.ann_list:
-                self.main_plot.removeItem(a)
-            self.ann_list[:] = []
-        ann, idx_w_ann = check_annotations(self.count, self.window_size, self.edf_info)
-        font_size = 10
-        if len(ann) != 0:
-            ann = np.array(ann).T
-            txt = ""
-            int_prev = int(float(ann[0, 0]))
-            for i in range(ann.shape[1]):
-                int_i = int(float(ann[0, i]))
-                if int_prev == int_i:
-                    txt = txt + "\n" + ann[2, i]
-                else:
-                    if idx_w_ann[int_prev - self.count] and int_prev % 2 == 1:
-                        txt_item = pg.TextItem(text=txt, color='k', anchor=(0,1))
-                        self.main_plot.addItem(txt_item)
-                        txt_item.setPos((int_prev - self.count)*fs, -(3/2)*y_lim)
-                        self.ann_list.append(txt_item)
-                    else:
-                        txt_item = pg.TextItem(text=txt, color='k', anchor=(0,1))
-                        self.main_plot.addItem(txt_item)
-                        txt_item.setPos((int_prev - self.count)*fs, -y_lim)
-                        self.ann_list.append(txt_item)
-                    txt = ann[2, i]
-                int_prev = int_i
-            if txt != "":
-                if idx_w_ann[int_i - self.count] and int_i % 2 == 1:
-                    txt_item = pg.TextItem(text=txt, color='k', anchor=(0,1))
-                    self.main_plot.addItem(txt_item)
-                    txt_item.setPos((int_i - self.count)*fs, -(3 / 2) *y_lim)
-                    self.ann_list.append(txt_item)
-                else:
-                    txt_item = pg.TextItem(text=txt, color='k', anchor=(0,1))
-                    self.main_plot.addItem(txt_item)
-                    txt_item.setPos((int_i - self.count)*fs, -y_lim)
-                    self.ann_list.append(txt_item)
+        self.draw_annotations(y_lim)
 
         if print_graph == 1 or (not self.argv.export_png_file is None and self.init == 0):
-            self.sii.data = plot_data
+            self.sii.data = np.array(plot_data) # the plot buffer is reused
             self.sii.pi = self.pi
             self.sii.ci = self.ci
             self.sii.predicted = self.predicted
@@ -1720,8 +1723,7 @@ class MainPage(QMainWindow):
             if self.btn_open_stats.text() == "Close signal stats":
                 self.stat_chn_clicked()
             # if data was already filtered do not uncheck box
-            ann = self.edf_info.annotations
-            if len(ann[0]) > 0 and ann[2][0] == "filtered":
+            if self.edf_info.annotations.is_filtered():
                 self.filter_checked = 1
                 cbox.setChecked(True)
             self.call_move_plot(1, 0)
@@ -1729,20 +1731,99 @@ class MainPage(QMainWindow):
             cbox.setChecked(False)
 
     def prep_filter_ws(self):
-        """ Does filtering for one window of size window_size
+        """ Does filtering for one window of size window_size.
         """
-        fs = self.edf_info.fs
-        if (len(self.filtered_data) == 0 or
-                (self.filtered_data.shape !=
-                self.ci.data_to_plot[:,self.count*fs:(self.count +
-                self.window_size)*fs].shape)):
-            self.filtered_data = np.zeros((self.ci.nchns_to_plot,self.window_size * fs))
-        filt_window_size = filter_data(
-            self.ci.data_to_plot[:, self.count * fs:(self.count + self.window_size)*fs],
-                            fs, self.fi, self.argv.show)
+        filt_window_size = self.get_signal_window()
         filt_window_size = np.array(filt_window_size)
         self.filtered_data = filt_window_size
 
+    def get_plot_data(self):
+        """ Gets the signals of the current window clipped to be drawn.
+            They are prepared once for each window in a buffer that is
+            reused, and shared by the main plot, the zoom plot and saving
+            the graph.
+
+            Returns:
+                array of size (nchns_to_plot, window_size * fs), which
+                is overwritten by the next window
+        """
+        key = self._get_window_key(self.count)
+        if (self.plot_data_key is None or self.plot_data_key[0] is not self.ci.montage
+                or self.plot_data_key[1] != key):
+            if self.filter_checked == 1:
+                self.prep_filter_ws()
+                window = self.filtered_data
+                nstd = 3
+            else:
+                window = self.get_signal_window()
+                nstd = 5
+            self.plot_data = prep_plot_data(window, nstd, self.plot_data)
+            self.plot_data_key = (self.ci.montage, key)
+        return self.plot_data
+
+    def _get_window_key(self, count):
+        """ Gets the key of the window starting at count in the prefetcher.
+        """
+        bank = None
+        if self.filter_checked == 1:
+            bank = get_filter_bank(self.edf_info.fs, self.fi)
+        return (count, self.window_size, bank)
+
+    def _compute_signal_window(self, key, fi, show):
+        """ Computes a window of the plotted signals. Filtered windows are
+            sliced from the filtered recording once the background filtering
+            is done, before that they are filtered with a margin of the
+            signal around them.
+
+            Args:
+                key - the key of the window from _get_window_key
+                fi - the FilterInfo the key was made with
+                show - whether to show the filtering progress bar
+            Returns:
+                array of size (nchns_to_plot, window_size * fs), or None if
+                the filtering was canceled
+        """
+        fs = self.edf_info.fs
+        count, window_size, bank = key
+        if bank is None:
+            return self.ci.get_window(count * fs, window_size * fs)
+        window = self.filter_cache.get_window(self.ci, fs, fi, count * fs,
+                                              window_size * fs)
+        if window is None:
+            self.filter_cache.start(self.ci, fs, fi)
+            window = filter_window(self.ci, count * fs, window_size * fs, fs, fi, show)
+        return window
+
+    def get_signal_window(self):
+        """ Gets the plotted signals in the current window, filtered if the
+            filter is on. The windows on either side of it are then computed
+            in the background so that paging does not wait for them.
+
+            Returns:
+                array of size (nchns_to_plot, window_size * fs), which
+                must not be changed
+        """
+        key = self._get_window_key(self.count)
+        window = self.prefetcher.get_window(self.ci, key)
+        if window is None:
+            window = self._compute_signal_window(key, self.fi, self.argv.show)
+            if window is None: # filtering was canceled, show the signals unfiltered
+                window = self.ci.get_window(self.count * self.edf_info.fs,
+                                            self.window_size * self.edf_info.fs)
+            else:
+                self.prefetcher.put_window(self.ci, key, window)
+        keys = []
+        for k in range(1, self.prefetcher.nwindows + 1):
+            for count in [self.count + k * self.page_step, self.count - k * self.page_step]:
+                if 0 <= count <= self.max_time - self.window_size:
+                    keys.append(self._get_window_key(count))
+        # the filter settings can change while the windows are computed
+        fi = copy.copy(self.fi)
+        self.prefetcher.prefetch(self.ci, keys,
+                                 lambda key: self._compute_signal_window(key, fi, 0),
+                                 window.nbytes)
+        return window
+
     def change_filter(self):
         """ Opens the FilterOptions window
         """
@@ -1938,18 +2019,45 @@ class MainPage(QMainWindow):
             var
             line length (for the part of the signal specified)
         """
+        fs = self.edf_info.fs
         if self.filter_checked == 1:
-            self.prep_filter_ws()
-            array_sum = np.sum(self.filtered_data)
-            mean_str = self.filtered_data[self.ssi.chn,s:f].mean()
-            var_str = self.filtered_data[self.ssi.chn,s:f].var()
-            line_len_str = np.sqrt(np.sum(np.diff(self.filtered_data[self.ssi.chn,s:f]) ** 2 + 1))
-        else:
-            mean_str = self.ci.data_to_plot[self.ssi.chn,s:f].mean()
-            var_str = self.ci.data_to_plot[self.ssi.chn,s:f].var()
-            line_len_str = np.sqrt(np.sum(np.diff(self.ci.data_to_plot[self.ssi.chn,s:f]) ** 2 + 1))
-
-        return mean_str, var_str, line_len_str
+            data = self.filter_cache.get_data(self.ci, fs, self.fi)
+            if data is None:
+                # until the whole recording is filtered use the window
+                self.prep_filter_ws()
+                sig = self.filtered_data[self.ssi.chn, s:f]
+                # accumulate in float64 as the signals may be stored as float32
+                mean_str = sig.mean(dtype=np.float64)
+                var_str = sig.var(dtype=np.float64)
+                line_len_str = np.sqrt(np.sum(np.diff(sig) ** 2 + 1, dtype=np.float64))
+                return mean_str, var_str, line_len_str
+            key = (self.ci.montage, get_filter_bank(fs, self.fi))
+            return self.stats_index.get_stats(self.ssi.chn, key, s, f,
+                                              lambda a, b: data[self.ssi.chn, a:b],
+                                              lambda: data[self.ssi.chn])
+
+        def read_signal():
+            # only needed the first time stats are asked for a channel
+            self.load_signals()
+            return self.ci.data_to_plot[self.ssi.chn]
+        return self.stats_index.get_stats(self.ssi.chn, (self.ci.montage,), s, f,
+                                          lambda a, b: self.ci.get_window(a, b - a)[self.ssi.chn],
+                                          read_signal)
+
+    def load_signals(self):
+        """ Reads the whole signal of the plotted channels, in parallel and
+            with a progress bar, unless they are already loaded.
+        """
+        if self.ci.is_loaded():
+            return
+        progress = None
+        if self.argv.show:
+            dialog = QProgressDialog("Loading signals...", None, 0, 0)
+            dialog.setWindowModality(Qt.WindowModal)
+            def progress(nread, ntotal):
+                dialog.setMaximum(ntotal)
+                dialog.setValue(nread)
+        self.ci.load(os.cpu_count(), progress)
 
     def get_power_band_stats(self, s, f):
         """ Get power band stats
@@ -1961,6 +2069,7 @@ class MainPage(QMainWindow):
         Returns:
             dict holding fs values (ex: {'alpha': #...})
         """
+        self.load_signals()
         data = self.ci.data_to_plot[self.ssi.chn,:]
         lp = 0
         hp = 0
@@ -2026,6 +2135,8 @@ def get_args():
             --plot-title : title for the saved png
             --save-edf-fn : name and location to save the edf
             --anonymize-edf : anonymize fields in saved file or not
+            --cache-dir : directory to cache decoded edf files in
+            --signal-dtype : float32 or float64, the type signals are held as
     """
     p = ap.ArgumentParser()
 
@@ -2039,7 +2150,7 @@ def get_args():
     p.add_argument("--export-png-file", type=str,
                     help="Where to save image.")
     p.add_argument("--window-width", type=int, default=10,
-                   choices=[5, 10, 15, 20, 25, 30],
+                   choices=[5, 10, 15, 20, 25, 30, 60, 120, 300, 600, 1800, 3600, 7200],
                     help="The width of signals on the plot.")
     p.add_argument("--filter", nargs=6, type=float, default=[0,30,2,0,0,0],
                     help="1 or 0 to set the filter. Low pass, high pass, notch," +
@@ -2053,6 +2164,11 @@ def get_args():
     p.add_argument("--save-edf-fn", type=str, default=None)
     p.add_argument("--anonymize-edf", type=int, default=1, choices=[0,1])
     p.add_argument("--prediction-thresh", type=float, default=0.5)
+    p.add_argument("--cache-dir", type=str, default=None,
+                    help="Directory to cache decoded EDF files in so they reopen quickly.")
+    p.add_argument("--signal-dtype", type=str, default="float32",
+                    choices=["float32", "float64"],
+                    help="Type to hold signals as, float32 uses half the memory.")
 
     return p.parse_args()
 
@@ -1,9 +1,38 @@
 """ Utility functions for plot.py """
-from copy import deepcopy
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from fractions import Fraction
+import math
+import os
 import numpy as np
 from PyQt5.QtCore import Qt
 from PyQt5.QtWidgets import QProgressDialog
 from preprocessing import dsp
+from preprocessing.annotation_store import to_annotation_store
+
+def _group_annotations(ann, t_start, window_size):
+    """ Groups the annotations in a window by the second they start in.
+
+    Args:
+        ann - an AnnotationStore
+        t_start - start time for a graph
+        window_size - the number of seconds being plotted at a time
+
+    Returns:
+        lo, hi - the annotations in the window are lo to hi
+        first - the index from lo of the first annotation of each group
+        secs - the second each group starts in
+        adjacent - whether each group has a group in the second before
+                   or after it, within the window
+    """
+    lo, hi = ann.search(t_start, t_start + window_size)
+    onset_secs = ann.onsets[lo:hi].astype(int)
+    first = np.flatnonzero(np.diff(onset_secs, prepend=t_start - 1))
+    secs = onset_secs[first]
+    next_to = np.diff(secs) == 1
+    adjacent = np.zeros(len(secs), dtype=bool)
+    adjacent[1:] |= next_to
+    adjacent[:-1] |= next_to
+    return lo, hi, first, secs, adjacent
 
 def check_annotations(t_start, window_size, edf_info):
     """ Checks to see if there are any anotations in the range t_start to t_end sec
@@ -14,56 +43,58 @@ def check_annotations(t_start, window_size, edf_info):
         edf_info - edf_info object containing annotations
 
     Returns:
-        ret - an array that is filled with any annotations[t_start:t_end]
+        ret - a list of (onset, duration, text) for annotations[t_start:t_end]
         idx_w_ann - an array of size window_size that tells whether or not there is
                     an adjacent annotation
     """
-
-    ann = edf_info.annotations
-    t_end = t_start + window_size - 1
-    i = 0
-    ret = []
+    ann = to_annotation_store(edf_info.annotations)
+    lo, hi, _, secs, adjacent = _group_annotations(ann, t_start, window_size)
+    ret = [ann.get(i) for i in range(lo, hi)]
     idx_w_ann = np.zeros((window_size))
+    idx_w_ann[secs[adjacent] - t_start] = 1
+    return ret, idx_w_ann
 
-    if len(ann[0]) != 0:
-        ann_i = int(float(ann[0,i]))
-        while ann_i <= t_end and i < ann.shape[1]:
-            if int(float(ann[0,i])) >= t_start and int(float(ann[0,i])) <= t_end:
-                ret.append(ann[:,i])
-                idx_w_ann[int(float(ann[0,i]))-t_start] = 1
-                i += 1
-            elif int(float(ann[0,i])) <= t_end:
-                i += 1
-            else:
-                i = ann.shape[1]
-    else:
-        return ret, idx_w_ann
-
-    if window_size > 1:
-        if not(idx_w_ann[0] == 1 and idx_w_ann[1] == 1):
-            idx_w_ann[0] = 0
-        i = 1
-        while i < window_size - 1:
-            if not((idx_w_ann[i-1] == 1 or idx_w_ann[i+1] == 1) and idx_w_ann[i] == 1):
-                idx_w_ann[i] = 0
-            i += 1
-        if idx_w_ann[window_size - 2] == 0 and idx_w_ann[window_size - 1] == 1:
-            idx_w_ann[window_size - 1] = 0
+def get_annotation_labels(t_start, window_size, edf_info, cache=None):
+    """ Gets the labels to draw for the annotations in a window.
+        Annotations starting in the same second share a label, and labels
+        in odd seconds next to another label are raised so they do not
+        overlap.
 
-    return ret, idx_w_ann
+    Args:
+        t_start - start time for a graph
+        window_size - the number of seconds being plotted at a time
+        edf_info - edf_info object containing annotations
+        cache - optional dict holding the labels of the last window, so
+            redrawing the same window with unchanged annotations is free
 
-def filter_data(data, fs, fi, show=1):
-    """ Filters the data.
-        Progress bar is created if the process is estimated to take > 4s
+    Returns:
+        secs - the second of each label from t_start
+        texts - the text of each label
+        raised - whether each label is raised
+    """
+    ann = to_annotation_store(edf_info.annotations)
+    key = (ann, ann.version, t_start, window_size)
+    if cache is not None and cache.get("key") == key:
+        return cache["labels"]
+    lo, hi, first, secs, adjacent = _group_annotations(ann, t_start, window_size)
+    ends = np.append(first[1:], hi - lo)
+    texts = ["\n".join(ann.texts(lo + a, lo + b)) for a, b in zip(first, ends)]
+    raised = adjacent & (secs % 2 == 1)
+    labels = (secs - t_start, texts, raised)
+    if cache is not None:
+        cache["key"] = key
+        cache["labels"] = labels
+    return labels
+
+def get_filter_bank(fs, fi):
+    """ Gets the filters to apply for the filter settings.
 
     Args:
-        data - the data to filter
         fs - the fs
         fi - a filterInfo object
-        show - can be set to 0 for testing purposes so as not to show the
-            filtering progress bar
     Returns:
-        filtered data
+        a dsp.FilterBank with the filters that are on and valid for fs,
+        designed only once for each setting
     """
     lp = fi.lp
     hp = fi.hp
@@ -79,56 +110,185 @@ def filter_data(data, fs, fi, show=1):
         bp2 = 0
     if fi.do_notch == 0 or fi.notch < 0 or fi.notch > fs / 2:
         notch = 0
+    return dsp.get_filter_bank(fs, notch, lp, hp, bp1, bp2)
+
+def filter_data(data, fs, fi, show=1, nworkers=None):
+    """ Filters the data.
+        Progress bar is created if the process is estimated to take > 4s
 
-    nchns = len(data)
-    filt_bufs = deepcopy(data)
+    Args:
+        data - the data to filter
+        fs - the fs
+        fi - a filterInfo object
+        show - can be set to 0 for testing purposes so as not to show the
+            filtering progress bar
+        nworkers - the number of threads to filter with, defaults to
+            the number of CPUs. Groups of channels are filtered in parallel.
+    Returns:
+        filtered data, or None if the filtering was canceled, in which
+        case fi.filter_canceled is set
+    """
+    bank = get_filter_bank(fs, fi)
+    data = np.asarray(data)
+    filt_bufs = np.empty_like(data)
+    if len(bank.stages) == 0 or data.shape[0] == 0:
+        filt_bufs[:] = data
+        return filt_bufs
+
+    if nworkers is None:
+        nworkers = os.cpu_count()
+    nchns = data.shape[0]
+    # Several groups per thread so that progress is updated often
+    ngroups = min(nchns, nworkers * 4)
+    groups = np.array_split(np.arange(nchns), ngroups)
 
     # For testing purposes, progress dialogue will not work if show is false
+    fi.filter_canceled = 0
     if show:
-        progress = QProgressDialog("Filtering...", "Cancel", 0, nchns * 4)
+        progress = QProgressDialog("Filtering...", "Cancel", 0, ngroups)
         progress.setWindowModality(Qt.WindowModal)
 
-    i = 0
-    for chn in range(nchns):
-        # Notch
-        if notch > 0:
-            filt_bufs[chn] = dsp.apply_notch(filt_bufs[chn], fs, fi.notch)
-        i += 1
-        if show:
-            progress.setValue(i)
-            if progress.wasCanceled():
-                fi.filter_canceled = 1
-                break
-        # LPF
-        if lp > 0:
-            filt_bufs[chn] = dsp.apply_low_pass(filt_bufs[chn], fs, lp)
-        i += 1
-        if show:
-            progress.setValue(i)
-            if progress.wasCanceled():
-                fi.filter_canceled = 1
-                break
-        # HPF
-        if hp > 0:
-            filt_bufs[chn] = dsp.apply_high_pass(filt_bufs[chn], fs, hp)
-        i += 1
-        if show:
-            progress.setValue(i)
-            if progress.wasCanceled():
-                fi.filter_canceled = 1
-                break
-        # BPF
-        if bp1 > 0:
-            filt_bufs[chn] = dsp.apply_band_pass(filt_bufs[chn], fs, [bp1, bp2])
-        i += 1
-        if show:
-            progress.setValue(i)
-            if progress.wasCanceled():
-                fi.filter_canceled = 1
-                break
+    def _filter_group(chns):
+        filt_bufs[chns] = bank.apply(data[chns])
+
+    with ThreadPoolExecutor(max_workers=nworkers) as executor:
+        futures = [executor.submit(_filter_group, chns) for chns in groups]
+        for i, future in enumerate(as_completed(futures)):
+            future.result()
+            if show:
+                progress.setValue(i + 1)
+                if progress.wasCanceled():
+                    fi.filter_canceled = 1
+                    for f in futures:
+                        f.cancel()
+                    # some groups were never filtered
+                    return None
 
     return filt_bufs
 
+def filter_window(ci, start, n, fs, fi, show=1):
+    """ Filters a window of the plotted signals. Samples on either side of
+        the window are filtered with it and then dropped, so the window
+        matches filtering the whole signal.
+
+    Args:
+        ci - the ChannelInfo object of the plotted signals
+        start - the first sample of the window
+        n - the number of samples in the window
+        fs - the fs
+        fi - a filterInfo object
+        show - whether to show the filtering progress bar
+    Returns:
+        array of size (nchns_to_plot, n) of filtered data, or None if the
+        filtering was canceled
+    """
+    margin = get_filter_bank(fs, fi).margin
+    pad_start = max(0, start - margin)
+    pad_end = min(ci.nsamples, start + n + margin)
+    if pad_end <= start:
+        return ci.get_window(start, n)
+    filt_bufs = filter_data(ci.get_window(pad_start, pad_end - pad_start), fs, fi, show)
+    if filt_bufs is None:
+        return None
+    # samples past the end of the signal are zero
+    window = np.zeros((filt_bufs.shape[0], n), dtype=filt_bufs.dtype)
+    filt_window = filt_bufs[:, start - pad_start:start - pad_start + n]
+    window[:, :filt_window.shape[1]] = filt_window
+    return window
+
+def prep_plot_data(data, nstd, out=None, scale=None):
+    """ Prepares signals to be drawn. Each signal is optionally scaled and
+        then clipped to nstd standard deviations of the whole window.
+
+    Args:
+        data - array of size (nchns, n)
+        nstd - the number of standard deviations to clip at
+        out - array to write the result to so it can be reused for each
+            window, a new array is made if it is None or does not match data
+        scale - optional array of size (nchns,) to multiply each signal by
+    Returns:
+        out, the signals to draw
+    """
+    if out is None or out.shape != data.shape or out.dtype != data.dtype:
+        out = np.empty(data.shape, dtype=data.dtype)
+    if scale is not None:
+        np.multiply(data, np.reshape(scale, (-1, 1)), out=out, casting="unsafe")
+        data = out
+    lim = nstd * np.std(data)
+    np.clip(data, -lim, lim, out=out)
+    return out
+
+def decimate_min_max(data, npoints):
+    """ Reduces each signal to about npoints points to draw. The min and max
+        of each group of samples are kept so that peaks are still drawn.
+
+    Args:
+        data - array of size (nchns, n)
+        npoints - about how many points to keep for each signal
+    Returns:
+        x - the sample each point is at
+        y - array of size (nchns, len(x)) of the points to draw
+    """
+    n = data.shape[1]
+    nbins = npoints // 2
+    if nbins < 1 or n <= npoints:
+        return np.arange(n), data
+    bin_size = int(np.ceil(n / nbins))
+    nbins = int(np.ceil(n / bin_size))
+    # repeat the last sample so the last group is full
+    padded = np.concatenate((data, np.repeat(data[:, -1:], nbins * bin_size - n, axis=1)),
+                            axis=1)
+    bins = padded.reshape(data.shape[0], nbins, bin_size)
+    y = np.empty((data.shape[0], nbins * 2), dtype=data.dtype)
+    y[:, 0::2] = np.min(bins, axis=2)
+    y[:, 1::2] = np.max(bins, axis=2)
+    x = np.arange(nbins * 2) * (bin_size / 2)
+    return x, y
+
+def get_record_duration(freqs):
+    """ Gets the data record duration used when saving signals to .edf
+        file, the fewest seconds that hold a whole number of samples of
+        each signal. This is 1s unless a fs is not a whole number.
+
+    Args:
+        freqs - the fs of each signal
+    Returns:
+        the record duration in seconds
+    """
+    duration = 1
+    for f in freqs:
+        denominator = Fraction(f).limit_denominator(10000000).denominator
+        duration = duration * denominator // math.gcd(duration, denominator)
+    return duration
+
+def get_window_size_text(window_size):
+    """ Gets the text for a window size in the window size combobox.
+
+    Args:
+        window_size - the window size in seconds
+    Returns:
+        the text, such as "10s", "5min" or "1h"
+    """
+    if window_size >= 3600 and window_size % 3600 == 0:
+        return str(window_size // 3600) + "h"
+    if window_size >= 60 and window_size % 60 == 0:
+        return str(window_size // 60) + "min"
+    return str(window_size) + "s"
+
+def get_window_size(text):
+    """ Gets the window size for text from the window size combobox.
+
+    Args:
+        text - the text, such as "10s", "5min" or "1h"
+    Returns:
+        the window size in seconds
+    """
+    if text.endswith("h"):
+        return int(text[:-1]) * 3600
+    if text.endswith("min"):
+        return int(text[:-3]) * 60
+    return int(text.split("s")[0])
+
 def convert_from_count(count):
     """ Converts time from count (int in seconds) to the time format
         hh:mm:ss.
@@ -26,6 +26,11 @@ class PredictionInfo():
         self.pred_by_chn = 0 # whether or not we are predicting by channel
         self.multi_class = 0 # whether or not we are doing multi-class predictions
         self.predicted = 0
+        self._pred_index = None # see _get_pred_index
+        self._pred_index_preds = None # the predictions _pred_index is for
+        self._pred_index_key = None
+        self._segments = None # see get_segments
+        self._segments_index = None # the _pred_index _segments is for
         # default colors to use for multi-class:
         # transparent, dark blue, green, yellow, red, pink, purple
         self.class_colors = [(255,255,255,0),(50, 95, 168, 50), (50, 168, 82,50), (168, 52, 50, 50),
@@ -192,6 +197,131 @@ class PredictionInfo():
                 self.preds = preds
         return ret
 
+    def _get_pred_index(self, thresh, nchns):
+        """ Gets the arrays used to find the predictions in a window. They
+            are only computed again when the predictions, threshold or
+            number of channels change.
+
+            Args:
+                thresh - the threshold
+                nchns - the number of plotted channels
+            Returns:
+                dict with "edges", the first sample of each prediction and
+                the end of the last one, and the value of each prediction:
+                "above" and "chns" for binary predictions, "class_vals"
+                and "chns" for multi-class predictions
+        """
+        preds = self.preds_to_plot
+        key = (thresh, nchns, self.pred_width, self.pred_by_chn, self.multi_class)
+        if self._pred_index_preds is preds and self._pred_index_key == key:
+            return self._pred_index
+        preds = np.asarray(preds)
+        npreds = preds.shape[0]
+        index = {"edges": np.arange(npreds + 1) * self.pred_width}
+        if self.multi_class:
+            index["class_vals"] = np.argmax(preds.reshape(npreds, -1), axis=1)
+            if self.pred_by_chn:
+                index["chns"] = np.argmax(preds, axis=2)
+        else:
+            index["above"] = np.max(preds.reshape(npreds, -1), axis=1) > thresh
+            if self.pred_by_chn:
+                # channels are plotted bottom to top
+                preds_flipped = preds[:, ::-1]
+                preds_mutli_chn = np.zeros((npreds, nchns))
+                if preds.shape[1] >= nchns:
+                    preds_mutli_chn += preds_flipped[:, preds.shape[1] - nchns:]
+                else:
+                    preds_mutli_chn[:, nchns - preds.shape[1]:] += preds_flipped
+                index["chns"] = preds_mutli_chn > thresh
+        self._pred_index_preds = self.preds_to_plot
+        self._pred_index_key = key
+        self._pred_index = index
+        return index
+
+    def get_segments(self, thresh, nchns):
+        """ Merges consecutive predictions with the same value into segments.
+            They are only computed again when the predictions, threshold or
+            number of channels change.
+
+            Args:
+                thresh - the threshold
+                nchns - the number of plotted channels
+            Returns:
+                starts - the first sample of each segment
+                ends - the sample after the end of each segment
+                vals - the value of each segment: True for binary predictions,
+                    the channels above the threshold for binary predictions by
+                    channel, the class for multi-class predictions or the
+                    class of each channel for multi-class predictions by channel
+        """
+        index = self._get_pred_index(thresh, nchns)
+        if self._segments_index is index:
+            return self._segments
+        edges = index["edges"]
+        npreds = len(edges) - 1
+        if self.multi_class:
+            keep = np.ones(npreds, dtype=bool)
+            vals = index["chns"] if self.pred_by_chn else index["class_vals"]
+        else:
+            keep = index["above"]
+            vals = index["chns"] if self.pred_by_chn else keep
+        # a segment starts wherever a prediction differs from the one before
+        rows = np.reshape(vals, (npreds, -1))
+        change = np.ones(npreds, dtype=bool)
+        change[1:] = (keep[1:] != keep[:-1]) | np.any(rows[1:] != rows[:-1], axis=1)
+        firsts = np.flatnonzero(change)
+        lasts = np.append(firsts[1:], npreds)
+        firsts, lasts = firsts[keep[firsts]], lasts[keep[firsts]]
+        self._segments = (edges[firsts], edges[lasts], vals[firsts])
+        self._segments_index = index
+        return self._segments
+
+    def get_segments_in_window(self, thresh, count, ws, fs, nchns):
+        """ Gets the segments from get_segments in a window, cut at the
+            edges of the window.
+
+            Args:
+                thresh - the threshold
+                count - the current time in seconds
+                ws - the current window_size in seconds
+                fs - the frequency
+                nchns - the number of plotted channels
+            Returns:
+                starts, ends, chns, class_vals as from compute_starts_ends_chns
+        """
+        start_t = count * fs
+        end_t = start_t + ws * fs
+        starts, ends, vals = self.get_segments(thresh, nchns)
+        first = np.searchsorted(ends, start_t, side="right")
+        last = np.searchsorted(starts, end_t, side="left")
+        seg_starts = np.maximum(starts[first:last], start_t)
+        seg_ends = np.minimum(ends[first:last], end_t)
+        chns = []
+        class_vals = []
+        if self.pred_by_chn:
+            chns = list(vals[first:last])
+        elif self.multi_class:
+            class_vals = vals[first:last].tolist()
+        return seg_starts.tolist(), seg_ends.tolist(), chns, class_vals
+
+    def get_next_segment(self, thresh, nchns, sample):
+        """ Finds the next detection, the first segment starting at or after
+            sample with a channel above the threshold or a class other than 0.
+
+            Args:
+                thresh - the threshold
+                nchns - the number of plotted channels
+                sample - the sample to search from
+            Returns:
+                the first sample of the segment, or -1 if there is none
+        """
+        starts, _, vals = self.get_segments(thresh, nchns)
+        detected = np.any(np.reshape(vals, (len(starts), -1)) != 0, axis=1)
+        idxs = np.flatnonzero(detected & (starts >= sample))
+        if len(idxs) == 0:
+            return -1
+        return starts[idxs[0]]
+
     def compute_starts_ends_chns(self, thresh, count, ws, fs, nchns):
         """
         Computes start / end / chn values of predictions in given window in samples
@@ -211,90 +341,35 @@ class PredictionInfo():
         """
         start_t = count * fs
         end_t = start_t + ws * fs
-        starts = []
-        ends = []
-        chns = []
-        class_vals = []
-        pw = self.pred_width
-
-        if self.pred_by_chn and not self.multi_class:
-            preds_flipped = np.zeros(self.preds_to_plot.shape)
-            for i in range(preds_flipped.shape[1]):
-                preds_flipped[:,i] += self.preds_to_plot[:,self.preds_to_plot.shape[1] - i - 1]
+        index = self._get_pred_index(thresh, nchns)
+        edges = index["edges"]
+        npreds = len(edges) - 1
 
-            preds_mutli_chn = np.zeros((self.preds_to_plot.shape[0], nchns))
-            if self.preds_to_plot.shape[1] >= nchns:
-                preds_mutli_chn += preds_flipped[:,self.preds_to_plot.shape[1] - nchns:]
-            else:
-                preds_mutli_chn[:,nchns - self.preds_to_plot.shape[1]:] += preds_flipped
-        if self.pred_by_chn and self.multi_class:
-            preds_flipped = np.zeros(self.preds_to_plot.shape)
-            for i in range(preds_flipped.shape[1]):
-                preds_flipped[:,i,:] += self.preds_to_plot[:,self.preds_to_plot.shape[1] - i - 1,:]
+        # the predictions that start in the window
+        first = int(np.searchsorted(edges, start_t, side="left"))
+        last = int(np.searchsorted(edges, end_t, side="left"))
+        first = min(first, npreds)
+        last = min(last, npreds)
+        idxs = np.arange(first, last)
+        starts = edges[idxs]
+        ends = edges[idxs + 1]
+        if not self.multi_class and len(idxs) > 0 and ends[-1] > end_t:
+            ends[-1] = end_t # the last binary prediction is cut at the window
+        # the prediction the window starts in the middle of
+        if 0 < first <= npreds and edges[first - 1] < start_t < edges[first]:
+            idxs = np.concatenate(([first - 1], idxs))
+            starts = np.concatenate(([start_t], starts))
+            ends = np.concatenate(([edges[first]], ends))
 
-            preds_mutli_chn_multi_class = np.zeros((self.preds_to_plot.shape[0],
-                        nchns, self.preds_to_plot.shape[2]))
-            if self.preds_to_plot.shape[1] >= nchns:
-                preds_mutli_chn_multi_class += (
-                    preds_flipped[:,self.preds_to_plot.shape[1] - nchns:,:])
-            else:
-                preds_mutli_chn[:,nchns - self.preds_to_plot.shape[1]:,:] += preds_flipped
-
-        i = 0
-        while i * pw < start_t: # find starting value
-            i += 1
-        i -= 1
-        if i * pw < start_t < (i + 1) * pw:
-            if self.multi_class:
-                starts.append(start_t)
-                ends.append((i + 1) * pw)
-                val = np.argmax(self.preds_to_plot[i])
-                class_vals.append(val)
-                if self.pred_by_chn:
-                    val = np.argmax(self.preds_to_plot[i], axis=1)
-                    chns.append(val)
-            else:
-                if np.max(self.preds_to_plot[i]) > thresh:
-                    starts.append(start_t)
-                    ends.append((i + 1) * pw)
-                    if self.pred_by_chn:
-                        chn_i = preds_mutli_chn[i] > thresh
-                        chns.append(chn_i)
-            i += 1
-        while i * pw < start_t: # find starting value
-            i += 1
-        while i * pw < end_t:
-            if (i + 1) * pw > end_t:
-                if self.multi_class:
-                    starts.append(i * pw)
-                    ends.append((i + 1) * pw)
-                    val = np.argmax(self.preds_to_plot[i])
-                    class_vals.append(val)
-                    if self.pred_by_chn:
-                        val = np.argmax(self.preds_to_plot[i],axis=1)
-                        chns.append(val)
-                    return starts, ends, chns, class_vals
-                else:
-                    if np.max(self.preds_to_plot[i]) > thresh:
-                        starts.append(i * pw)
-                        ends.append(end_t)
-                        if self.pred_by_chn:
-                            chn_i = preds_mutli_chn[i] > thresh
-                            chns.append(chn_i)
-                        return starts, ends, chns, class_vals
-            if self.multi_class:
-                starts.append(i * pw)
-                ends.append((i + 1) * pw)
-                val = np.argmax(self.preds_to_plot[i])
-                class_vals.append(val)
-                if self.pred_by_chn:
-                    val = np.argmax(self.preds_to_plot[i],axis=1)
-                    chns.append(val)
-            elif np.max(self.preds_to_plot[i]) > thresh:
-                starts.append(i * pw)
-                ends.append((i + 1) * pw)
-                if self.pred_by_chn:
-                    chn_i = preds_mutli_chn[i] > thresh
-                    chns.append(chn_i)
-            i += 1
-        return starts, ends, chns, class_vals
+        if self.multi_class:
+            class_vals = index["class_vals"][idxs].tolist()
+        else:
+            keep = index["above"][idxs]
+            idxs = idxs[keep]
+            starts = starts[keep]
+            ends = ends[keep]
+            class_vals = []
+        chns = []
+        if self.pred_by_chn:
+            chns = list(index["chns"][idxs])
+        return starts.tolist(), ends.tolist(), chns, class_vals
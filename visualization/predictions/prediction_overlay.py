@@ -0,0 +1,111 @@
+""" Module for drawing channel-wise predictions on a plot """
+import numpy as np
+import pyqtgraph as pg
+from PyQt5.QtCore import QRectF
+from PyQt5.QtGui import QPainterPath, QColor
+from PyQt5.QtWidgets import QGraphicsPathItem
+
+class PredictionOverlay():
+    """ Draws channel-wise predictions on a plot.
+
+        All of the prediction boxes on a channel with the same color are
+        drawn as one path, and the parts of the signal they cover as one
+        thicker line, so the number of items does not grow with the number
+        of predictions. The items are kept and updated for each window.
+    """
+
+    def __init__(self, plot):
+        """ Constructor for the prediction overlay.
+
+            Args:
+                plot - the PlotItem to draw on
+        """
+        self.plot = plot
+        self.boxes = {} # (chn, color) -> QGraphicsPathItem of the boxes
+        self.lines = {} # chn -> PlotDataItem of the highlighted signal
+
+    def reset(self):
+        """ Forgets the items, used when the plot has been cleared.
+        """
+        self.boxes = {}
+        self.lines = {}
+
+    def clear(self):
+        """ Hides the predictions.
+        """
+        for box in self.boxes.values():
+            box.setPath(QPainterPath())
+        for line in self.lines.values():
+            line.setData([], [])
+
+    def set_preds(self, starts, ends, vals, colors, x, y, y_lim, line_colors):
+        """ Draws the predictions in a window.
+
+            Args:
+                starts - the start of each prediction, in samples from the
+                    start of the window
+                ends - the end of each prediction
+                vals - array of size (npreds, nchns), the key of the color
+                    of each box in colors, or -1 where there is no box
+                colors - dict of (r, g, b, alpha) colors
+                x - the sample of each point of the plotted signals
+                y - array of size (nchns, len(x)) of the plotted signals
+                y_lim - the space between signals
+                line_colors - the color of each signal
+        """
+        if len(starts) == 0:
+            self.clear()
+            return
+        starts = np.asarray(starts, dtype=float)
+        ends = np.asarray(ends, dtype=float)
+        vals = np.asarray(vals).reshape(len(starts), -1)
+        used = set()
+        for i in range(vals.shape[1]):
+            for val in np.unique(vals[:, i]):
+                if val < 0:
+                    continue
+                path = QPainterPath()
+                for k in np.flatnonzero(vals[:, i] == val):
+                    path.addRect(QRectF(starts[k], y_lim * (i + 0.5),
+                                        ends[k] - starts[k], y_lim))
+                self._get_box(i, colors[val]).setPath(path)
+                used.add((i, colors[val]))
+            self._set_line(i, starts[vals[:, i] >= 0], ends[vals[:, i] >= 0],
+                           x, y[i] + (i + 1) * y_lim, line_colors[i])
+        for key, box in self.boxes.items():
+            if key not in used:
+                box.setPath(QPainterPath())
+        for chn, line in self.lines.items():
+            if chn >= vals.shape[1]:
+                line.setData([], [])
+
+    def _get_box(self, chn, color):
+        """ Gets the path item for the boxes of one color on a channel.
+        """
+        if (chn, color) not in self.boxes:
+            box = QGraphicsPathItem()
+            box.setPen(pg.mkPen(None))
+            box.setBrush(pg.mkBrush(QColor(*[int(c) for c in color])))
+            self.plot.addItem(box)
+            self.boxes[(chn, color)] = box
+        return self.boxes[(chn, color)]
+
+    def _set_line(self, chn, starts, ends, x, y, color):
+        """ Draws the parts of a signal covered by predictions as a thicker
+            line, with gaps between the predictions.
+        """
+        pen = pg.mkPen(color=color, width=3)
+        if chn not in self.lines:
+            self.lines[chn] = self.plot.plot([], [], clickable=False, pen=pen,
+                                             connect="finite")
+        else:
+            self.lines[chn].setPen(pen)
+        # the number of predictions covering each point
+        covered = np.zeros(len(x) + 1, dtype=int)
+        np.add.at(covered, np.searchsorted(x, starts), 1)
+        np.add.at(covered, np.searchsorted(x, ends), -1)
+        covered = np.cumsum(covered[:-1]) > 0
+        if not np.any(covered):
+            self.lines[chn].setData([], [])
+            return
+        self.lines[chn].setData(x, np.where(covered, y, np.nan))
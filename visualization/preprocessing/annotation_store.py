@@ -0,0 +1,182 @@
+""" Module for holding the annotations of an edf file """
+import numpy as np
+
+FILTERED_TXT = "filtered"
+NFILTER_ANN = 5 # "filtered" followed by the LP, HP, N and BP settings
+
+
+class AnnotationStore():
+    """ Holds annotations sorted by onset.
+
+        Onsets and durations are kept as floats and the text of each
+        annotation as an id into a list of unique labels, so files with
+        many repeated event markers hold each label only once. Range
+        queries are done with searchsorted, and edits shift the arrays in
+        place rather than copying them.
+    """
+
+    def __init__(self, onsets=(), durations=(), texts=()):
+        """ Constructor for the annotation store.
+
+            Args:
+                onsets - the onset of each annotation in seconds
+                durations - the duration of each annotation, -1 if none
+                texts - the text of each annotation
+        """
+        onsets = np.asarray(onsets, dtype=np.float64).ravel()
+        durations = np.asarray(durations, dtype=np.float64).ravel()
+        self.version = 0 # changed by every edit
+        self.labels = [] # the unique texts
+        self._label_ids = {} # text -> index into labels
+        ids = np.array([self._intern(str(txt)) for txt in texts], dtype=np.int32)
+        order = np.argsort(onsets, kind="stable")
+        self.n = len(order)
+        capacity = max(self.n, 16)
+        self._onsets = np.empty(capacity, dtype=np.float64)
+        self._durations = np.empty(capacity, dtype=np.float64)
+        self._ids = np.empty(capacity, dtype=np.int32)
+        self._onsets[:self.n] = onsets[order]
+        self._durations[:self.n] = durations[order]
+        self._ids[:self.n] = ids[order]
+
+    def __len__(self):
+        return self.n
+
+    @property
+    def onsets(self):
+        """ The onsets, sorted. """
+        return self._onsets[:self.n]
+
+    @property
+    def durations(self):
+        """ The durations, in the order of onsets. """
+        return self._durations[:self.n]
+
+    @property
+    def label_ids(self):
+        """ The index into labels of each annotation. """
+        return self._ids[:self.n]
+
+    def _intern(self, txt):
+        """ Gets the id of a text, adding it to labels if it is new.
+        """
+        label_id = self._label_ids.get(txt)
+        if label_id is None:
+            label_id = len(self.labels)
+            self._label_ids[txt] = label_id
+            self.labels.append(txt)
+        return label_id
+
+    def text(self, i):
+        """ Gets the text of annotation i.
+        """
+        return self.labels[self._ids[i]]
+
+    def texts(self, lo=0, hi=None):
+        """ Gets the texts of annotations lo to hi.
+        """
+        if hi is None:
+            hi = self.n
+        return [self.labels[label_id] for label_id in self._ids[lo:hi]]
+
+    def get(self, i):
+        """ Gets annotation i.
+
+            Returns:
+                (onset, duration, text)
+        """
+        return float(self._onsets[i]), float(self._durations[i]), self.text(i)
+
+    def search(self, t_start, t_end):
+        """ Finds the annotations with onsets in [t_start, t_end).
+
+            Returns:
+                lo, hi - the annotations are lo to hi
+        """
+        onsets = self.onsets
+        lo = np.searchsorted(onsets, t_start, side="left")
+        hi = np.searchsorted(onsets, t_end, side="left")
+        return int(lo), int(hi)
+
+    def _grow(self):
+        """ Doubles the capacity of the arrays.
+        """
+        capacity = 2 * len(self._onsets)
+        for name in ("_onsets", "_durations", "_ids"):
+            old = getattr(self, name)
+            new = np.empty(capacity, dtype=old.dtype)
+            new[:self.n] = old[:self.n]
+            setattr(self, name, new)
+
+    def find_insert(self, onset):
+        """ Gets the index an annotation with this onset is inserted at,
+            after any others with the same onset.
+        """
+        return int(np.searchsorted(self.onsets, onset, side="right"))
+
+    def insert(self, onset, duration, txt):
+        """ Inserts an annotation after any others with the same onset.
+
+            Returns:
+                the index of the new annotation
+        """
+        if self.n == len(self._onsets):
+            self._grow()
+        i = self.find_insert(onset)
+        for arr, val in ((self._onsets, onset), (self._durations, duration),
+                         (self._ids, self._intern(str(txt)))):
+            arr[i + 1:self.n + 1] = arr[i:self.n]
+            arr[i] = val
+        self.n += 1
+        self.version += 1
+        return i
+
+    def remove(self, i):
+        """ Removes annotation i.
+        """
+        for arr in (self._onsets, self._durations, self._ids):
+            arr[i:self.n - 1] = arr[i + 1:self.n]
+        self.n -= 1
+        self.version += 1
+
+    def update(self, i, onset, duration, txt):
+        """ Changes annotation i, moving it if its onset changed.
+
+            Returns:
+                the new index of the annotation
+        """
+        if onset == self._onsets[i]:
+            self._durations[i] = duration
+            self._ids[i] = self._intern(str(txt))
+            self.version += 1
+            return i
+        self.remove(i)
+        return self.insert(onset, duration, txt)
+
+    def is_filtered(self):
+        """ Whether the file was saved filtered, in which case the first
+            annotations hold the filter settings.
+        """
+        return self.n > 0 and self.text(0) == FILTERED_TXT
+
+    def to_array(self):
+        """ Gets the annotations as the 3 x N string array pyedflib uses.
+        """
+        return np.array([self.onsets.astype(str), self.durations.astype(str),
+                         self.texts()])
+
+
+def to_annotation_store(ann):
+    """ Gets annotations as an AnnotationStore.
+
+        Args:
+            ann - an AnnotationStore, or the (onsets, durations, texts)
+                returned by pyedflib or a 3 x N array of them
+        Returns:
+            ann if it is already an AnnotationStore, otherwise a new one
+    """
+    if isinstance(ann, AnnotationStore):
+        return ann
+    if len(ann) == 0:
+        return AnnotationStore()
+    return AnnotationStore(ann[0], ann[1], ann[2])
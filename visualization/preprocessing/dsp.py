@@ -1,30 +1,117 @@
 """ Module for various filtering operations """
+from functools import lru_cache
+import numpy as np
 import scipy.signal
 
+@lru_cache(maxsize=None)
+def _design_low_pass(fs, fc, N):
+    """ Design a low-pass filter as second-order sections
+    """
+    return scipy.signal.butter(N, fc / (fs / 2), output='sos')
+
+@lru_cache(maxsize=None)
+def _design_high_pass(fs, fc, N):
+    """ Design a high-pass filter as second-order sections
+    """
+    return scipy.signal.butter(N, fc / (fs / 2), btype='highpass', output='sos')
+
+@lru_cache(maxsize=None)
+def _design_notch(fs, fc, Q):
+    """ Design a notch filter at fc Hz as second-order sections
+    """
+    b, a = scipy.signal.iirnotch(fc / (fs / 2), Q)
+    return scipy.signal.tf2sos(b, a)
+
+@lru_cache(maxsize=None)
+def _design_band_pass(fs, fc, N):
+    """ Design a band-pass filter as second-order sections
+    """
+    wc = np.array(fc) / (fs / 2)
+    return scipy.signal.butter(N, wc, btype='bandpass', output='sos')
+
 def apply_low_pass(x, fs, fc=30, N=4):
     """ Apply a low-pass filter to the signal
     """
-    wc = fc / (fs / 2)
-    b, a = scipy.signal.butter(N, wc)
-    return scipy.signal.filtfilt(b, a, x, method='gust')
+    return scipy.signal.sosfiltfilt(_design_low_pass(fs, fc, N), x, axis=-1)
 
 def apply_high_pass(x, fs, fc=1.6, N=4):
     """ Apply a high-pass filter to the signal
     """
-    wc = fc / (fs / 2)
-    b, a = scipy.signal.butter(N, wc, btype='highpass')
-    return scipy.signal.filtfilt(b, a, x, method='gust')
+    return scipy.signal.sosfiltfilt(_design_high_pass(fs, fc, N), x, axis=-1)
 
 def apply_notch(x, fs, fc=60, Q=20.0):
     """ Apply a notch filter at fc Hz
     """
-    w60Hz = fc / (fs / 2)
-    b, a = scipy.signal.iirnotch(w60Hz, Q)
-    return scipy.signal.filtfilt(b, a, x, method='gust')
+    return scipy.signal.sosfiltfilt(_design_notch(fs, fc, Q), x, axis=-1)
 
 def apply_band_pass(x, fs, fc=[1.6,30], N=4):
-    """ Apply a low-pass filter to the signal
+    """ Apply a band-pass filter to the signal
+    """
+    return scipy.signal.sosfiltfilt(_design_band_pass(fs, tuple(fc), N), x, axis=-1)
+
+class FilterBank():
+    """ The notch, low-pass, high-pass and band-pass filters to apply to
+        signals at a given fs, designed once as second-order sections.
+    """
+
+    def __init__(self, fs, notch=0, lp=0, hp=0, bp1=0, bp2=0):
+        """ Design the filters, a frequency of 0 turns a filter off.
+        """
+        self.fs = fs
+        self.stages = []
+        if notch > 0:
+            self.stages.append(_design_notch(fs, notch, 20.0))
+        if lp > 0:
+            self.stages.append(_design_low_pass(fs, lp, 4))
+        if hp > 0:
+            self.stages.append(_design_high_pass(fs, hp, 4))
+        if bp1 > 0:
+            self.stages.append(_design_band_pass(fs, (bp1, bp2), 4))
+        self.margin = self._get_margin()
+
+    def _get_margin(self, tol=1e-4):
+        """ Get how many samples of context are needed on each side of a
+            window for it to be filtered as if it were part of the whole signal.
+
+            Args:
+                tol - the part of the impulse response, relative to its
+                    total size, that can be ignored
+            Returns:
+                the length of the impulse response of the bank
+        """
+        if len(self.stages) == 0:
+            return 0
+        sos = np.concatenate(self.stages)
+        n = int(60 * self.fs) # the impulse response is cut at 60s
+        impulse = np.zeros(n)
+        impulse[0] = 1
+        h = np.abs(scipy.signal.sosfilt(sos, impulse))
+        tail = np.cumsum(h[::-1])[::-1] # size of the response from each sample on
+        return int(np.count_nonzero(tail > tol * tail[0]))
+
+    def apply_stage(self, k, x):
+        """ Apply one filter of the bank to each row of x
+
+            Args:
+                k - the index of the filter in self.stages
+                x - array of size (channels, samples)
+            Returns:
+                the filtered array
+        """
+        return scipy.signal.sosfiltfilt(self.stages[k], x, axis=-1)
+
+    def apply(self, x):
+        """ Apply all filters of the bank to each row of x
+        """
+        for k in range(len(self.stages)):
+            x = self.apply_stage(k, x)
+        return x
+
+@lru_cache(maxsize=None)
+def get_filter_bank(fs, notch=0, lp=0, hp=0, bp1=0, bp2=0):
+    """ Get the filter bank for the given filters, it is only designed
+        the first time it is needed. Banks are never dropped, so the same
+        settings always give the same object and caches of filtered
+        signals can be keyed by it.
     """
-    wc = fc / (fs / 2)
-    b, a = scipy.signal.butter(N, wc, btype='bandpass')
-    return scipy.signal.filtfilt(b, a, x, method='gust')
+    return FilterBank(fs, notch, lp, hp, bp1, bp2)
@@ -0,0 +1,140 @@
+""" Module for caching decoded edf files on disk """
+import hashlib
+import json
+import os
+import numpy as np
+
+MANIFEST_FN = "manifest.json"
+
+
+def _get_cache_path(cache_dir, fn):
+    """ Gets the directory the cache for an edf file is kept in.
+
+        Args:
+            cache_dir - directory holding all cached files
+            fn - name of the .edf file
+        Returns:
+            the directory for the file, named by a hash of its full path
+    """
+    key = hashlib.sha1(os.path.abspath(fn).encode("utf-8")).hexdigest()
+    return os.path.join(cache_dir, key)
+
+
+def _get_file_stamp(fn):
+    """ Gets what the cache of a file is keyed by.
+
+        Args:
+            fn - name of the .edf file
+        Returns:
+            dict with the full path, modification time and size of the file
+    """
+    stat = os.stat(fn)
+    return {"fn": os.path.abspath(fn), "mtime": stat.st_mtime,
+            "size": stat.st_size}
+
+
+class CachedReader():
+    """ Reads signals from the cache of an edf file.
+
+        Each signal is stored as physical values, in the dtype the cache
+        was written with, in its own .npy file which is memory-mapped, so
+        opening the cache reads no samples.
+    """
+
+    def __init__(self, path, manifest):
+        """ Memory-map the cached signals.
+
+            Args:
+                path - the directory of the cache for the file
+                manifest - the loaded manifest of the cache
+        """
+        self.signal_labels = manifest["signal_labels"]
+        self.nsamples = np.array(manifest["nsamples"], dtype=int)
+        self.sigs = [np.load(os.path.join(path, str(chn) + ".npy"), mmap_mode="r")
+                     for chn in range(len(self.signal_labels))]
+
+    def read(self, chn, start, n):
+        """ Read physical values for part of a channel.
+
+            Args:
+                chn - the channel
+                start - the first sample to read
+                n - the number of samples to read
+            Returns:
+                array of the physical values, shorter than n if the end of the
+                file is reached
+        """
+        end = min(start + n, self.nsamples[chn])
+        if end <= start:
+            return np.zeros(0)
+        return np.array(self.sigs[chn][start:end])
+
+    def close(self):
+        """ Release the memory-maps.
+        """
+        self.sigs = None
+
+
+def open_cached(cache_dir, fn, dtype=None):
+    """ Opens the cache of an edf file.
+
+        Args:
+            cache_dir - directory holding all cached files
+            fn - name of the .edf file
+            dtype - the dtype the signals must be cached as, or None for any
+        Returns:
+            a CachedReader, or None if the file is not cached, has been
+            changed since it was cached or is cached as another dtype
+    """
+    path = _get_cache_path(cache_dir, fn)
+    try:
+        with open(os.path.join(path, MANIFEST_FN), "r") as f:
+            manifest = json.load(f)
+        if manifest["stamp"] != _get_file_stamp(fn):
+            return None
+        if dtype is not None and np.dtype(manifest.get("dtype", "float64")) != np.dtype(dtype):
+            return None
+        return CachedReader(path, manifest)
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def write_cache(cache_dir, fn, reader, dtype=np.float64, block_size=2 ** 20):
+    """ Writes the decoded signals of an edf file to the cache.
+
+        Args:
+            cache_dir - directory holding all cached files
+            fn - name of the .edf file
+            reader - an open reader for the file, it is closed when done
+            dtype - the dtype to cache the signals as
+            block_size - the number of samples decoded at a time
+        Returns:
+            a CachedReader for the new cache
+    """
+    path = _get_cache_path(cache_dir, fn)
+    try:
+        os.makedirs(path, exist_ok=True)
+        # Remove the old manifest first so a partly written cache is never used
+        if os.path.exists(os.path.join(path, MANIFEST_FN)):
+            os.remove(os.path.join(path, MANIFEST_FN))
+        for chn in range(len(reader.signal_labels)):
+            # written to a new file so old caches that are still open are kept
+            chn_fn = os.path.join(path, str(chn) + ".npy")
+            sig = np.lib.format.open_memmap(chn_fn + ".tmp", mode="w+", dtype=dtype,
+                                            shape=(int(reader.nsamples[chn]),))
+            for start in range(0, len(sig), block_size):
+                sig[start:start + block_size] = reader.read(chn, start, block_size)
+            sig.flush()
+            del sig
+            os.replace(chn_fn + ".tmp", chn_fn)
+        manifest = {"stamp": _get_file_stamp(fn),
+                    "signal_labels": list(reader.signal_labels),
+                    "nsamples": [int(x) for x in reader.nsamples],
+                    "dtype": np.dtype(dtype).name}
+    finally:
+        reader.close()
+    tmp_fn = os.path.join(path, MANIFEST_FN + ".tmp")
+    with open(tmp_fn, "w") as f:
+        json.dump(manifest, f)
+    os.replace(tmp_fn, os.path.join(path, MANIFEST_FN))
+    return CachedReader(path, manifest)
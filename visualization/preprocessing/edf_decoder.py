@@ -0,0 +1,106 @@
+""" Module for decoding the data records of edf files without copying them """
+import os
+import numpy as np
+
+ANNOTATION_LABEL = "EDF Annotations"
+
+
+class EdfDecoder():
+    """ Memory-maps the data records of an edf file.
+
+        EDF stores the signals as fixed-size data records of interleaved
+        16 bit samples. The data record area is memory-mapped and each
+        channel is exposed as a strided view into it, so nothing is read
+        from disk until a slice of a channel is requested. Digital to
+        physical scaling is only applied to the requested slice.
+    """
+
+    def __init__(self, fn):
+        """ Parse the header and memory-map the data records.
+
+            Args:
+                fn - name of the .edf file
+            Raises:
+                ValueError if the file is not a 16 bit edf file
+        """
+        self.fn = fn
+        with open(fn, "rb") as f:
+            header = f.read(256)
+            if len(header) < 256 or header[0:8] != b"0       ":
+                raise ValueError(fn + " is not an edf file.")
+            header_bytes = int(header[184:192])
+            nrecords = int(header[236:244])
+            ns = int(header[252:256])
+            sig_header = f.read(ns * 256)
+        if len(sig_header) < ns * 256:
+            raise ValueError(fn + " has an incomplete header.")
+
+        def _fields(start, width):
+            """ Returns the ns fields of the given width starting at start """
+            return [sig_header[start + i * width:start + (i + 1) * width].decode(
+                "latin-1").strip() for i in range(ns)]
+
+        labels = _fields(0, 16)
+        phys_min = np.array(_fields(ns * 104, 8), dtype=float)
+        phys_max = np.array(_fields(ns * 112, 8), dtype=float)
+        dig_min = np.array(_fields(ns * 120, 8), dtype=float)
+        dig_max = np.array(_fields(ns * 128, 8), dtype=float)
+        spr = np.array(_fields(ns * 216, 8), dtype=int)
+
+        record_len = int(np.sum(spr))
+        if record_len == 0:
+            raise ValueError(fn + " has no samples.")
+        data_bytes = os.path.getsize(fn) - header_bytes
+        if nrecords < 0 or nrecords * record_len * 2 > data_bytes:
+            nrecords = data_bytes // (record_len * 2)
+        self.records = np.memmap(fn, dtype="<i2", mode="r", offset=header_bytes,
+                                 shape=(nrecords, record_len))
+
+        # Signals are numbered as in pyedflib, which skips annotation signals
+        offsets = np.concatenate(([0], np.cumsum(spr)[:-1]))
+        sigs = [i for i in range(ns) if labels[i] != ANNOTATION_LABEL]
+        self.signal_labels = [labels[i] for i in sigs]
+        self.spr = spr[sigs]
+        self.offsets = offsets[sigs]
+        self.nsamples = self.spr * nrecords
+        # Scaling as done by edflib: physical = bitvalue * (offset + digital)
+        bitvalue = (phys_max - phys_min) / (dig_max - dig_min)
+        self.bitvalue = bitvalue[sigs]
+        self.phys_offset = (phys_max / bitvalue - dig_max)[sigs]
+
+    def get_chn(self, chn):
+        """ Returns a view of the digital samples of a channel.
+
+            Args:
+                chn - the channel
+            Returns:
+                A (nrecords, samples per record) view into the memory-map,
+                no data is copied
+        """
+        return self.records[:, self.offsets[chn]:self.offsets[chn] + self.spr[chn]]
+
+    def read(self, chn, start, n):
+        """ Read physical values for part of a channel.
+
+            Args:
+                chn - the channel
+                start - the first sample to read
+                n - the number of samples to read
+            Returns:
+                array of the physical values, shorter than n if the end of the
+                file is reached
+        """
+        spr = self.spr[chn]
+        end = min(start + n, self.nsamples[chn])
+        if end <= start:
+            return np.zeros(0)
+        first_rec = start // spr
+        last_rec = (end - 1) // spr + 1
+        dig = self.get_chn(chn)[first_rec:last_rec].reshape(-1)
+        dig = dig[start - first_rec * spr:end - first_rec * spr]
+        return self.bitvalue[chn] * (self.phys_offset[chn] + dig)
+
+    def close(self):
+        """ Release the memory-map.
+        """
+        self.records = None
@@ -1,7 +1,12 @@
 """ Module for loading edf files """
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import threading
+import numpy as np
 import pyedflib
 
 from preprocessing.eeg_info import EegInfo
+from preprocessing.edf_decoder import EdfDecoder
+from preprocessing.edf_cache import open_cached, write_cache
 
 
 def _check_label(label, label_list):
@@ -19,11 +24,186 @@ def _check_label(label, label_list):
     return ""
 
 
+def _get_edf_chns(signal_labels, eeg_info):
+    """ Maps channels in eeg_info to channels in the edf file.
+
+        Args:
+            signal_labels - the signal labels in the edf file
+            eeg_info - info for the eeg file
+        Returns:
+            A dict from channel in eeg_info to channel in the edf file
+    """
+    edf_chns = {}
+    for edf_chn, label in enumerate(signal_labels):
+        curr_label = _check_label(label, eeg_info.label_list)
+        if curr_label:
+            edf_chns[eeg_info.labels2chns[curr_label]] = edf_chn
+    return edf_chns
+
+
+# pyedflib can only open a file once, so threads take turns opening files with it
+pyedflib_lock = threading.Lock()
+
+
+class _PyedflibReader():
+    """ Reads signals with pyedflib, used for files EdfDecoder can not decode.
+        The reader holds pyedflib_lock until it is closed.
+    """
+
+    def __init__(self, fn):
+        pyedflib_lock.acquire()
+        try:
+            self.f = pyedflib.EdfReader(fn)
+        except Exception:
+            pyedflib_lock.release()
+            raise
+        self.signal_labels = self.f.getSignalLabels()
+        self.nsamples = self.f.getNSamples()
+
+    def read(self, chn, start, n):
+        """ Read physical values for part of a channel """
+        n = min(n, self.nsamples[chn] - start)
+        if n <= 0:
+            return np.zeros(0)
+        return self.f.readSignal(chn, start, n)
+
+    def close(self):
+        """ Close the edf file """
+        if self.f is not None:
+            self.f.close()
+            self.f = None
+            pyedflib_lock.release()
+
+
+_fill_threads = {} # (cache_dir, fn, dtype) -> thread filling the cache
+_fill_lock = threading.Lock()
+
+
+def _fill_cache(cache_dir, fn, dtype):
+    """ Decodes an edf file into the cache, run by a background thread.
+        Files that can only be read by pyedflib are not cached, as pyedflib
+        can only open a file once and it is being read meanwhile.
+    """
+    try:
+        write_cache(cache_dir, fn, EdfDecoder(fn), dtype).close()
+    except (OSError, ValueError):
+        pass # the cache can not be written, the file is read directly
+
+
+def _start_fill_cache(cache_dir, fn, dtype):
+    """ Starts filling the cache of an edf file in the background, unless
+        it is already being filled.
+    """
+    key = (cache_dir, fn, np.dtype(dtype).name)
+    with _fill_lock:
+        thread = _fill_threads.get(key)
+        if thread is not None and thread.is_alive():
+            return
+        thread = threading.Thread(target=_fill_cache, args=(cache_dir, fn, dtype),
+                                  daemon=True)
+        _fill_threads[key] = thread
+        thread.start()
+
+
+def _open_reader(fn, cache_dir=None, dtype=np.float64):
+    """ Opens an edf file for reading signals.
+
+        Args:
+            fn - name of the .edf file
+            cache_dir - directory of the decoded signal cache, None to not
+                use the cache. The file is decoded into the cache in the
+                background the first time it is opened, and read directly
+                until the cache is ready.
+            dtype - the dtype signals are cached as
+        Returns:
+            A CachedReader if the cache is ready, else an EdfDecoder if the
+            data records can be memory-mapped, otherwise a reader backed
+            by pyedflib
+    """
+    if cache_dir:
+        reader = open_cached(cache_dir, fn, dtype)
+        if reader is not None:
+            return reader
+        _start_fill_cache(cache_dir, fn, dtype)
+    try:
+        return EdfDecoder(fn)
+    except ValueError:
+        return _PyedflibReader(fn)
+
+
+def _read_signals(fn, edf_chns, start, n, nworkers=1, progress=None, cache_dir=None,
+                  cache_dtype=np.float64):
+    """ Reads part of several signals, in parallel if possible.
+
+        Args:
+            fn - name of the .edf file
+            edf_chns - list of the channels in the edf file to read
+            start - the first sample to read
+            n - the number of samples to read, None for the whole signal
+            nworkers - the number of threads to read with, each with
+                its own reader. Files that can only be read by pyedflib
+                are read by one thread as pyedflib can only open a file once.
+            progress - function called with (number read, number to read)
+                after each signal is read, from the calling thread
+            cache_dir - directory of the decoded signal cache, or None
+            cache_dtype - the dtype signals are cached as
+        Returns:
+            A list of the signals read
+    """
+    sigs = [None] * len(edf_chns)
+    reader = _open_reader(fn, cache_dir, cache_dtype)
+    try:
+        def _read(reader, i):
+            if n is None:
+                return reader.read(edf_chns[i], start, reader.nsamples[edf_chns[i]])
+            return reader.read(edf_chns[i], start, n)
+
+        if nworkers <= 1 or len(edf_chns) <= 1 or isinstance(reader, _PyedflibReader):
+            for i in range(len(edf_chns)):
+                sigs[i] = _read(reader, i)
+                if progress is not None:
+                    progress(i + 1, len(edf_chns))
+            return sigs
+
+        # Each worker opens one reader and keeps it for all of its groups
+        local = threading.local()
+        worker_readers = []
+        def _read_group(group):
+            if not hasattr(local, "reader"):
+                local.reader = _open_reader(fn, cache_dir, cache_dtype)
+                worker_readers.append(local.reader)
+            return [(i, _read(local.reader, i)) for i in group]
+
+        # Small groups so progress is reported often
+        nworkers = min(nworkers, len(edf_chns))
+        group_size = max(1, len(edf_chns) // (4 * nworkers))
+        groups = [range(k, min(k + group_size, len(edf_chns)))
+                  for k in range(0, len(edf_chns), group_size)]
+        nread = 0
+        try:
+            with ThreadPoolExecutor(max_workers=nworkers) as executor:
+                futures = [executor.submit(_read_group, group) for group in groups]
+                for future in as_completed(futures):
+                    for i, sig in future.result():
+                        sigs[i] = sig
+                    nread += len(future.result())
+                    if progress is not None:
+                        progress(nread, len(edf_chns))
+        finally:
+            for worker_reader in worker_readers:
+                worker_reader.close()
+    finally:
+        reader.close()
+    return sigs
+
+
 class EdfLoader():
     """ A class for loading info and buffers from EDF files """
 
-    def __init__(self, label_list=None):
+    def __init__(self, label_list=None, cache_dir=None, cache_dtype=np.float64):
         self.label_list = label_list
+        self.cache_dir = cache_dir
+        self.cache_dtype = cache_dtype
 
     def load_metadata(self, fn):
         """
@@ -40,15 +220,23 @@ class EdfLoader():
         eeg_info.edf_fn = fn
         eeg_info.name = fn.split('/')[-1].split('.')[0]
         eeg_info.label_list = self.label_list
+        eeg_info.cache_dir = self.cache_dir
+        eeg_info.cache_dtype = self.cache_dtype
 
         # Load the metadata
-        f = pyedflib.EdfReader(fn)
-        nsignals = f.signals_in_file
-        signal_labels = f.getSignalLabels()
-        nsamples = f.getNSamples()
-        sample_frequencies = f.getSampleFrequencies()
-        eeg_info.file_duration = f.getFileDuration()
-        eeg_info.annotations = f.readAnnotations()
+        with pyedflib_lock:
+            f = pyedflib.EdfReader(fn)
+            try:
+                nsignals = f.signals_in_file
+                signal_labels = f.getSignalLabels()
+                nsamples = f.getNSamples()
+                sample_frequencies = f.getSampleFrequencies()
+                eeg_info.file_duration = f.getFileDuration()
+                eeg_info.annotations = f.readAnnotations()
+            finally:
+                # Close the edf file
+                f.close()
+                del f
 
         # If a label list is provided, load info for the channels
         if self.label_list:
@@ -83,36 +271,79 @@ class EdfLoader():
                 eeg_info.label_list.append(label.upper())
                 eeg_info.labels2chns[label.upper()] = edf_chn
                 eeg_info.chns2labels[edf_chn] = label.upper()
-        # Close the edf file
-        f.close()
-        del f
 
+        eeg_info.chn_fs = list(eeg_info.fs)
         if len(set(eeg_info.fs)) == 1:
             eeg_info.fs = eeg_info.fs[0]
 
         return eeg_info
 
-    def load_buffers(self, eeg_info):
+    def load_buffers(self, eeg_info, nworkers=1, progress=None):
         """
         Load the information from the edf file
 
         inputs:
             eeg_info - info for eeg file to load
+            nworkers - the number of threads used to read channels
+            progress - function called with (number of channels read,
+                number of channels to read) as channels are read
 
         returns:
             bufs - list of channel buffers from the EDF file
         """
         bufs = [0] * eeg_info.nchns
 
-        f = pyedflib.EdfReader(eeg_info.edf_fn)
-        nsignals = f.signals_in_file
-        signal_labels = f.getSignalLabels()
-        # Loop over the signals in the edf file
-        for edf_chn in range(nsignals):
-            # Check the label and load
-            curr_label = _check_label(signal_labels[edf_chn],
-                                      eeg_info.label_list)
-            if curr_label:
-                chn = eeg_info.labels2chns[curr_label]
-                bufs[chn] = f.readSignal(edf_chn)
+        reader = _open_reader(eeg_info.edf_fn, eeg_info.cache_dir, eeg_info.cache_dtype)
+        try:
+            edf_chns = _get_edf_chns(reader.signal_labels, eeg_info)
+        finally:
+            reader.close()
+        chns = list(edf_chns.keys())
+        sigs = _read_signals(eeg_info.edf_fn, [edf_chns[chn] for chn in chns],
+                             0, None, nworkers, progress, eeg_info.cache_dir,
+                             eeg_info.cache_dtype)
+        for chn, sig in zip(chns, sigs):
+            bufs[chn] = sig
         return bufs
+
+    def read_window(self, eeg_info, chns, start_sample, n_samples, nworkers=1,
+                    dtype=np.float64, progress=None):
+        """
+        Load a window of samples from the edf file without reading
+        the whole signal
+
+        inputs:
+            eeg_info - info for eeg file to load
+            chns - list of channels (as in eeg_info.chns2labels) to read
+            start_sample - the first sample of the window
+            n_samples - the number of samples in the window
+            nworkers - the number of threads used to read channels
+            dtype - the dtype of the returned array
+            progress - function called with (number of channels read,
+                number of channels to read) as channels are read
+
+        returns:
+            buf - array of size (len(chns), n_samples), samples past the
+                end of the file are set to zero. The file is opened once and
+                channels that are repeated in chns are only read once.
+        """
+        buf = np.zeros((len(chns), n_samples), dtype=dtype)
+
+        reader = _open_reader(eeg_info.edf_fn, eeg_info.cache_dir, eeg_info.cache_dtype)
+        try:
+            edf_chns = _get_edf_chns(reader.signal_labels, eeg_info)
+        finally:
+            reader.close()
+        rows = {}
+        for i, chn in enumerate(chns):
+            if chn not in rows:
+                rows[chn] = i
+        sigs = _read_signals(eeg_info.edf_fn, [edf_chns[chn] for chn in rows],
+                             start_sample, n_samples, nworkers, progress,
+                             eeg_info.cache_dir, eeg_info.cache_dtype)
+        for (chn, i), sig in zip(rows.items(), sigs):
+            buf[i, :len(sig)] = sig
+        for i, chn in enumerate(chns):
+            if rows[chn] != i:
+                buf[i] = buf[rows[chn]]
+        return buf
@@ -3,6 +3,8 @@ class EegInfo():
 
     def __init__(self):
         self.edf_fn = ''
+        self.cache_dir = None
+        self.cache_dtype = "float64" # the dtype signals are cached as
         self.name = ''
         self.file_duration = 0
         self.nsamples = 0
@@ -12,6 +14,7 @@ class EegInfo():
         self.nchns = 0
         self.annotations = []
         self.fs = 0
+        self.chn_fs = [] # fs of each channel, fs may be set to the max
         self.window_starts = []
         self.window_ends = []
         self.time_axis = []
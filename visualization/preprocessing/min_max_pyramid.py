@@ -0,0 +1,148 @@
+""" Module for computing min/max pyramids used to draw long windows """
+import numpy as np
+
+def _build_levels(mins, maxs):
+    """ Halves the groups of mins and maxs until there is a single group.
+
+    Args:
+        mins - array of size (nchns, n) of the min of each group
+        maxs - array of size (nchns, n) of the max of each group
+    Returns:
+        list of (mins, maxs) for each level
+    """
+    levels = []
+    while mins.shape[1] > 1:
+        if mins.shape[1] % 2 == 1:
+            # repeat the last group so that it can be paired
+            mins = np.concatenate((mins, mins[:, -1:]), axis=1)
+            maxs = np.concatenate((maxs, maxs[:, -1:]), axis=1)
+        mins = np.minimum(mins[:, 0::2], mins[:, 1::2])
+        maxs = np.maximum(maxs[:, 0::2], maxs[:, 1::2])
+        levels.append((mins, maxs))
+    return levels
+
+def _group_min_max(data, group_size):
+    """ Computes the min and max of each group of group_size samples, the
+        last group is padded with the last sample.
+
+    Args:
+        data - array of size (nchns, n)
+        group_size - the number of samples in each group
+    Returns:
+        mins, maxs - arrays of size (nchns, ceil(n / group_size))
+    """
+    if group_size == 1:
+        return data, data
+    ngroups = -(-data.shape[1] // group_size)
+    pad = ngroups * group_size - data.shape[1]
+    if pad > 0:
+        data = np.concatenate((data, np.repeat(data[:, -1:], pad, axis=1)), axis=1)
+    groups = data.reshape(data.shape[0], ngroups, group_size)
+    return groups.min(axis=2), groups.max(axis=2)
+
+def _get_nlevels(n, group_size=2):
+    """ Gets the number of levels in the pyramid of n samples starting
+        at groups of group_size samples.
+    """
+    if n == 0:
+        return 0
+    n = -(-n // group_size)
+    nlevels = 1
+    while n > 1:
+        n = -(-n // 2)
+        nlevels += 1
+    return nlevels
+
+def build_min_max_pyramid(data, group_size=2):
+    """ Computes the min and max of each signal over groups of group_size,
+        2 * group_size, 4 * group_size, ... samples, up to a single group
+        for the whole signal. Each level is computed from the one before it.
+
+    Args:
+        data - array of size (nchns, n)
+        group_size - the number of samples in the groups of the first
+            level, a power of 2
+    Returns:
+        list where level k is (mins, maxs), arrays of size
+        (nchns, ceil(n / (group_size * 2 ** k)))
+    """
+    if data.shape[1] == 0:
+        return []
+    first = _group_min_max(data, group_size)
+    return [first] + _build_levels(*first)
+
+def build_min_max_pyramid_blocks(get_block, n, group_size=2, block_size=2 ** 16,
+                                 stop=None):
+    """ Computes the same pyramid as build_min_max_pyramid, reading the
+        signals one block at a time so that they are never all in memory.
+
+    Args:
+        get_block - function giving the array of size (nchns, m) of the
+            m samples from a start sample, called as get_block(start, m)
+        n - the number of samples in the signals
+        group_size - the number of samples in the groups of the first
+            level, a power of 2
+        block_size - the number of samples read at a time, a power of 2
+            no less than group_size so that no group of the finer levels
+            spans two blocks
+        stop - function called before each block, the build is dropped
+            if it returns True
+    Returns:
+        the levels as from build_min_max_pyramid, or None if stopped
+    """
+    nlevels = _get_nlevels(n, group_size)
+    nblock_levels = min(_get_nlevels(block_size, group_size), nlevels)
+    levels = None
+    for start in range(0, n, block_size):
+        if stop is not None and stop():
+            return None
+        block = get_block(start, min(block_size, n - start))
+        if levels is None:
+            levels = [tuple(np.empty((block.shape[0], -(-n // (group_size * 2 ** k))),
+                                     dtype=block.dtype) for _ in range(2))
+                      for k in range(nblock_levels)]
+        block_levels = build_min_max_pyramid(block, group_size)
+        for k in range(nblock_levels):
+            # a short last block runs out of levels, its last group covers it all
+            mins, maxs = block_levels[min(k, len(block_levels) - 1)]
+            first = start // (group_size * 2 ** k)
+            levels[k][0][:, first:first + mins.shape[1]] = mins
+            levels[k][1][:, first:first + maxs.shape[1]] = maxs
+    if levels is None:
+        return []
+    if nlevels > nblock_levels:
+        levels += _build_levels(*levels[-1])
+    return levels
+
+def get_pyramid_window(pyramid, start, n, npoints, group_size=2):
+    """ Gets the points to draw for a window from a min/max pyramid, without
+        reading the samples of the window.
+
+    Args:
+        pyramid - the levels from build_min_max_pyramid
+        start - the first sample of the window
+        n - the number of samples in the window
+        npoints - about how many points to keep for each signal
+        group_size - the group size the pyramid was built with
+    Returns:
+        x, y as from decimate_min_max, or None if the window is too short
+        for any level of the pyramid
+    """
+    nbins = npoints // 2
+    # use the coarsest level with at least nbins groups in the window
+    level = -1
+    while level + 1 < len(pyramid) and n / (group_size * 2 ** (level + 1)) >= nbins:
+        level += 1
+    if nbins < 1 or level < 0:
+        return None
+    group_size = group_size * 2 ** level
+    mins, maxs = pyramid[level]
+    first = start // group_size
+    last = -(-(start + n) // group_size)
+    # groups past the end of the signals are left as zeros
+    y = np.zeros((mins.shape[0], 2 * (last - first)), dtype=mins.dtype)
+    ngroups = mins[:, first:last].shape[1]
+    y[:, 0:2 * ngroups:2] = mins[:, first:last]
+    y[:, 1:2 * ngroups:2] = maxs[:, first:last]
+    x = first * group_size - start + np.arange(y.shape[1]) * (group_size / 2)
+    return x, y
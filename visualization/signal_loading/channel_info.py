@@ -1,7 +1,11 @@
 """ Module for holding channel information."""
+import os
 import re
+import threading
 import numpy as np
-import pyedflib
+from scipy import sparse
+from preprocessing.edf_loader import EdfLoader
+from preprocessing.min_max_pyramid import build_min_max_pyramid_blocks, get_pyramid_window
 
 def _check_label(label, label_list):
     """ Checks if a label is in the label list
@@ -97,6 +101,77 @@ def convert_txt_chn_names(chn_txt):
             chn = "T6"
     return chn
 
+def _build_montage(rows):
+    """ Builds the montage matrix.
+
+        Args:
+            rows - a dict {chn: weight} for each plotted signal
+        Returns:
+            sparse matrix of size (len(rows), nchns) so that the plotted
+            signals are montage @ (the signals in the edf file)
+    """
+    chns = [chn for row in rows for chn in row]
+    weights = [w for row in rows for w in row.values()]
+    row_idxs = [i for i, row in enumerate(rows) for _ in row]
+    nchns = max(chns) + 1 if len(chns) > 0 else 0
+    return sparse.csr_matrix((weights, (row_idxs, chns)), shape=(len(rows), nchns))
+
+def _common_average(rows, electrodes):
+    """ Re-references the referential rows of a montage to their average.
+
+        Args:
+            rows - a dict {chn: weight} for each plotted signal
+            electrodes - the channels in the edf file that are referential
+                electrodes, channels such as "FP1-F7" or "EKG" are not
+        Returns:
+            the rows with the average of the referential channels subtracted
+            from each referential channel, other rows are not changed
+    """
+    def _is_ref(row):
+        return (len(row) == 1 and list(row.values())[0] == 1
+                and list(row)[0] in electrodes)
+
+    ref_chns = [list(row)[0] for row in rows if _is_ref(row)]
+    if len(ref_chns) < 2:
+        return rows
+    ret = []
+    for row in rows:
+        if _is_ref(row):
+            new_row = {chn: -1 / len(ref_chns) for chn in ref_chns}
+            new_row[list(row)[0]] += 1
+            row = new_row
+        ret.append(row)
+    return ret
+
+def _offset_progress(progress, done, total):
+    """ Gets a progress function for one part of a larger read.
+
+        Args:
+            progress - function called with (number read, number to read)
+                for the whole read, or None
+            done - the number read before this part
+            total - the number to read for the whole read
+        Returns:
+            a function to call with (number read, number to read) of
+            the part, or None
+    """
+    if progress is None:
+        return None
+    return lambda nread, _: progress(done + nread, total)
+
+def _get_hold_idxs(start, n, fs_in, fs_out):
+    """ Gets which samples of a slower signal to show at a faster rate.
+
+        Args:
+            start - the first sample at fs_out
+            n - the number of samples at fs_out
+            fs_in - the rate of the slower signal
+            fs_out - the rate to show it at
+        Returns:
+            the index of the sample at fs_in held at each of the n samples
+    """
+    return (((start + np.arange(n)) * fs_in) // fs_out).astype(int)
+
 class ChannelInfo():
     """ Data structure for holding information relevant to selecting which signals to plot """
 
@@ -107,6 +182,9 @@ class ChannelInfo():
         self.labels2chns = []
         self.fs = 0
         self.edf_fn = ""
+        self.edf_info = None
+        self.nsamples = 0
+        self.dtype = np.float32 # dtype of the plotted signals
 
         self.total_nchns = 0
         self.list_of_chns = []
@@ -148,6 +226,57 @@ class ChannelInfo():
         self.labels_to_plot = []
         self.nchns_to_plot = 0
         self.mont_type = 5
+        self.common_avg = 0 # whether to subtract the common average
+        self.montage = _build_montage([]) # plotted signals = montage @ edf signals
+        self._data_to_plot = None # loaded only if the whole signal is needed
+        self._resampled = None # signals kept at their own rates, at the plotted fs
+        self.row_fs = [] # the rate each loaded signal is kept at
+        self.pyramid = None # min/max of the plotted signals, see build_pyramid
+        self.pyramid_group = 64 # samples in the finest groups of the pyramid
+        self._pyramid_generation = None # the generation the pyramid was started for
+        self._load_lock = threading.Lock()
+        self._generation = 0 # changed with the plotted signals, under _load_lock
+
+    def load(self, nworkers=None, progress=None):
+        """ Reads the whole signal of the plotted channels from the edf
+            file, unless it is already loaded.
+
+            Args:
+                nworkers - the number of threads used to read channels,
+                    defaults to the number of CPUs
+                progress - function called with (number of channels read,
+                    number of channels to read) as channels are read
+        """
+        if nworkers is None:
+            nworkers = os.cpu_count()
+        with self._load_lock:
+            if self._data_to_plot is None:
+                self._data_to_plot = self._load_chns(nworkers, progress)
+
+    def is_loaded(self):
+        """ Whether the whole signal of the plotted channels is loaded.
+        """
+        return self._data_to_plot is not None
+
+    @property
+    def data_to_plot(self):
+        """ The whole signal for each plotted channel at the plotted fs.
+            Only read from the edf file the first time it is needed.
+        """
+        self.load()
+        if isinstance(self._data_to_plot, np.ndarray):
+            return self._data_to_plot
+        # signals are kept at their own rates, so resample them once here
+        with self._load_lock:
+            if self._resampled is None:
+                self._resampled = self.get_window(0, self.nsamples)
+            return self._resampled
+
+    @data_to_plot.setter
+    def data_to_plot(self, data):
+        with self._load_lock:
+            self._data_to_plot = data
+            self._resampled = None
 
     def _get_color(self, chn):
         """ Get the color of a given channel.
@@ -174,11 +303,15 @@ class ChannelInfo():
         self.labels2chns = ci2.labels2chns
         self.fs = ci2.fs
         self.edf_fn = ci2.edf_fn
+        self.edf_info = ci2.edf_info
+        self.nsamples = ci2.nsamples
+        self.dtype = ci2.dtype
 
         self.labels_from_txt_file = ci2.labels_from_txt_file
         self.use_loaded_txt_file = ci2.use_loaded_txt_file
         self.txt_file_fn = ci2.txt_file_fn
         self.organize = ci2.organize
+        self.common_avg = ci2.common_avg
 
         self.total_nchns = ci2.total_nchns
         self.list_of_chns = ci2.list_of_chns
@@ -285,7 +418,8 @@ class ChannelInfo():
                             ret[i] = 0
         return ret
 
-    def prepare_to_plot(self, idxs, parent, mont_type, plot_bip_from_ar = 0, txt_file_name = ""):
+    def prepare_to_plot(self, idxs, parent, mont_type, plot_bip_from_ar = 0, txt_file_name = "",
+                        common_avg = 0):
         """
         Prepares everything needed to plot the data.
 
@@ -299,9 +433,9 @@ class ChannelInfo():
             plot_bip_from_ar - 1 if a bipolar montage should be generated
                 from average reference data
             txt_file_name - name of text file if needed
+            common_avg - 1 if the average of the referential channels should be
+                subtracted from each of them
         """
-        f = pyedflib.EdfReader(self.edf_fn)
-
         # Things needed to plot - reset each time
         # see if channels are already organized ie if organize is true
         # and all of the correct channels are present
@@ -325,6 +459,9 @@ class ChannelInfo():
                     ret = 0
         elif not plot_bip_from_ar:
             ret = 0
+        if common_avg != self.common_avg:
+            ret = 0
+        self.common_avg = common_avg
         if ret == 1 and self.organize: # already organized
             # redo the colors in case they have been changed
             self.colors = []
@@ -336,7 +473,6 @@ class ChannelInfo():
 
         self.labels_to_plot = ["Notes"]
         self.colors = []
-        self.data_to_plot = []
         self.nchns_to_plot = 0
         self.list_of_chns = []
         for k in range(len(idxs)):
@@ -347,30 +483,20 @@ class ChannelInfo():
         ar1010 = 0
         bip1010 = 0
         self.nchns_to_plot = len(idxs)
-        self.data_to_plot = np.zeros((self.nchns_to_plot, parent.edf_info_temp.nsamples[0]))
+        # the number of samples at the plotted fs, which is the fastest rate
+        self.nsamples = int(np.max(parent.edf_info_temp.nsamples))
+        rows = [{}] * self.nchns_to_plot # {chn: weight} for each plotted signal
         if plot_bip_from_ar and self.can_do_bip_ar_idx(idxs,1,0):
-            self.data_to_plot = np.zeros((self.nchns_to_plot - 1, parent.edf_info_temp.nsamples[0]))
+            rows = [{}] * (self.nchns_to_plot - 1)
         c = 0
 
         if plot_bip_from_ar:
             if mont_type == 1:
                 ar = self.can_do_bip_ar_idx(idxs,1,0) # must have all AR chns to convert to bipolar
                 if ar:
-                    bip_idx = np.zeros((18,2))
-                    for k in range(18):
-                        str0 = self.labelsBIP1020[k].split('-')[0]
-                        str1 = self.labelsBIP1020[k].split('-')[1]
-                        for i, strg in enumerate(self.converted_chn_names):
-                            if strg == str0:
-                                idx0 = i
-                            if strg == str1:
-                                idx1 = i
-                        bip_idx[k,0] = idx0
-                        bip_idx[k,1] = idx1
-                    for k in range(18):
-                        idx0 = bip_idx[k,0]
-                        idx1 = bip_idx[k,1]
-                        self.data_to_plot[k,:] = f.readSignal(int(idx0)) - f.readSignal(int(idx1))
+                    bip_rows = self._get_bip_rows(self.labelsBIP1020)
+                    for k in range(len(bip_rows)):
+                        rows[k] = bip_rows[k]
                         self.labels_to_plot.append(self.labelsBIP1020[k])
                         self.colors.append(self._get_color(self.labelsBIP1020[k]))
                         c += 1
@@ -385,40 +511,6 @@ class ChannelInfo():
                     self.nchns_to_plot = 18 + len(idxs)
                     if self.nchns_to_plot == 18:
                         self.mont_type = 1
-            """
-            elif mont_type == 3:
-                ar = self.can_do_bip_ar_idx(idxs,1,1) # must have all AR chns to convert to bipolar
-                if ar:
-                    bip_idx = np.zeros((len(self.labelsBIP1010),2))
-                    for k in range(len(self.labelsBIP1010)):
-                        str0 = self.labelsBIP1010[k].split('-')[0]
-                        str1 = self.labelsBIP1010[k].split('-')[1]
-                        for i, strg in enumerate(self.converted_chn_names):
-                            if strg == str0:
-                                idx0 = i
-                            if strg == str1:
-                                idx1 = i
-                        bip_idx[k,0] = idx0
-                        bip_idx[k,1] = idx1
-                    for k in range(len(self.labelsBIP1010)):
-                        idx0 = bip_idx[k,0]
-                        idx1 = bip_idx[k,1]
-                        self.data_to_plot[k,:] = f.readSignal(int(idx0)) - f.readSignal(int(idx1))
-                        self.labels_to_plot.append(self.labelsBIP1010[k])
-                        self.colors.append(self._get_color(self.labelsBIP1010[k]))
-                        c += 1
-
-                    ar_idxs = self.get_chns(self.labelsAR1010) # clear these from the list
-                    k = 0
-                    while k < len(idxs):
-                        if ar_idxs[idxs[k]]:
-                            idxs.pop(k)
-                        else:
-                            k += 1
-                    self.nchns_to_plot = len(self.labelsBIP1010) + len(idxs)
-                    if self.nchns_to_plot == len(self.labelsBIP1010):
-                        self.mont_type = 3
-            """
 
         # Check if any of the channels are average reference / bipolar
         #ar = self.can_do_bip_ar_idx(idxs,1,0)
@@ -459,7 +551,7 @@ class ChannelInfo():
                     if self.converted_chn_names[idxs[k]] == labels[i]:
                         self.labels_to_plot.append(labels[i])
                         self.colors.append(self._get_color(labels[i]))
-                        self.data_to_plot[c,:] = f.readSignal(idxs[k]) # data[idxs[k],:]
+                        rows[c] = {idxs[k]: 1}
                         c += 1
                         idxs.pop(k)
                         k = len(idxs)
@@ -468,12 +560,237 @@ class ChannelInfo():
         if len(idxs) > 0:
             # shift data back
             for k in range(c):
-                self.data_to_plot[c - k + len(idxs) - 1,:] = self.data_to_plot[c - k - 1,:]
-                self.data_to_plot[c - k - 1,:] = np.zeros((1,self.data_to_plot.shape[1]))
+                rows[c - k + len(idxs) - 1] = rows[c - k - 1]
+                rows[c - k - 1] = {}
             c = len(idxs) - 1
             for k in range(len(idxs)):
                 self.labels_to_plot.insert(1,self.converted_chn_names[idxs[k]])
                 self.colors.insert(0, self._get_color(self.converted_chn_names[idxs[k]]))
-                self.data_to_plot[c,:] = f.readSignal(idxs[k]) # data[idxs[k],:]
+                rows[c] = {idxs[k]: 1}
                 c -= 1
+        if self.common_avg:
+            names = set(self.labelsAR1020) | set(self.labelsAR1010) | set(self.other_labels)
+            electrodes = {chn for chn, name in enumerate(self.converted_chn_names)
+                          if name in names}
+            rows = _common_average(rows, electrodes)
+        montage = _build_montage(rows)
+        with self._load_lock:
+            self.montage = montage
+            self._data_to_plot = None
+            self._resampled = None
+            self.pyramid = None
+            self._generation += 1
         self.fs = 2
+
+    def _get_bip_rows(self, labels):
+        """ Gets the montage rows for bipolar signals.
+
+            Args:
+                labels - the bipolar labels, ie "FP1-F7"
+            Returns:
+                a dict {chn: weight} for each label
+        """
+        chns = {}
+        for i, name in enumerate(self.converted_chn_names):
+            chns[name] = i # the last channel with a name is used
+        ret = []
+        for label in labels:
+            chn0 = chns[label.split('-')[0]]
+            chn1 = chns[label.split('-')[1]]
+            ret.append({chn0: 1, chn1: -1})
+        return ret
+
+    def _get_chn_fs(self, chn):
+        """ Gets the sample rate of a channel in the edf file.
+        """
+        if len(self.edf_info.chn_fs) == 0:
+            return self.edf_info.fs
+        return self.edf_info.chn_fs[chn]
+
+    def _read_at_fs(self, chns, start, n, fs, nworkers=1, progress=None):
+        """ Reads channels from the edf file at a given rate. Channels
+            slower than fs are held at each sample until the next one.
+
+            Args:
+                chns - the channels to read
+                start - the first sample to read, at fs
+                n - the number of samples to read, at fs
+                fs - the rate to read at, no faster than any of the channels
+                nworkers - the number of threads used to read channels
+                progress - function called with (number of channels read,
+                    number of channels to read) as channels are read
+            Returns:
+                array of size (len(chns), n) of type self.dtype
+        """
+        raw = np.zeros((len(chns), n), dtype=self.dtype)
+        if n <= 0:
+            return raw
+        rows_by_fs = {}
+        for i, chn in enumerate(chns):
+            rows_by_fs.setdefault(self._get_chn_fs(chn), []).append(i)
+        loader = EdfLoader()
+        nread = 0
+        for chn_fs, rows in rows_by_fs.items():
+            fs_chns = [chns[i] for i in rows]
+            fs_progress = _offset_progress(progress, nread, len(chns))
+            if chn_fs == fs:
+                raw[rows] = loader.read_window(self.edf_info, fs_chns, start, n,
+                                               nworkers, self.dtype, fs_progress)
+            else:
+                idxs = _get_hold_idxs(start, n, chn_fs, fs)
+                native = loader.read_window(self.edf_info, fs_chns, idxs[0],
+                                            idxs[-1] - idxs[0] + 1, nworkers, self.dtype,
+                                            fs_progress)
+                raw[rows] = native[:, idxs - idxs[0]]
+            nread += len(rows)
+        return raw
+
+    def _read_chns(self, start, n, nworkers=1, progress=None):
+        """ Reads the plotted channels from the edf file.
+
+            Args:
+                start - the first sample to read
+                n - the number of samples to read
+                nworkers - the number of threads used to read channels
+                progress - function called with (number of channels read,
+                    number of channels to read) as channels are read
+            Returns:
+                array of size (nchns_to_plot, n) of type self.dtype
+        """
+        # Read each channel in the file once, even if it is used by
+        # several signals, then apply the montage in one multiply
+        chns = np.unique(self.montage.indices)
+        raw = self._read_at_fs(chns.tolist(), start, n, self.edf_info.fs, nworkers, progress)
+        return np.asarray(self.montage[:, chns].astype(self.dtype) @ raw)
+
+    def _load_chns(self, nworkers=1, progress=None):
+        """ Reads the whole signal of the plotted channels. Each signal is
+            kept at the fastest rate of the channels it is made from.
+
+            Args:
+                nworkers - the number of threads used to read channels
+                progress - function called with (number of channels read,
+                    number of channels to read) as channels are read
+            Returns:
+                array of size (nchns_to_plot, nsamples) if all signals are at
+                the plotted fs, otherwise a list of the signals
+        """
+        fs = self.edf_info.fs
+        self.row_fs = []
+        for i in range(self.montage.shape[0]):
+            row_chns = self.montage[i].indices
+            if len(row_chns) == 0:
+                self.row_fs.append(fs)
+            else:
+                self.row_fs.append(max(self._get_chn_fs(chn) for chn in row_chns))
+        if all(row_fs == fs for row_fs in self.row_fs):
+            return self._read_chns(0, self.nsamples, nworkers, progress)
+
+        bufs = [None] * len(self.row_fs)
+        groups = []
+        for row_fs in set(self.row_fs):
+            rows = [i for i in range(len(self.row_fs)) if self.row_fs[i] == row_fs]
+            groups.append((row_fs, rows, np.unique(self.montage[rows].indices)))
+        total = sum(len(chns) for _, _, chns in groups)
+        nread = 0
+        for row_fs, rows, chns in groups:
+            montage = self.montage[rows]
+            raw = self._read_at_fs(chns.tolist(), 0, int(self.nsamples * row_fs // fs),
+                                   row_fs, nworkers, _offset_progress(progress, nread, total))
+            nread += len(chns)
+            sigs = np.asarray(montage[:, chns].astype(self.dtype) @ raw)
+            for k, i in enumerate(rows):
+                bufs[i] = sigs[k]
+        return bufs
+
+    def get_window(self, start, n):
+        """ Gets a window of the plotted channels. Only the samples in
+            the window are read unless the whole signal is already loaded.
+
+            Args:
+                start - the first sample of the window
+                n - the number of samples in the window
+            Returns:
+                array of size (nchns_to_plot, n) at the plotted fs
+        """
+        # other threads can replace the signals while the window is read
+        bufs = self._data_to_plot
+        row_fs = self.row_fs
+        if bufs is None:
+            return self._read_chns(start, n)
+        if isinstance(bufs, np.ndarray):
+            data = np.zeros((bufs.shape[0], n), dtype=bufs.dtype)
+            window = bufs[:, start:start + n]
+            data[:, :window.shape[1]] = window
+            return data
+        data = np.zeros((len(bufs), n), dtype=self.dtype)
+        for i, buf in enumerate(bufs):
+            idxs = _get_hold_idxs(start, n, row_fs[i], self.edf_info.fs)
+            idxs = idxs[idxs < len(buf)]
+            data[i, :len(idxs)] = buf[idxs]
+        return data
+
+    def build_pyramid(self):
+        """ Computes the min and max of the plotted signals over groups of
+            pyramid_group, 2 * pyramid_group, ... samples so that long
+            windows can be drawn without reading every sample. The signals
+            are read a block at a time, and it is usually run in a
+            background thread. The pyramid is dropped if the plotted
+            signals change while it is built.
+        """
+        with self._load_lock:
+            if self.pyramid is not None:
+                return
+            generation = self._generation
+            nsamples = self.nsamples
+        pyramid = build_min_max_pyramid_blocks(
+            self.get_window, nsamples, self.pyramid_group,
+            stop=lambda: generation != self._generation)
+        with self._load_lock:
+            if pyramid is not None and generation == self._generation:
+                self.pyramid = pyramid
+
+    def get_pyramid_window(self, start, n, npoints):
+        """ Gets the points to draw for a window from the pyramid. The
+            pyramid is only built, in a background thread, the first time a
+            window long enough to be drawn from it is asked for.
+
+            Args:
+                start - the first sample of the window
+                n - the number of samples in the window
+                npoints - about how many points to draw for each signal
+            Returns:
+                x, y as from decimate_min_max, or None if the pyramid is
+                not built yet or the window is too short to use it
+        """
+        if n < (npoints // 2) * self.pyramid_group:
+            return None
+        pyramid = self.pyramid
+        if pyramid is None:
+            with self._load_lock:
+                start_build = self._pyramid_generation != self._generation
+                self._pyramid_generation = self._generation
+            if start_build:
+                threading.Thread(target=self.build_pyramid, daemon=True).start()
+            return None
+        return get_pyramid_window(pyramid, start, n, npoints, self.pyramid_group)
+
+    def reorder_chns(self, order):
+        """ Reorders the plotted channels.
+
+            Args:
+                order - list where order[i] is the old row of new row i
+        """
+        with self._load_lock:
+            self.montage = self.montage[order]
+            if isinstance(self._data_to_plot, np.ndarray):
+                self._data_to_plot = self._data_to_plot[order, :]
+            elif self._data_to_plot is not None:
+                self._data_to_plot = [self._data_to_plot[i] for i in order]
+                self.row_fs = [self.row_fs[i] for i in order]
+            if self._resampled is not None:
+                self._resampled = self._resampled[order, :]
+            if self.pyramid is not None:
+                self.pyramid = [(mins[order, :], maxs[order, :])
+                                for mins, maxs in self.pyramid]
+            self._generation += 1
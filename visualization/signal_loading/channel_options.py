@@ -10,6 +10,7 @@ import numpy as np
 import pyedflib
 from predictions.prediction_info import PredictionInfo
 from signal_loading.channel_info import convert_txt_chn_names
+from preprocessing.edf_loader import pyedflib_lock
 from signal_loading.organize_channels import OrganizeChannels
 from signal_loading.color_options import ColorOptions
 
@@ -92,6 +93,10 @@ class ChannelOptions(QWidget):
             self.cbox_ar1010.toggled.connect(self.ar_checked1010)
             grid_lt.addWidget(self.cbox_ar1010,3,0)
 
+        self.cbox_common_avg = QCheckBox("Common average reference",self)
+        self.cbox_common_avg.setChecked(self.data.common_avg)
+        grid_lt.addWidget(self.cbox_common_avg,4,0)
+
         self.chn_cbox_list = QWidget()
         self.scroll_chn_cbox.setWidget(self.chn_cbox_list)
         self.chn_cbox_layout = QVBoxLayout()
@@ -152,7 +157,18 @@ class ChannelOptions(QWidget):
         chns = self.data.chns2labels
         lbls = self.data.labels2chns
         self.data.pred_chn_data = []
-        edf_reader_obj = pyedflib.EdfReader(self.data.edf_fn)
+        # pyedflib can only open the file once, so the prediction channels
+        # are read first and the file is closed again right away
+        pred_sigs = {}
+        if self.new_load:
+            with pyedflib_lock:
+                edf_reader_obj = pyedflib.EdfReader(self.data.edf_fn)
+                try:
+                    for i in range(len(chns)):
+                        if chns[i].find("PREDICTIONS") != -1:
+                            pred_sigs[i] = edf_reader_obj.readSignal(i)
+                finally:
+                    edf_reader_obj.close()
         # if len(self.unprocessed_data) > 0: # reset predicted
         #    self.parent.predicted = 0
         if len(chns) == 0:
@@ -170,7 +186,7 @@ class ChannelOptions(QWidget):
                 # means that there are a reasonable amount of channels
                 elif self.new_load:
                     # self.data.pred_chn_data.append(self.unprocessed_data[i])
-                    self.data.pred_chn_data.append(edf_reader_obj.readSignal(i))
+                    self.data.pred_chn_data.append(pred_sigs[i])
                     lbls.pop(chns[i])
                     chns.pop(i)
 
@@ -471,7 +487,8 @@ class ChannelOptions(QWidget):
             #self.ar1010 and self.cbox_bip1010.isChecked()):
             plot_bip_from_ar = 1
         mont_type, txt_file_name = self._get_mont_type()
-        self.data.prepare_to_plot(idxs, self.parent, mont_type, plot_bip_from_ar, txt_file_name)
+        self.data.prepare_to_plot(idxs, self.parent, mont_type, plot_bip_from_ar, txt_file_name,
+                                  int(self.cbox_common_avg.isChecked()))
         # check if multi-chn pred and number of chns match
         self.check_multi_chn_preds()
         return 0
@@ -4,8 +4,6 @@ from PyQt5.QtWidgets import (QWidget, QListWidget, QPushButton, QLabel,
                                 QGridLayout, QScrollArea, QListWidgetItem,
                                 QAbstractItemView)
 
-import numpy as np
-
 from matplotlib.backends.qt_compat import QtWidgets
 
 
@@ -89,22 +87,21 @@ class OrganizeChannels(QWidget):
         """
         temp_labels = ["Notes"]
         temp_colors = []
-        temp_data = np.zeros(self.data.data_to_plot.shape)
+        temp_order = []
         for i in range(len(self.data.colors)):
             temp_labels.append(self.data.labels_to_plot[i + 1])
             temp_colors.append(self.data.colors[i])
-            temp_data[i, :] += self.data.data_to_plot[i, :]
+            temp_order.append(i)
 
         for k in range(len(self.chn_items)):
             row = self.chn_qlist.row(self.chn_items[k])
             temp_labels[len(self.chn_items) - row] = self.chn_items[k].text()
             temp_colors[len(self.chn_items) - row - 1] = self.data.colors[
                                                 len(self.chn_items) - k - 1]
-            temp_data[len(self.chn_items) - row - 1,:] = self.data.data_to_plot[
-                                                    len(self.chn_items) - k - 1,:]
+            temp_order[len(self.chn_items) - row - 1] = len(self.chn_items) - k - 1
         self.data.labels_to_plot = temp_labels
         self.data.colors = temp_colors
-        self.data.data_to_plot = temp_data
+        self.data.reorder_chns(temp_order)
         self.parent.call_initial_move_plot()
         self.close_window()
 
@@ -0,0 +1,116 @@
+""" Module for computing the windows around the plotted one in the background """
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import threading
+
+class WindowPrefetcher():
+    """ Keeps recently plotted windows of the signals in a small LRU cache.
+
+        The windows before and after the plotted one are computed by a
+        background thread, so that paging through a recording mostly uses
+        windows that are already computed. Windows are keyed by
+        (count, window_size, filter settings) and the cache is emptied
+        when the montage changes.
+    """
+
+    def __init__(self, nwindows=2, size=16, max_bytes=2 ** 28):
+        """ Constructor for the window prefetcher.
+
+            Args:
+                nwindows - how many windows to compute on each side of the
+                    plotted one
+                size - the most windows to keep
+                max_bytes - the most memory to use for the kept windows
+        """
+        self.nwindows = nwindows
+        self.size = size
+        self.max_bytes = max_bytes
+        self.windows = OrderedDict() # key -> window, least recently used first
+        self.nbytes = 0
+        self.pending = set() # keys being computed in the background
+        self.montage = None # the montage the windows are for
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=1)
+
+    def _check_montage(self, ci):
+        """ Empties the cache if the montage has changed, the lock must
+            be held.
+        """
+        if ci.montage is not self.montage:
+            self.montage = ci.montage
+            self.windows.clear()
+            self.nbytes = 0
+            self.pending.clear()
+
+    def get_window(self, ci, key):
+        """ Gets a window from the cache.
+
+            Args:
+                ci - the ChannelInfo of the plotted signals
+                key - the key of the window
+            Returns:
+                the window, or None if it is not in the cache
+        """
+        with self.lock:
+            self._check_montage(ci)
+            window = self.windows.get(key)
+            if window is not None:
+                self.windows.move_to_end(key)
+            return window
+
+    def put_window(self, ci, key, window, montage=None):
+        """ Adds a window to the cache, removing the least recently used
+            windows if it is full.
+
+            Args:
+                ci - the ChannelInfo of the plotted signals
+                key - the key of the window
+                window - the window, it must not be changed afterwards
+                montage - the montage the window was computed for, defaults
+                    to the current montage
+        """
+        if montage is None:
+            montage = ci.montage
+        with self.lock:
+            self._check_montage(ci)
+            if montage is not self.montage or key in self.windows:
+                return
+            self.windows[key] = window
+            self.nbytes += window.nbytes
+            while len(self.windows) > 1 and (len(self.windows) > self.size
+                                             or self.nbytes > self.max_bytes):
+                _, old = self.windows.popitem(last=False)
+                self.nbytes -= old.nbytes
+
+    def prefetch(self, ci, keys, compute, window_bytes=0):
+        """ Starts computing the windows that are not cached yet in the
+            background. Nothing is computed if the windows and the plotted
+            one do not all fit in max_bytes, as they would only evict each
+            other.
+
+            Args:
+                ci - the ChannelInfo of the plotted signals
+                keys - the keys of the windows, the first are computed first
+                compute - function that computes the window for a key
+                window_bytes - the size of each window in bytes
+        """
+        if (len(keys) + 1) * window_bytes > self.max_bytes:
+            return
+        with self.lock:
+            self._check_montage(ci)
+            keys = [key for key in keys
+                    if key not in self.windows and key not in self.pending]
+            self.pending.update(keys)
+            montage = self.montage
+        for key in keys:
+            self.executor.submit(self._compute, ci, key, compute, montage)
+
+    def _compute(self, ci, key, compute, montage):
+        """ Computes a window, run by the background thread.
+        """
+        try:
+            if montage is ci.montage: # otherwise the window is not needed
+                self.put_window(ci, key, compute(key), montage)
+        finally:
+            with self.lock:
+                self.pending.discard(key)
@@ -0,0 +1,129 @@
+""" Module for looking up statistics of any part of a signal """
+import numpy as np
+
+class SignalStatsIndex():
+    """ Holds prefix sums of the plotted signals for computing the mean,
+        variance and line length of any interval.
+
+        Sums of the signal, its square and its squared differences are
+        kept at the end of each block of samples, so a query only reads
+        and adds up the partial blocks at its ends. The sums are built once
+        for each channel and cleared when the signals or filter settings
+        change. The signal is shifted by the mean of its start before
+        squaring so that the variance does not lose precision on signals
+        with an offset.
+    """
+
+    def __init__(self, block_size=256, chunk_blocks=4096):
+        """ Constructor for the stats index.
+
+            Args:
+                block_size - the number of samples in each block
+                chunk_blocks - the number of blocks summed at a time while
+                    building, which bounds the memory used
+        """
+        self.block_size = block_size
+        self.chunk_blocks = chunk_blocks
+        self.key = None # what the sums were computed from
+        self.chns = {} # chn -> (nsamples, shift, sums, sums of squares, sums of diffs)
+
+    def _is_key(self, key):
+        """ Whether key is the key of the index, compared by identity as
+            the montage and filter bank are not comparable.
+        """
+        return (self.key is not None and len(key) == len(self.key)
+                and all(k is kk for k, kk in zip(key, self.key)))
+
+    def _block_sums(self, sig, shift):
+        """ Computes the prefix sums at the end of each block.
+
+            Returns:
+                sums, sums of squares and sums of squared differences,
+                each of size nblocks + 1
+        """
+        b = self.block_size
+        n = len(sig)
+        nblocks = n // b
+        nblocks_diff = (n - 1) // b if n > 0 else 0
+        sums = np.zeros(nblocks + 1)
+        sums_sq = np.zeros(nblocks + 1)
+        sums_diff = np.zeros(nblocks_diff + 1)
+        for c in range(0, max(nblocks, nblocks_diff), self.chunk_blocks):
+            c_end = min(c + self.chunk_blocks, nblocks)
+            # one extra sample for the difference at the end of the chunk
+            x = np.asarray(sig[c * b:c_end * b + 1], dtype=np.float64) - shift
+            if c_end > c:
+                blocks = x[:(c_end - c) * b].reshape(-1, b)
+                sums[c + 1:c_end + 1] = blocks.sum(axis=1)
+                sums_sq[c + 1:c_end + 1] = (blocks ** 2).sum(axis=1)
+            c_end = min(c + self.chunk_blocks, nblocks_diff)
+            if c_end > c:
+                diffs = np.diff(x)[:(c_end - c) * b].reshape(-1, b)
+                sums_diff[c + 1:c_end + 1] = (diffs ** 2).sum(axis=1)
+        return np.cumsum(sums), np.cumsum(sums_sq), np.cumsum(sums_diff)
+
+    def _range_sum(self, prefix, values, s, f):
+        """ Sums values[s:f] using the block prefix sums.
+
+            Args:
+                prefix - the block prefix sums of the values
+                values - function giving the values for a range of samples
+                s - the first sample
+                f - the sample after the last
+        """
+        b = self.block_size
+        first = -(-s // b) # first whole block
+        last = min(f // b, len(prefix) - 1) # block after the last whole block
+        if first >= last:
+            return values(s, f).sum()
+        return (prefix[last] - prefix[first] + values(s, first * b).sum()
+                + values(last * b, f).sum())
+
+    def get_stats(self, chn, key, s, f, read_window, read_signal):
+        """ Gets the mean, variance and line length of part of a signal.
+
+            Args:
+                chn - the channel, used to keep its sums
+                key - tuple of what the signals depend on, the sums are
+                    rebuilt when it changes
+                s - start time in samples
+                f - end time in samples
+                read_window - function giving samples a to b of the signal,
+                    called as read_window(a, b)
+                read_signal - function giving the whole signal, only called
+                    when the sums of the channel are built
+            Returns:
+                mean, var, line length
+        """
+        if not self._is_key(key):
+            self.key = key
+            self.chns = {}
+        if chn not in self.chns:
+            sig = read_signal()
+            start = np.asarray(sig[:self.block_size], dtype=np.float64)
+            shift = float(np.mean(start)) if len(start) > 0 else 0.0
+            self.chns[chn] = (len(sig), shift) + self._block_sums(sig, shift)
+        nsamples, shift, sums, sums_sq, sums_diff = self.chns[chn]
+
+        s = max(int(s), 0)
+        f = min(int(f), nsamples)
+        n = f - s
+        if n <= 0:
+            return np.nan, np.nan, np.nan
+
+        def shifted(a, b):
+            return np.asarray(read_window(a, b), dtype=np.float64) - shift
+        def squared(a, b):
+            return shifted(a, b) ** 2
+        def diffs(a, b):
+            if b <= a:
+                return np.zeros(0)
+            return np.diff(np.asarray(read_window(a, b + 1), dtype=np.float64)) ** 2
+
+        total = self._range_sum(sums, shifted, s, f)
+        total_sq = self._range_sum(sums_sq, squared, s, f)
+        total_diff = self._range_sum(sums_diff, diffs, s, f - 1) if n > 1 else 0
+        mean = total / n
+        var = max(total_sq / n - mean ** 2, 0.0)
+        line_len = np.sqrt(total_diff + n - 1)
+        return mean + shift, var, line_len
@@ -1,6 +1,10 @@
 """ Module to compute power statistics for the signals """
-from copy import deepcopy
 import numpy as np
+import scipy.signal
+
+# shown for the band powers in the stats panel
+POWER_TOOLTIP = ("Band power, the Welch power spectral density integrated over\n"
+                 "the frequencies of the band, in the units of the signal squared")
 
 class SignalStatsInfo():
     """ Class to hold relevant information for computing statistics
@@ -10,6 +14,8 @@ class SignalStatsInfo():
             fs_bands - holds dict of bands, can be expanded
             chn - the channel that we are getting power for
             chn_items - channel info in the stats window in parent
+            seg_len - the length in seconds of the Welch segments
+            chunk_segs - the number of segments transformed at a time
         """
         self.chn = 0
         self.chn_items = []
@@ -18,20 +24,18 @@ class SignalStatsInfo():
                          'alpha':(8,14),
                          'beta':(14,30),
                          'gamma': (30,45)}
+        self.seg_len = 2
+        self.chunk_segs = 4096
 
-    def _get_power_for_band(self, sig, s, f, band, l, h, fs):
-        """ Returns the power in the given fs band.
+    def _get_band_limits(self, band, l, h):
+        """ Returns the frequencies of a band that pass the filter.
 
         Args:
-            sig: the signal to use
-            s: where to start in samples
-            f: where to end in samples
-            band: which type of band ('delta','theta','alpha','beta','gamma')
+            band: which band, a key of fs_bands
             l: low pass fs of filter
             h: high pass fs of filter
-            fs: the fs of the signal
         Returns:
-            The power of the signal
+            (low, high) in Hz, or None if the filter removes the band
         """
         lp = self.fs_bands[band][0]
         hp = self.fs_bands[band][1]
@@ -39,37 +43,55 @@ class SignalStatsInfo():
             if lp < h < hp:
                 hp = h
             elif h < hp:
-                return 0
+                return None
         elif h == 0 and l != 0:
             if lp < l < hp:
                 lp = l
             elif l > lp:
-                return 0
+                return None
         elif l != 0 and h != 0:
             if lp < h < hp:
                 hp = h
             elif h < hp:
-                return 0
+                return None
             if lp < l < hp:
                 lp = l
             elif l > lp:
-                return 0
-        filt_bufs = deepcopy(sig[s:f])
-
-        # Get real amplitudes of FFT (only in postive frequencies)
-        fft_vals = np.absolute(np.fft.rfft(filt_bufs))
+                return None
+        return lp, hp
 
-        # Get frequencies for amplitudes in Hz
-        fft_freq = np.fft.rfftfreq(len(filt_bufs), 1.0 / fs)
-        # for band in eeg_bands:
-        freq_ix = np.where((fft_freq >= lp) &
-                    (fft_freq <= hp))[0]
-        eeg_band_fft = np.mean(fft_vals[freq_ix] ** 2)
+    def get_psd(self, sig, s, f, fs):
+        """ Returns the Welch power spectral density of part of a signal.
+            Segments overlap by half and are transformed chunk_segs at a
+            time, so long selections do not need memory for all of them.
 
-        return eeg_band_fft
+        Args:
+            sig: the signal
+            s: where to start in samples
+            f: where to end in samples
+            fs: the fs of the signal
+        Returns:
+            freqs - the frequencies in Hz
+            psd - the power spectral density at freqs
+        """
+        x = sig[max(int(s), 0):int(f)]
+        if len(x) == 0:
+            return np.zeros(0), np.zeros(0)
+        nperseg = max(min(len(x), int(self.seg_len * fs)), 1)
+        step = max(nperseg // 2, 1)
+        noverlap = nperseg - step
+        nsegs = max((len(x) - nperseg) // step + 1, 1)
+        psd = 0
+        for c in range(0, nsegs, self.chunk_segs):
+            k = min(self.chunk_segs, nsegs - c)
+            part = np.asarray(x[c * step:(c + k - 1) * step + nperseg], dtype=np.float64)
+            freqs, part_psd = scipy.signal.welch(part, fs, nperseg=nperseg,
+                                                 noverlap=noverlap)
+            psd = psd + part_psd * k
+        return freqs, psd / nsegs
 
     def get_power(self, sig, s, f, lp, hp, fs):
-        """ Returns power for all bands.
+        """ Returns power for all bands from one power spectral density.
 
         Args:
             sig: the signal
@@ -79,11 +101,17 @@ class SignalStatsInfo():
             hp: high pass fs of filter
             fs: the fs of the signal
         Returns:
-            alpha, beta, theta, gamma, delta
+            dict of the power in each band of fs_bands
         """
-        bands =  self.fs_bands.keys()
+        freqs, psd = self.get_psd(sig, s, f, fs)
+        df = freqs[1] - freqs[0] if len(freqs) > 1 else 0
         ret = {}
-        for b in bands:
-            ret[b] = self._get_power_for_band(sig, s, f, b, lp, hp, fs)
+        for b in self.fs_bands.keys():
+            limits = self._get_band_limits(b, lp, hp)
+            if limits is None:
+                ret[b] = 0
+                continue
+            freq_ix = (freqs >= limits[0]) & (freqs <= limits[1])
+            ret[b] = np.sum(psd[freq_ix]) * df
 
         return ret
@@ -4,6 +4,7 @@ from PyQt5.QtWidgets import (QWidget, QPushButton, QLabel, QGridLayout,
                                 QLineEdit, QDoubleSpinBox,)
 
 from matplotlib.backends.qt_compat import QtWidgets
+from signal_stats.signalStats_info import POWER_TOOLTIP
 
 class SignalStatsOptions(QWidget):
     """ Class for the stat fs band options channel """
@@ -36,7 +37,7 @@ class SignalStatsOptions(QWidget):
 
         grid_lt = QGridLayout()
 
-        lbl_info = QLabel("Add a frequency band with a name. You may add up to 5.")
+        lbl_info = QLabel("Add a frequency band with a name.")
         grid_lt.addWidget(lbl_info, 0, 0, 1, 5)
 
         lbl_name = QLabel("Name: ")
@@ -63,6 +64,17 @@ class SignalStatsOptions(QWidget):
         self.grid_list = QGridLayout()
         grid_lt.addLayout(self.grid_list, 2, 0, 1, 7)
 
+        lbl_seg_len = QLabel("Welch segment length: ")
+        grid_lt.addWidget(lbl_seg_len, 3, 0, 1, 2)
+        self.input_seg_len = QDoubleSpinBox(self)
+        self.input_seg_len.setRange(0.1, 60)
+        self.input_seg_len.setValue(self.data.seg_len)
+        self.input_seg_len.setToolTip("Longer segments give finer frequency "
+                                      "resolution but a noisier estimate")
+        grid_lt.addWidget(self.input_seg_len, 3, 2, 1, 2)
+        lbl_s = QLabel("s")
+        grid_lt.addWidget(lbl_s, 3, 4)
+
         prev_fs = ["alpha", "beta", "gamma", "delta", "theta"]
         for fs_band in self.data.fs_bands.keys():
             if not fs_band in prev_fs:
@@ -72,7 +84,7 @@ class SignalStatsOptions(QWidget):
                 self.grid_list.addWidget(self.fs_band_lbls[fs_band])
 
         self.btn_exit = QPushButton('Ok', self)
-        grid_lt.addWidget(self.btn_exit,3,5, 1, 2)
+        grid_lt.addWidget(self.btn_exit,4,5, 1, 2)
         self.setLayout(grid_lt)
 
         self.set_signals_slots()
@@ -88,23 +100,20 @@ class SignalStatsOptions(QWidget):
     def add_fs_band(self):
         """ Add a new fs band.
         """
-        if self.fs_band_count < 5:
-            if self._check_valid():
-                # if valid, create new labels below
-                self.fs_band_lbls[self.input_name.text()] = QLabel(
-                    self.input_name.text() + ": " + str(self.input_fs0.value()) + " to "
-                    + str(self.input_fs1.value()) + "Hz")
-                self.grid_list.addWidget(self.fs_band_lbls[self.input_name.text()])
-                # add to fs_bands
-                self.data.fs_bands[self.input_name.text()] = (self.input_fs0.value(),
-                                                              self.input_fs1.value())
-                # reset fields
-                self.input_name.setText("")
-                self.input_fs0.setValue(0)
-                self.input_fs1.setValue(0)
-                self.fs_band_count += 1
-        else:
-            self.parent.throw_alert("You have up to 5 additional frequency ranges.")
+        if self._check_valid():
+            # if valid, create new labels below
+            self.fs_band_lbls[self.input_name.text()] = QLabel(
+                self.input_name.text() + ": " + str(self.input_fs0.value()) + " to "
+                + str(self.input_fs1.value()) + "Hz")
+            self.grid_list.addWidget(self.fs_band_lbls[self.input_name.text()])
+            # add to fs_bands
+            self.data.fs_bands[self.input_name.text()] = (self.input_fs0.value(),
+                                                          self.input_fs1.value())
+            # reset fields
+            self.input_name.setText("")
+            self.input_fs0.setValue(0)
+            self.input_fs1.setValue(0)
+            self.fs_band_count += 1
 
     def _check_valid(self):
         """ Check that the current input is valid. 
@@ -129,6 +138,7 @@ class SignalStatsOptions(QWidget):
     def check(self):
         """ Function to get colors and exit.
         """
+        self.data.seg_len = self.input_seg_len.value()
         # add all new bands as labels
         ud = 5 + len(self.data.fs_bands.keys())
         curr = 0
@@ -136,13 +146,16 @@ class SignalStatsOptions(QWidget):
             if not fs_band in self.parent.fs_band_lbls.keys():
                 lbl = QtWidgets.QLabel()
                 lbl.setText(fs_band + ":")
+                lbl.setToolTip(POWER_TOOLTIP)
                 self.parent.grid_layout.addWidget(lbl, ud + curr, 1, 1, 1)
                 self.parent.fs_band_lbls[fs_band] = QtWidgets.QLabel()
                 self.parent.fs_band_lbls[fs_band].setText("")
+                self.parent.fs_band_lbls[fs_band].setToolTip(POWER_TOOLTIP)
                 self.parent.grid_layout.addWidget(self.parent.fs_band_lbls[fs_band],
                                                     ud + curr, 2, 1, 1)
                 self.parent.fs_band_sel_lbls[fs_band] = QtWidgets.QLabel()
                 self.parent.fs_band_sel_lbls[fs_band].setText("")
+                self.parent.fs_band_sel_lbls[fs_band].setToolTip(POWER_TOOLTIP)
                 self.parent.grid_layout.addWidget(self.parent.fs_band_sel_lbls[fs_band],
                                                     ud + curr, 3, 1, 1)
                 curr += 1
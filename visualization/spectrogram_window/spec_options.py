@@ -102,12 +102,14 @@ class SpecOptions(QWidget):
             nchns = self.parent.ci.nchns_to_plot
             self.data.chn_plotted = nchns - row
             self.data.chn_name = self.labels_flipped[len(self.labels_flipped) - row]
+            self.parent.load_signals()
             self.data.data = self.parent.ci.data_to_plot[self.data.chn_plotted,:]
             fs = self.parent.edf_info.fs
             if self.parent.filter_checked == 1:
-                self.data.data = np.squeeze(filter_data(np.array(self.data.data)[np.newaxis,:],
-                                                                fs, self.parent.fi,
-                                                                self.parent.argv.show))
+                filt_data = filter_data(np.array(self.data.data)[np.newaxis,:],
+                                        fs, self.parent.fi, self.parent.argv.show)
+                if filt_data is not None: # otherwise keep the unfiltered data
+                    self.data.data = np.squeeze(filt_data)
             if not self.data.plot_spec:
                 self.data.plot_spec = 1
                 self.parent.make_spec_plot()